@@ -96,3 +96,12 @@ export const _delete = <T>(uri: string): Promise<AxiosResponse<T>> => {
     uri = cleanURI(uri);
     return axios.delete(`${SERVER_URL}/${uri}`, makeConfig());
 };
+
+export const openEventStream = (uri: string): EventSource | null => {
+    // Not available in jsdom, which the tests run in
+    if (typeof EventSource === "undefined") {
+        return null;
+    }
+    uri = cleanURI(uri);
+    return new EventSource(`${SERVER_URL}/${uri}`, { withCredentials: true });
+};
@@ -1,4 +1,6 @@
+import hardwareImagePlaceholder from "assets/images/placeholders/no-hardware-image.svg";
 import {
+    Hardware,
     Order,
     OrderInTable,
     OrderItemTableRow,
@@ -18,6 +20,19 @@ export const formatDateTime = (dateTimeString: string): string => {
     };
     return dateTime.toLocaleString("en-US", options);
 };
+/** The smallest image of a hardware that fits the size it is shown at */
+export const getHardwareImage = (
+    hardware: Hardware | undefined,
+    size: "thumbnail" | "medium" = "thumbnail"
+): string => {
+    const derivatives = hardware?.picture_derivatives;
+    const resized =
+        size === "medium" ? derivatives?.medium_webp : derivatives?.thumbnail_webp;
+    return (
+        resized ?? hardware?.picture ?? hardware?.image_url ?? hardwareImagePlaceholder
+    );
+};
+
 export const teamOrderListSerialization = (
     orders: Order[]
 ): {
@@ -7,6 +7,14 @@ export interface APIListResponse<T> {
 }
 
 /** Hardware API */
+/** Resized copies of a hardware's picture, rendered by the backend */
+export interface HardwarePictureDerivatives {
+    thumbnail: string;
+    thumbnail_webp: string;
+    medium: string;
+    medium_webp: string;
+}
+
 export interface Hardware {
     id: number;
     name: string;
@@ -16,12 +24,21 @@ export interface Hardware {
     quantity_available: number;
     max_per_team?: number;
     picture?: string;
+    picture_derivatives?: HardwarePictureDerivatives | null;
     image_url?: string;
     categories: number[];
     quantity_remaining: number;
     notes?: string;
 }
 
+export type HardwareStock = Pick<Hardware, "id" | "quantity_remaining">;
+
+/** Pushed by the server whenever the stock of some hardware changes */
+export interface StockEvent {
+    version: number;
+    hardware: HardwareStock[];
+}
+
 export type HardwareOrdering =
     | ""
     | "name"
@@ -43,6 +60,8 @@ export interface Category {
     name: string;
     max_per_team?: number;
     unique_hardware_count?: number;
+    total_quantity_available?: number;
+    total_quantity_remaining?: number;
 }
 
 /** Event API */
@@ -15,9 +15,9 @@ import CloseIcon from "@material-ui/icons/Close";
 import { useDispatch, useSelector } from "react-redux";
 import { RootState } from "slices/store";
 import { hardwareSelectors } from "slices/hardware/hardwareSlice";
-import { removeFromCart, updateCart } from "slices/hardware/cartSlice";
+import { holdCart, removeFromCart, updateCart } from "slices/hardware/cartSlice";
 import { selectCategoriesByIds } from "slices/hardware/categorySlice";
-import hardwareImagePlaceholder from "assets/images/placeholders/no-hardware-image.svg";
+import { getHardwareImage } from "api/helpers";
 
 const makeSelections = (quantity_remaining: number) => {
     const items = [];
@@ -119,10 +119,12 @@ export const CartCard = ({ hardware_id, quantity, error }: CartCardProps) => {
                 changes: { quantity: parseInt(event.target.value) },
             })
         );
+        dispatch(holdCart());
     };
 
     const handleRemove = (id: number) => {
         dispatch(removeFromCart(id));
+        dispatch(holdCart());
     };
 
     return hardware ? (
@@ -133,9 +135,7 @@ export const CartCard = ({ hardware_id, quantity, error }: CartCardProps) => {
         >
             <CardMedia
                 className={styles.CartPic}
-                image={
-                    hardware.picture ?? hardware.image_url ?? hardwareImagePlaceholder
-                }
+                image={getHardwareImage(hardware)}
                 alt={hardware.name}
                 component="img"
             />
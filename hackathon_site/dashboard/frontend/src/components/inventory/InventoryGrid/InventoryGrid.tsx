@@ -9,7 +9,7 @@ import {
     isLoadingSelector,
 } from "slices/hardware/hardwareSlice";
 import { LinearProgress } from "@material-ui/core";
-import hardwareImagePlaceholder from "assets/images/placeholders/no-hardware-image.svg";
+import { getHardwareImage } from "api/helpers";
 import { openProductOverview } from "slices/ui/uiSlice";
 
 export const InventoryGrid = () => {
@@ -43,11 +43,7 @@ export const InventoryGrid = () => {
                         onClick={() => openProductOverviewPanel(item.id)}
                     >
                         <Item
-                            image={
-                                item.picture ??
-                                item.image_url ??
-                                hardwareImagePlaceholder
-                            }
+                            image={getHardwareImage(item)}
                             title={item.name}
                             total={item.quantity_available}
                             currentStock={item.quantity_remaining}
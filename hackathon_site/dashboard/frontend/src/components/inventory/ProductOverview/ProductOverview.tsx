@@ -22,14 +22,14 @@ import {
 import { useDispatch, useSelector } from "react-redux";
 import { selectCategoriesByIds } from "slices/hardware/categorySlice";
 import { RootState } from "slices/store";
-import { addToCart, cartSelectors } from "slices/hardware/cartSlice";
+import { addToCart, cartSelectors, holdCart } from "slices/hardware/cartSlice";
 import {
     hardwareInProductOverviewSelector,
     isUpdateDetailsLoading,
     removeProductOverviewItem,
 } from "slices/hardware/hardwareSlice";
 import { Category } from "api/types";
-import hardwareImagePlaceholder from "assets/images/placeholders/no-hardware-image.svg";
+import { getHardwareImage } from "api/helpers";
 import { hardwareSignOutEndDate, hardwareSignOutStartDate } from "constants.js";
 import { Tooltip } from "@material-ui/core";
 import { userTypeSelector, isTestUserSelector } from "slices/users/userSlice";
@@ -143,6 +143,7 @@ export const EnhancedAddToCartForm = ({
         const numQuantity: number = parseInt(formikValues.quantity);
         if (currentQuantityInCart + numQuantity <= (maxPerTeam ?? quantityRemaining)) {
             dispatch(addToCart({ hardware_id: hardwareId, quantity: numQuantity }));
+            dispatch(holdCart());
             dispatch(
                 displaySnackbar({
                     message: `Added ${numQuantity} ${name} item(s) to your cart.`,
@@ -393,11 +394,7 @@ export const ProductOverview = ({
                             quantityAvailable={hardware.quantity_available}
                             quantityRemaining={hardware.quantity_remaining}
                             categories={categoryNames}
-                            picture={
-                                hardware.picture ??
-                                hardware.image_url ??
-                                hardwareImagePlaceholder
-                            }
+                            picture={getHardwareImage(hardware, "medium")}
                         />
                         <DetailInfoSection
                             manufacturer={hardware.manufacturer}
@@ -26,11 +26,14 @@ import {
     hardwareSelectors,
     isMoreLoadingSelector,
     isLoadingSelector,
+    updateQuantitiesRemaining,
 } from "slices/hardware/hardwareSlice";
 import { getCategories } from "slices/hardware/categorySlice";
 import { Grid } from "@material-ui/core";
 import { userTypeSelector } from "slices/users/userSlice";
 import DateRestrictionAlert from "components/general/DateRestrictionAlert/DateRestrictionAlert";
+import { openEventStream } from "api/api";
+import { StockEvent } from "api/types";
 
 const Inventory = () => {
     const dispatch = useDispatch();
@@ -60,6 +63,16 @@ const Inventory = () => {
         dispatch(getCategories());
     }, [dispatch]);
 
+    // Keep the stock shown up to date as orders are placed, without refreshing
+    useEffect(() => {
+        const events = openEventStream("/api/hardware/events/");
+        events?.addEventListener("stock", (event) => {
+            const { hardware }: StockEvent = JSON.parse((event as MessageEvent).data);
+            dispatch(updateQuantitiesRemaining(hardware));
+        });
+        return () => events?.close();
+    }, [dispatch]);
+
     return (
         <>
             <Header />
@@ -10,6 +10,7 @@ import {
     updateCart,
     submitOrder,
     OrderResponse,
+    holdCart,
 } from "slices/hardware/cartSlice";
 import { makeStoreWithEntities, waitFor } from "testing/utils";
 import { mockCartItems } from "testing/mockData";
@@ -280,3 +281,39 @@ describe("submitOrder Thunk and Reducer", () => {
         });
     });
 });
+
+describe("holdCart Thunk", () => {
+    it("Posts the items in the cart", async () => {
+        const response = {
+            data: {
+                hardware: mockCartItems.map(({ hardware_id, quantity }) => ({
+                    hardware_id,
+                    quantity_held: quantity,
+                })),
+                expires_at: "2021-01-01T00:10:00Z",
+            },
+        };
+        mockedPost.mockResolvedValue(response as AxiosResponse);
+        const store = makeStoreWithEntities({ cartItems: mockCartItems });
+
+        const result = await store.dispatch(holdCart());
+
+        expect(mockedPost).toHaveBeenCalledWith("/api/hardware/holds/", {
+            hardware: mockCartItems.map(({ hardware_id, quantity }) => ({
+                id: hardware_id,
+                quantity,
+            })),
+        });
+        expect(result.payload).toEqual(response.data);
+    });
+
+    it("Ignores failures", async () => {
+        mockedPost.mockRejectedValue({ response: { status: 500 } });
+        const store = makeStoreWithEntities({ cartItems: mockCartItems });
+
+        const result = await store.dispatch(holdCart());
+
+        expect(result.payload).toBeNull();
+        expect(store.getState()[cartReducerName].error).toBeNull();
+    });
+});
@@ -111,6 +111,39 @@ export const submitOrder = createAsyncThunk<
     }
 );
 
+export interface HoldResponse {
+    hardware: {
+        hardware_id: number;
+        quantity_held: number;
+    }[];
+    expires_at: string | null;
+}
+
+// Holds the items in the cart for a few minutes, so that other teams can't take
+// them before the order is submitted. Holds are best effort, so failures are
+// left for submitOrder to report.
+export const holdCart = createAsyncThunk<
+    HoldResponse | null,
+    void,
+    { state: RootState }
+>(
+    `${cartReducerName}/holdCart`,
+    async (_, { getState }) => {
+        const cartItems = cartSelectors
+            .selectAll(getState())
+            .map(({ hardware_id, quantity }) => ({ id: hardware_id, quantity }));
+
+        try {
+            const response = await post<HoldResponse>("/api/hardware/holds/", {
+                hardware: cartItems,
+            });
+            return response.data;
+        } catch (e: any) {
+            return null;
+        }
+    }
+);
+
 // Slice
 const cartSlice = createSlice({
     name: cartReducerName,
@@ -7,7 +7,7 @@ import {
 } from "@reduxjs/toolkit";
 import { RootState, AppDispatch } from "slices/store";
 
-import { APIListResponse, Hardware, HardwareFilters } from "api/types";
+import { APIListResponse, Hardware, HardwareFilters, HardwareStock } from "api/types";
 import { get, stripHostnameReturnFilters } from "api/api";
 import { displaySnackbar } from "slices/ui/uiSlice";
 
@@ -177,6 +177,23 @@ const hardwareSlice = createSlice({
         removeProductOverviewItem: (state: HardwareState) => {
             state.hardwareIdInProductOverview = null;
         },
+
+        /**
+         * Apply the quantities remaining from a stock event, to the hardware
+         * which are loaded
+         */
+        updateQuantitiesRemaining: (
+            state: HardwareState,
+            { payload }: PayloadAction<HardwareStock[]>
+        ) => {
+            hardwareAdapter.updateMany(
+                state,
+                payload.map(({ id, quantity_remaining }) => ({
+                    id,
+                    changes: { quantity_remaining },
+                }))
+            );
+        },
     },
     extraReducers: (builder) => {
         builder.addCase(getHardwareWithFilters.pending, (state) => {
@@ -250,7 +267,12 @@ const hardwareSlice = createSlice({
 export const { actions, reducer } = hardwareSlice;
 export default reducer;
 
-export const { setFilters, clearFilters, removeProductOverviewItem } = actions;
+export const {
+    setFilters,
+    clearFilters,
+    removeProductOverviewItem,
+    updateQuantitiesRemaining,
+} = actions;
 
 // Selectors
 export const hardwareSliceSelector = (state: RootState) => state[hardwareReducerName];
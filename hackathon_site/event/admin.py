@@ -4,7 +4,7 @@ from django.db.models import Count
 from import_export import resources
 from import_export.admin import ExportMixin
 
-from event.models import Profile, Team as EventTeam, User, UserActivity
+from event.models import Profile, Team as EventTeam, User, UserActivityEvent
 from hardware.admin import OrderInline
 
 admin.site.unregister(User)
@@ -96,16 +96,16 @@ class EventTeamAdmin(admin.ModelAdmin):
         return obj.members_count
 
 
-@admin.register(UserActivity)
-class UserActivityAdmin(ExportMixin, admin.ModelAdmin):
+@admin.register(UserActivityEvent)
+class UserActivityEventAdmin(ExportMixin, admin.ModelAdmin):
     list_display = (
         "get_user_name",
-        "sign_in",
-        "lunch1",
-        "dinner1",
-        "breakfast2",
-        "lunch2",
+        "event_name",
+        "scanned_at",
+        "recorded_at",
     )
+    list_filter = ("event_name",)
+    search_fields = ("user__email", "user__first_name", "user__last_name")
 
     def get_user_name(self, obj):
         return f"{obj.user.first_name} {obj.user.last_name}"
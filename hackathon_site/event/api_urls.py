@@ -16,6 +16,13 @@ urlpatterns = [
         api_views.UserReviewStatusAPIView.as_view(),
         name="user-review-status",
     ),
+    path("check_in/", api_views.CheckInView.as_view(), name="check-in"),
+    path(
+        "check_in/batch/", api_views.CheckInBatchView.as_view(), name="check-in-batch"
+    ),
+    path(
+        "sign_in_counts/", api_views.SignInCountsView.as_view(), name="sign-in-counts",
+    ),
     path("teams/team/", api_views.CurrentTeamAPIView.as_view(), name="current-team"),
     re_path(
         "teams/join/(?P<team_code>[A-Z0-9]{5})/",
@@ -1,12 +1,9 @@
 import logging
 
-from django.core import mail
-from django.core.mail import send_mail
 from django.db import transaction
 from django.db.models import Q
 from django.conf import settings
 from django.http import HttpResponseServerError
-from django.template.loader import render_to_string
 from drf_yasg.utils import swagger_auto_schema
 
 from rest_framework import generics, mixins, status, permissions
@@ -15,12 +12,15 @@ from rest_framework.response import Response
 
 
 from event.serializers import (
+    CheckInBatchSerializer,
+    CheckInSerializer,
     ProfileSerializer,
     CurrentProfileSerializer,
     ProfileCreateResponseSerializer,
     UserReviewStatusSerializer,
 )
 from event.models import User, Team as EventTeam, Profile
+from event.sign_in_counts import sign_in_counts
 from event.serializers import UserSerializer, TeamSerializer
 from hardware.serializers import (
     IncidentCreateSerializer,
@@ -28,7 +28,9 @@ from hardware.serializers import (
     TeamOrderChangeSerializer,
 )
 from event.permissions import UserHasProfile, FullDjangoModelPermissions
-from hardware.models import OrderItem, Order, Incident
+from hardware.models import OrderItem, Order, Incident, QueuedEmail
+from hardware.notifications import OrderNotification
+from hardware.push import publish_order_status_change
 
 logger = logging.getLogger(__name__)
 
@@ -80,6 +82,48 @@ class UserReviewStatusAPIView(generics.GenericAPIView, mixins.RetrieveModelMixin
         return self.retrieve(request, *args, **kwargs)
 
 
+class CheckInView(generics.GenericAPIView):
+    """
+    Sign in the attendee whose QR code was scanned, for the scanner page. Scanning
+    someone who has already signed in to the current event is not an error.
+    """
+
+    serializer_class = CheckInSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save())
+
+
+class CheckInBatchView(generics.GenericAPIView):
+    """
+    Sign in the attendees from scans which a scanner page queued while it was
+    offline, all in one transaction
+    """
+
+    serializer_class = CheckInBatchSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    @transaction.atomic
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save())
+
+
+class SignInCountsView(generics.GenericAPIView):
+    """
+    How many users signed in to each event, for the scanner page to refresh
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({"counts": sign_in_counts.get()})
+
+
 class CurrentUserReviewStatusAPIView(
     generics.GenericAPIView, mixins.RetrieveModelMixin
 ):
@@ -219,6 +263,7 @@ class TeamIncidentListView(
             raise PermissionDenied("Can only create incidents for your own team.")
         serializer.save()
 
+    @transaction.atomic
     def post(self, request, *args, **kwargs):
         return self.create(request, *args, **kwargs)
 
@@ -341,64 +386,32 @@ class TeamOrderDetailView(mixins.UpdateModelMixin, generics.GenericAPIView):
         if order_team != user_team:
             raise PermissionDenied("Can only change the status of your orders.")
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        if "status" in serializer.validated_data:
+            publish_order_status_change(serializer.instance)
+
+    @transaction.atomic
     def patch(self, request, *args, **kwargs):
         response = self.partial_update(request, *args, **kwargs)
 
         if "status" in request.data:
-            profiles = Profile.objects.filter(team__exact=response.data["team_id"])
-            connection = mail.get_connection(fail_silently=False)
-            connection.open()
-
-            try:
-                render_to_string_context = {
-                    "recipient": "Hardware Inventory Admins",
+            profiles = Profile.objects.filter(
+                team__exact=response.data["team_id"]
+            ).select_related("user")
+            notification = OrderNotification(
+                subject_template=self.update_order_email_subject_template,
+                admin_template=self.update_order_email_template_admin,
+                participant_template=self.update_order_email_template_participant,
+                context={
                     "order": response.data,
                     "order_status_message": f'{ORDER_STATUS_MSG[response.data["status"]]} by {request.user.first_name}',
-                }
-                send_mail(
-                    subject=render_to_string(
-                        self.update_order_email_subject_template,
-                        render_to_string_context,
-                    ),
-                    message=render_to_string(
-                        self.update_order_email_template_admin,
-                        render_to_string_context,
-                    ),
-                    html_message=render_to_string(
-                        self.update_order_email_template_admin,
-                        render_to_string_context,
-                    ),
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    connection=connection,
-                    recipient_list=[settings.HSS_ADMIN_EMAIL],
-                )
-                for profile in profiles:
-                    render_to_string_context = {
-                        **render_to_string_context,
-                        "recipient": profile.user,
-                        "order_status_closing_message": ORDER_STATUS_CLOSING_MSG[
-                            response.data["status"]
-                        ],
-                    }
-                    profile.user.email_user(
-                        subject=render_to_string(
-                            self.update_order_email_subject_template,
-                            render_to_string_context,
-                        ),
-                        message=render_to_string(
-                            self.update_order_email_template_participant,
-                            render_to_string_context,
-                        ),
-                        html_message=render_to_string(
-                            self.update_order_email_template_participant,
-                            render_to_string_context,
-                        ),
-                        from_email=settings.DEFAULT_FROM_EMAIL,
-                        connection=connection,
-                    )
-            except Exception as e:
-                logger.error(e)
-                raise e
-            finally:
-                connection.close()
+                    "order_status_closing_message": ORDER_STATUS_CLOSING_MSG[
+                        response.data["status"]
+                    ],
+                },
+            )
+            QueuedEmail.objects.bulk_create(
+                notification.build_emails(profile.user for profile in profiles)
+            )
         return response
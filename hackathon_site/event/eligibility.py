@@ -0,0 +1,196 @@
+"""
+A snapshot of what the sign in scanner needs to know about every user: their
+name, student number and dietary restrictions, and whether they were accepted
+and have RSVP'd. It is kept in the shared django cache (redis), keyed by email,
+so that checking someone in doesn't read the database even while it is busy
+with the hardware order rush.
+
+The snapshot is built by the build_attendee_index command, and kept up to date
+by the signals in event.signals whenever a user, application or review changes.
+Until it has been built, attendees are read from the database instead.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from event.models import User
+
+ATTENDEE_FIELDS = {
+    "id": F("id"),
+    "first_name": F("first_name"),
+    "last_name": F("last_name"),
+    "email": F("email"),
+    "application_id": F("application__id"),
+    "student_number": F("application__student_number"),
+    "dietary_restrictions": F("application__dietary_restrictions"),
+    "specific_dietary_requirement": F("application__specific_dietary_requirement"),
+    "rsvp": F("application__rsvp"),
+    "review_status": F("application__review__status"),
+}
+
+
+def query_attendees(queryset=None):
+    """
+    The snapshot of the given users (by default all of them), fetched in one
+    joined query
+    """
+    if queryset is None:
+        queryset = User.objects.all()
+    # Aliased with a prefix, since values() can't reuse the names of User fields
+    return (
+        {name: attendee[f"attendee_{name}"] for name in ATTENDEE_FIELDS}
+        for attendee in queryset.values(
+            **{f"attendee_{name}": field for name, field in ATTENDEE_FIELDS.items()}
+        ).order_by("id")
+    )
+
+
+class AttendeeIndex:
+    key_prefix = "event:attendee"
+    built_key = "event:attendee:built"
+
+    batch_size = 1000
+
+    def _email_key(self, email):
+        return f"{self.key_prefix}:email:{email}"
+
+    def _user_key(self, user_id):
+        return f"{self.key_prefix}:user:{user_id}"
+
+    def is_built(self):
+        return bool(cache.get(self.built_key))
+
+    def _store(self, attendees):
+        """
+        Save a batch of attendees, and forget the old email of any whose email
+        changed
+        """
+        attendees = list(attendees)
+        previous_emails = cache.get_many(
+            [self._user_key(attendee["id"]) for attendee in attendees]
+        )
+        stale_keys = [
+            self._email_key(previous_emails[self._user_key(attendee["id"])])
+            for attendee in attendees
+            if previous_emails.get(self._user_key(attendee["id"]), attendee["email"])
+            != attendee["email"]
+        ]
+        if stale_keys:
+            cache.delete_many(stale_keys)
+
+        values = {}
+        for attendee in attendees:
+            values[self._email_key(attendee["email"])] = attendee
+            values[self._user_key(attendee["id"])] = attendee["email"]
+        cache.set_many(values, timeout=None)
+
+    def build(self):
+        """
+        Snapshot every user, returning how many there were
+        """
+        count = 0
+        batch = []
+        for attendee in query_attendees():
+            batch.append(attendee)
+            if len(batch) >= self.batch_size:
+                self._store(batch)
+                count += len(batch)
+                batch = []
+        self._store(batch)
+        count += len(batch)
+        cache.set(self.built_key, True, timeout=None)
+        return count
+
+    def refresh(self, user_ids):
+        """
+        Snapshot the given users again, or forget the ones which were deleted
+        """
+        if not self.is_built():
+            return
+        user_ids = set(user_ids)
+        attendees = list(query_attendees(User.objects.filter(id__in=user_ids)))
+        self._store(attendees)
+
+        deleted = user_ids - {attendee["id"] for attendee in attendees}
+        emails = cache.get_many([self._user_key(user_id) for user_id in deleted])
+        cache.delete_many(
+            [self._email_key(email) for email in emails.values()]
+            + [self._user_key(user_id) for user_id in deleted]
+        )
+
+    def get(self, email):
+        """
+        The snapshot of the user with the given email, or None if there isn't
+        one. Raises LookupError if the index hasn't been built.
+        """
+        return self.get_many([email]).get(email)
+
+    def get_many(self, emails):
+        """
+        The snapshots of the users with the given emails, as a dict of email ->
+        snapshot leaving out emails without a user, fetched with one round trip.
+        Emails missing from the index (e.g. evicted from the cache) are looked up
+        in the database with one query, and added back if they have a user.
+        Raises LookupError if the index hasn't been built.
+        """
+        keys = {self._email_key(email): email for email in emails}
+        values = cache.get_many([*keys, self.built_key])
+        if not values.get(self.built_key):
+            raise LookupError("The attendee index hasn't been built")
+        attendees = {
+            keys[key]: attendee
+            for key, attendee in values.items()
+            if key != self.built_key
+        }
+
+        missing = set(keys.values()) - set(attendees)
+        if missing:
+            found = list(query_attendees(User.objects.filter(email__in=missing)))
+            if found:
+                self._store(found)
+            attendees.update((attendee["email"], attendee) for attendee in found)
+        return attendees
+
+
+attendee_index = AttendeeIndex()
+
+
+def get_attendee(email):
+    """
+    What the scanner needs to know about the user with the given email, from the
+    index if it has been built or the database otherwise. None if there is no
+    such user.
+    """
+    return get_attendees([email]).get(email)
+
+
+def get_attendees(emails):
+    """
+    Like get_attendee for several emails at once, as a dict of email -> attendee
+    leaving out emails without a user
+    """
+    emails = set(emails)
+    try:
+        return attendee_index.get_many(emails)
+    except LookupError:
+        return {
+            attendee["email"]: attendee
+            for attendee in query_attendees(User.objects.filter(email__in=emails))
+        }
+
+
+def get_sign_in_error(attendee, email):
+    """
+    Why the attendee (from get_attendee) can't sign in, or None if they can
+    """
+    if attendee is None:
+        return f"User {email} does not exist."
+    if attendee["application_id"] is None:
+        return f"User {email} has not applied to {settings.HACKATHON_NAME}"
+    if attendee["review_status"] is None:
+        return f"User {email} was not reviewed."
+    if attendee["review_status"] != "Accepted":
+        return f"User {email} has not been Accepted to attend {settings.HACKATHON_NAME}"
+    if settings.RSVP and attendee["rsvp"] is None:
+        return f"User {email} has not RSVP'd to the hackathon"
+    return None
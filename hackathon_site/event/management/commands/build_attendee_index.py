@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from event.eligibility import attendee_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Snapshot every user's sign in eligibility into the cache, so the QR "
+        "scanner can check people in without reading the database. Run this "
+        "before the event starts, and again if the cache is flushed. Signals keep "
+        "the snapshot up to date after that."
+    )
+
+    def handle(self, *args, **options):
+        count = attendee_index.build()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} users"))
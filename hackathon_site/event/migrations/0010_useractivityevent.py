@@ -0,0 +1,58 @@
+# Generated by Django 3.2.15 on 2026-10-18 09:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("event", "0009_useractivity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserActivityEvent",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("event_name", models.CharField(max_length=50)),
+                ("scanned_at", models.DateTimeField()),
+                (
+                    "recorded_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="activity_events",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="useractivityevent",
+            index=models.Index(
+                fields=["event_name", "scanned_at"],
+                name="event_usera_event_n_11df72_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="useractivityevent",
+            constraint=models.UniqueConstraint(
+                fields=("user", "event_name"), name="unique_user_activity_event"
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.db import migrations
+
+# The events UserActivity had a column for
+EVENT_NAMES = ("sign_in", "lunch1", "dinner1", "breakfast2", "lunch2")
+BATCH_SIZE = 1000
+
+
+def apply_migration(apps, schema_editor):
+    """
+    Log an event for every time recorded in a UserActivity column
+    """
+    UserActivity = apps.get_model("event", "UserActivity")
+    UserActivityEvent = apps.get_model("event", "UserActivityEvent")
+
+    for event_name in EVENT_NAMES:
+        times = UserActivity.objects.filter(
+            **{f"{event_name}__isnull": False}
+        ).values_list("user_id", event_name)
+        UserActivityEvent.objects.bulk_create(
+            (
+                UserActivityEvent(
+                    user_id=user_id,
+                    event_name=event_name,
+                    scanned_at=scanned_at,
+                    recorded_at=scanned_at,
+                )
+                for user_id, scanned_at in times.iterator()
+            ),
+            batch_size=BATCH_SIZE,
+        )
+
+
+def revert_migration(apps, schema_editor):
+    """
+    Put the events back into UserActivity columns. Events it has no column for
+    are lost.
+    """
+    UserActivity = apps.get_model("event", "UserActivity")
+    UserActivityEvent = apps.get_model("event", "UserActivityEvent")
+
+    activities = {}
+    for user_id, event_name, scanned_at in (
+        UserActivityEvent.objects.filter(event_name__in=EVENT_NAMES)
+        .values_list("user_id", "event_name", "scanned_at")
+        .iterator()
+    ):
+        activity = activities.setdefault(user_id, UserActivity(user_id=user_id))
+        setattr(activity, event_name, scanned_at)
+    UserActivity.objects.bulk_create(activities.values(), batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("event", "0010_useractivityevent"),
+    ]
+
+    operations = [migrations.RunPython(apply_migration, revert_migration)]
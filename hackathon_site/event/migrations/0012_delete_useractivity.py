@@ -0,0 +1,14 @@
+# Generated by Django 3.2.15 on 2026-10-18 09:54
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("event", "0011_copy_user_activity"),
+    ]
+
+    operations = [
+        migrations.DeleteModel(name="UserActivity",),
+    ]
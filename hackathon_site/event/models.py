@@ -1,5 +1,7 @@
 from django.db import models
+from django.db.models import Count
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 import uuid
 
 User = get_user_model()
@@ -48,10 +50,44 @@ class Profile(models.Model):
         return f"{self.id} | {self.user.first_name} {self.user.last_name}"
 
 
-class UserActivity(models.Model):
-    user = models.OneToOneField(User, on_delete=models.CASCADE)
-    sign_in = models.DateTimeField(null=True)
-    lunch1 = models.DateTimeField(null=True)
-    dinner1 = models.DateTimeField(null=True)
-    breakfast2 = models.DateTimeField(null=True)
-    lunch2 = models.DateTimeField(null=True)
+class UserActivityEventQuerySet(models.QuerySet):
+    def get_counts(self):
+        """
+        How many users signed in to each event, as a dict of event name -> count,
+        from one grouped query. Events nobody signed in to are left out.
+        """
+        return dict(
+            self.order_by()
+            .values("event_name")
+            .annotate(count=Count("id"))
+            .values_list("event_name", "count")
+        )
+
+
+class UserActivityEvent(models.Model):
+    """
+    A user signing in to one of the events in settings.SIGN_IN_TIMES, such as a
+    meal. Users sign in to each event once, when they were first scanned.
+    """
+
+    objects = UserActivityEventQuerySet.as_manager()
+
+    user = models.ForeignKey(
+        User, related_name="activity_events", on_delete=models.CASCADE
+    )
+    event_name = models.CharField(max_length=50, null=False)
+    scanned_at = models.DateTimeField(null=False)
+    # When the scan reached the server, which is later than scanned_at for scans
+    # synced by offline scanners
+    recorded_at = models.DateTimeField(default=timezone.now, null=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "event_name"], name="unique_user_activity_event"
+            )
+        ]
+        indexes = [models.Index(fields=["event_name", "scanned_at"])]
+
+    def __str__(self):
+        return f"{self.user_id} | {self.event_name}"
@@ -1,11 +1,21 @@
 import datetime
+from collections import Counter
 
 from django.contrib.auth.models import Group
 from django.core.exceptions import ObjectDoesNotExist
 from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 
-from event.models import Profile, User, Team
+from event.eligibility import get_attendee, get_attendees, get_sign_in_error
+from event.models import Profile, User, Team, UserActivityEvent
+from event.sign_in_counts import sign_in_counts
+from hackathon_site.utils import (
+    NoEventOccurringException,
+    get_curr_sign_in_time,
+    get_sign_in_time,
+    is_hackathon_happening,
+)
 from registration.models import Application
 from review.models import Review
 
@@ -203,3 +213,240 @@ class UserReviewStatusSerializer(serializers.ModelSerializer):
             return review.status if review.decision_sent_date is not None else "None"
         except ObjectDoesNotExist:
             return "None"
+
+
+class CheckInSerializer(serializers.Serializer):
+    """
+    Sign an attendee in to the current sign in event (see settings.SIGN_IN_TIMES)
+    with the email from their QR code. Their eligibility comes from the attendee
+    index (see event.eligibility), and scanning them again doesn't change when
+    they signed in.
+    """
+
+    email = serializers.EmailField()
+
+    def validate(self, data):
+        if not is_hackathon_happening():
+            raise serializers.ValidationError(
+                "You cannot sign in outside of the hackathon period."
+            )
+        event = get_curr_sign_in_time()
+        if event is None:
+            raise serializers.ValidationError(str(NoEventOccurringException()))
+
+        attendee = get_attendee(data["email"])
+        error = get_sign_in_error(attendee, data["email"])
+        if error is not None:
+            raise serializers.ValidationError({"email": error})
+        return {**data, "event": event, "attendee": attendee}
+
+    def create(self, validated_data):
+        event = validated_data["event"]
+        attendee = validated_data["attendee"]
+        now = datetime.datetime.now().replace(tzinfo=settings.TZ_INFO)
+
+        # Only the first scan signs them in, even if several arrive at once
+        activity_event, signed_in = UserActivityEvent.objects.get_or_create(
+            user_id=attendee["id"], event_name=event, defaults={"scanned_at": now}
+        )
+        if signed_in:
+            sign_in_counts.incr(event)
+
+        return {
+            "status": "signed_in" if signed_in else "already_signed_in",
+            "event": event,
+            "event_description": next(
+                sign_in_time["description"]
+                for sign_in_time in settings.SIGN_IN_TIMES
+                if sign_in_time["name"] == event
+            ),
+            "signed_in_at": activity_event.scanned_at,
+            "first_name": attendee["first_name"],
+            "last_name": attendee["last_name"],
+            "email": attendee["email"],
+            "student_number": attendee["student_number"],
+            "dietary_restrictions": attendee["dietary_restrictions"],
+            "specific_dietary_requirement": attendee["specific_dietary_requirement"],
+        }
+
+
+class ScanSerializer(serializers.Serializer):
+    # Scanner clocks may run a little ahead of the server's
+    max_clock_skew = datetime.timedelta(minutes=1)
+
+    # Chosen by the scanner device, to match scans up with their results
+    id = serializers.CharField(max_length=64)
+    email = serializers.EmailField()
+    scanned_at = serializers.DateTimeField()
+
+    def validate_scanned_at(self, scanned_at):
+        if scanned_at > timezone.now() + self.max_clock_skew:
+            raise serializers.ValidationError("Scans can't be in the future.")
+        return scanned_at
+
+
+class CheckInBatchSerializer(serializers.Serializer):
+    """
+    Sign in the attendees from a batch of scans queued by a scanner device while
+    it was offline. Each scan counts for the sign in event happening when it was
+    scanned, and the earliest scan of an attendee for an event wins, no matter
+    which device it came from or when it was synced. The result of every scan is
+    reported in the order of the scans, so the device can forget the ones which
+    were applied. Scans which are malformed are rejected one by one, rather than
+    failing the whole batch.
+    """
+
+    max_scans = 500
+
+    # Each scan is validated in validate_scans
+    scans = serializers.ListField(allow_empty=False)
+
+    def validate_scans(self, scans):
+        if len(scans) > self.max_scans:
+            raise serializers.ValidationError(
+                f"At most {self.max_scans} scans can be synced at once."
+            )
+
+        validated_scans = []
+        scan_ids = set()
+        for scan in scans:
+            serializer = ScanSerializer(data=scan)
+            if serializer.is_valid():
+                scan = serializer.validated_data
+                if scan["id"] not in scan_ids:
+                    scan_ids.add(scan["id"])
+                    validated_scans.append({**scan, "error": None})
+                    continue
+                error = "Every scan must have a different id."
+            else:
+                error = " ".join(
+                    f"{field}: {message}" if field != "non_field_errors" else message
+                    for field, messages in serializer.errors.items()
+                    for message in messages
+                )
+            scan = scan if isinstance(scan, dict) else {}
+            validated_scans.append(
+                {
+                    "id": scan.get("id"),
+                    "email": scan.get("email"),
+                    "scanned_at": None,
+                    "error": error,
+                }
+            )
+        return validated_scans
+
+    def create(self, validated_data):
+        scans = validated_data["scans"]
+        attendees = get_attendees(scan["email"] for scan in scans if not scan["error"])
+
+        results = []
+        # The earliest scan of each attendee for each event, as (user id, event)
+        # -> (scan, result)
+        first_scans = {}
+        for scan in scans:
+            attendee, event, error = None, None, scan["error"]
+            if error is None:
+                attendee = attendees.get(scan["email"])
+                event = get_sign_in_time(scan["scanned_at"])
+                error = get_sign_in_error(attendee, scan["email"])
+                if error is None and event is None:
+                    error = str(NoEventOccurringException())
+            result = {
+                "id": scan["id"],
+                "email": scan["email"],
+                "event": event,
+                "status": "rejected" if error else "already_signed_in",
+                "signed_in_at": None,
+                "error": error,
+            }
+            results.append(result)
+            if error is None:
+                key = (attendee["id"], event)
+                result["key"] = key
+                if (
+                    key not in first_scans
+                    or scan["scanned_at"] < first_scans[key][0]["scanned_at"]
+                ):
+                    first_scans[key] = (scan, result)
+
+        if first_scans:
+            activity_events = self._record(first_scans)
+            for result in results:
+                key = result.pop("key", None)
+                if key is not None:
+                    result["signed_in_at"] = activity_events[key].scanned_at
+
+        return {"scans": results}
+
+    def _record(self, first_scans):
+        """
+        Record the earliest scan of each attendee for each event, unless they had
+        an earlier one already. Returns the sign ins as they are now, as (user
+        id, event) -> UserActivityEvent.
+        """
+        recorded_at = timezone.now()
+
+        def select(keys):
+            # Locked so that concurrent syncs of the same attendees take turns
+            return {
+                (activity_event.user_id, activity_event.event_name): activity_event
+                for activity_event in UserActivityEvent.objects.select_for_update().filter(
+                    user_id__in={user_id for user_id, _ in keys},
+                    event_name__in={event for _, event in keys},
+                )
+                if (activity_event.user_id, activity_event.event_name) in keys
+            }
+
+        def move_earlier(activity_event, scan, result):
+            if scan["scanned_at"] < activity_event.scanned_at:
+                activity_event.scanned_at = scan["scanned_at"]
+                activity_event.recorded_at = recorded_at
+                moved_earlier.append(activity_event)
+                result["status"] = "signed_in"
+
+        activity_events = select(first_scans.keys())
+        moved_earlier = []
+        new_keys = []
+        for key, (scan, result) in first_scans.items():
+            if key in activity_events:
+                move_earlier(activity_events[key], scan, result)
+            else:
+                new_keys.append(key)
+
+        if new_keys:
+            UserActivityEvent.objects.bulk_create(
+                [
+                    UserActivityEvent(
+                        user_id=user_id,
+                        event_name=event,
+                        scanned_at=first_scans[user_id, event][0]["scanned_at"],
+                        recorded_at=recorded_at,
+                    )
+                    for user_id, event in new_keys
+                ],
+                ignore_conflicts=True,
+            )
+            # A concurrent sync may have inserted some of them first, in which
+            # case its scan is kept only if it's earlier than this one
+            inserted = Counter()
+            new_activity_events = select(set(new_keys))
+            for key in new_keys:
+                scan, result = first_scans[key]
+                activity_event = new_activity_events[key]
+                if activity_event.scanned_at == scan["scanned_at"]:
+                    # Inserted above, or the same scan synced concurrently, in
+                    # which case it's counted twice until sign_in_counts
+                    # recounts
+                    inserted[key[1]] += 1
+                    result["status"] = "signed_in"
+                else:
+                    move_earlier(activity_event, scan, result)
+            activity_events.update(new_activity_events)
+            for event, count in inserted.items():
+                sign_in_counts.incr(event, count)
+
+        if moved_earlier:
+            UserActivityEvent.objects.bulk_update(
+                moved_earlier, ["scanned_at", "recorded_at"]
+            )
+        return activity_events
@@ -0,0 +1,85 @@
+"""
+Live counts of how many users signed in to each event, for the scanner page.
+
+The counts are kept in the shared django cache (redis), and incremented with
+cache.incr (INCR on redis) whenever someone signs in to an event for the first
+time, so reading them never counts the UserActivityEvent table. They are
+recounted from the database every reconcile_interval seconds, which corrects
+any increments that were missed, e.g. while the cache was down or in between a
+recount and it being saved.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from event.models import UserActivityEvent
+
+
+class SignInCounts:
+    key_prefix = "event:sign_in_count"
+    reconciled_key = "event:sign_in_count:reconciled"
+    lock_key = "event:sign_in_count:lock"
+
+    reconcile_interval = 300
+    lock_timeout = 30
+
+    def _count_key(self, event_name):
+        return f"{self.key_prefix}:{event_name}"
+
+    def reconcile(self):
+        """
+        Recount every event from the database, returning the counts
+        """
+        counts = UserActivityEvent.objects.get_counts()
+        counts = {
+            event["name"]: counts.get(event["name"], 0)
+            for event in settings.SIGN_IN_TIMES
+        }
+        cache.set_many(
+            {self._count_key(name): count for name, count in counts.items()},
+            timeout=None,
+        )
+        cache.set(self.reconciled_key, True, timeout=self.reconcile_interval)
+        return counts
+
+    def get(self):
+        """
+        How many users signed in to each event in settings.SIGN_IN_TIMES, as a
+        dict of event name -> count. Recounted first if it's been more than
+        reconcile_interval seconds since the last time, otherwise fetched with
+        one round trip to the cache.
+        """
+        keys = {
+            self._count_key(event["name"]): event["name"]
+            for event in settings.SIGN_IN_TIMES
+        }
+        values = cache.get_many([*keys, self.reconciled_key])
+        stale = not values.get(self.reconciled_key) or any(
+            key not in values for key in keys
+        )
+        # Only one request recounts at a time, the others make do with the
+        # current counts
+        if stale and cache.add(self.lock_key, True, timeout=self.lock_timeout):
+            try:
+                return self.reconcile()
+            finally:
+                cache.delete(self.lock_key)
+        return {name: values.get(key, 0) for key, name in keys.items()}
+
+    def incr(self, event_name, delta=1):
+        """
+        Count users signing in to an event for the first time, once the current
+        transaction commits
+        """
+
+        def incr():
+            try:
+                cache.incr(self._count_key(event_name), delta)
+            except ValueError:
+                # Not counted yet, the next recount will include them
+                pass
+
+        transaction.on_commit(incr)
+
+
+sign_in_counts = SignInCounts()
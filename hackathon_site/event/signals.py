@@ -1,6 +1,10 @@
-from django.db.models.signals import post_delete
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from event.models import Profile, Team
+from event.eligibility import attendee_index
+from event.models import Profile, Team, User
+from registration.models import Application
+from review.models import Review
 
 
 @receiver(post_delete, sender=Profile, dispatch_uid="profile_delete_signal")
@@ -19,3 +23,37 @@ def delete_profile(sender, instance, **kwargs):
         return
     if team.profiles.count() == 0:
         team.delete()
+
+
+def refresh_attendee(user_id):
+    """
+    Snapshot the user's eligibility again once the current transaction commits,
+    see event.eligibility
+    """
+    transaction.on_commit(lambda: attendee_index.refresh([user_id]))
+
+
+@receiver(post_save, sender=User, dispatch_uid="attendee_index_user_save")
+@receiver(post_delete, sender=User, dispatch_uid="attendee_index_user_delete")
+def refresh_attendee_user(sender, instance, update_fields=None, **kwargs):
+    # Every login saves last_login, which isn't in the snapshot
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    refresh_attendee(instance.id)
+
+
+@receiver(post_save, sender=Application, dispatch_uid="attendee_index_app_save")
+@receiver(post_delete, sender=Application, dispatch_uid="attendee_index_app_delete")
+def refresh_attendee_application(sender, instance, **kwargs):
+    refresh_attendee(instance.user_id)
+
+
+@receiver(post_save, sender=Review, dispatch_uid="attendee_index_review_save")
+@receiver(post_delete, sender=Review, dispatch_uid="attendee_index_review_delete")
+def refresh_attendee_review(sender, instance, **kwargs):
+    try:
+        user_id = instance.application.user_id
+    except Application.DoesNotExist:
+        # Deleted along with the application, which refreshes the user itself
+        return
+    refresh_attendee(user_id)
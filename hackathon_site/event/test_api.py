@@ -1,6 +1,15 @@
+import json
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
 from django.conf import settings
 from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
 from hackathon_site.tests import SetupUserMixin
@@ -8,14 +17,17 @@ from django.contrib.auth.models import Permission
 from django.db.models import Q
 
 
-from event.models import Profile, User, Team
+from event.eligibility import attendee_index
+from event.sign_in_counts import sign_in_counts
+from event.models import Profile, User, Team, UserActivityEvent
 from event.serializers import (
     UserSerializer,
     TeamSerializer,
 )
 
 from hardware.serializers import OrderListSerializer
-from hardware.models import Hardware, Order, OrderItem
+from hardware.models import CatalogVersion, Hardware, Order, OrderItem
+from review.models import Review
 
 
 class CurrentUserTestCase(SetupUserMixin, APITestCase):
@@ -390,6 +402,24 @@ class EventTeamListsViewTestCase(SetupUserMixin, APITestCase):
         returned_ids = [res["team_code"] for res in results]
         self.assertCountEqual(returned_ids, [self.team2.team_code])
 
+    def test_stream_ndjson(self):
+        self._login(self.permissions)
+        Profile.objects.create(user=self.user, team=self.team2)
+
+        response = self.client.get(self._build_filter_url(stream="ndjson"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).decode().splitlines()
+        ]
+        expected_response = TeamSerializer(
+            Team.objects.all(), many=True, context={"request": response.wsgi_request}
+        ).data
+        self.assertEqual(rows, json.loads(json.dumps(expected_response)))
+
 
 class ProfileDetailViewTestCase(SetupUserMixin, APITestCase):
     def setUp(self):
@@ -1026,6 +1056,31 @@ class TeamOrderDetailViewTestCase(SetupUserMixin, APITestCase):
             self.request_data["status"], Order.objects.get(id=self.pk).status
         )
 
+    @patch("hardware.push.publish")
+    def test_status_change_pushed(self, mock_publish):
+        self._login()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self._build_view(self.pk), self.request_data)
+
+        data = {"id": self.pk, "status": "Cancelled", "team_id": self.team.id}
+        self.assertEqual(
+            [args for args, _ in mock_publish.call_args_list],
+            [
+                ("orders", "order", data),
+                (f"team.{self.team.id}", "order", data),
+                (
+                    "stock",
+                    "stock",
+                    {
+                        "version": CatalogVersion.objects.current(),
+                        "hardware": [
+                            {"id": Hardware.objects.get().id, "quantity_remaining": 4}
+                        ],
+                    },
+                ),
+            ],
+        )
+
     def test_unallowed_status_change(self):
         self._login()
         request_data = {"status": "Picked Up"}
@@ -1167,3 +1222,431 @@ class UserReviewStatusTestCase(SetupUserMixin, APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         data = response.json()
         self.assertEqual("Rejected", data["review_status"])
+
+
+@override_settings(
+    SIGN_IN_TIMES=[
+        {
+            "name": "lunch1",
+            "description": "Lunch",
+            "time": datetime.now().replace(tzinfo=settings.TZ_INFO),
+        }
+    ]
+)
+class CheckInViewTestCase(SetupUserMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.view = reverse("api:event:check-in")
+        self.attendee = User.objects.create_user(
+            username="attendee@bar.com",
+            password="foobar123",
+            email="attendee@bar.com",
+            first_name="Tom",
+            last_name="Thomson",
+        )
+        self.application = self._apply_as_user(self.attendee, rsvp=True)
+        cache.clear()
+
+    def _review(self, review_status="Accepted"):
+        return Review.objects.create(
+            application=self.application,
+            interest=10,
+            experience=10,
+            quality=10,
+            status=review_status,
+        )
+
+    def _login_as_staff(self):
+        self.user.is_staff = True
+        self.user.save()
+        # Without a session, so only the check in's own queries are counted
+        self.client.force_authenticate(self.user)
+
+    def _check_in(self, email="attendee@bar.com"):
+        return self.client.post(self.view, {"email": email}, format="json")
+
+    def test_check_in_from_index(self):
+        self._review()
+        attendee_index.build()
+        self._login_as_staff()
+        with CaptureQueriesContext(connection) as queries:
+            response = self._check_in()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The attendee is read from the index instead of the database
+        self.assertEqual(
+            [
+                query["sql"].split()[0]
+                for query in queries.captured_queries
+                if "SAVEPOINT" not in query["sql"]
+            ],
+            ["SELECT", "INSERT"],
+        )
+        self.assertEqual(response.json()["status"], "signed_in")
+
+    def test_user_not_staff(self):
+        self._login()
+        self.assertEqual(self._check_in().status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_check_in(self):
+        self._review()
+        self._login_as_staff()
+        with CaptureQueriesContext(connection) as queries:
+            response = self._check_in()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # One joined read, then looking for an earlier sign in before inserting
+        self.assertEqual(
+            [
+                query["sql"].split()[0]
+                for query in queries.captured_queries
+                if "SAVEPOINT" not in query["sql"]
+            ],
+            ["SELECT", "SELECT", "INSERT"],
+        )
+        data = response.json()
+        signed_in_at = UserActivityEvent.objects.get(
+            user=self.attendee, event_name="lunch1"
+        ).scanned_at
+        self.assertIsNotNone(signed_in_at)
+        self.assertEqual(data["status"], "signed_in")
+        self.assertEqual(data["event"], "lunch1")
+        self.assertEqual(data["event_description"], "Lunch")
+        self.assertEqual(data["first_name"], "Tom")
+        self.assertEqual(data["student_number"], "1234567890")
+        self.assertEqual(data["dietary_restrictions"], "halal")
+
+        # Scanning again doesn't sign them in again
+        response = self._check_in()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["status"], "already_signed_in")
+        self.assertEqual(UserActivityEvent.objects.get().scanned_at, signed_in_at)
+
+    def test_check_in_to_another_event(self):
+        self._review()
+        UserActivityEvent.objects.create(
+            user=self.attendee,
+            event_name="sign_in",
+            scanned_at=datetime.now().replace(tzinfo=settings.TZ_INFO),
+        )
+        self._login_as_staff()
+        response = self._check_in()
+        self.assertEqual(response.json()["status"], "signed_in")
+        self.assertTrue(
+            UserActivityEvent.objects.filter(
+                user=self.attendee, event_name="lunch1"
+            ).exists()
+        )
+
+    def test_user_does_not_exist(self):
+        self._login_as_staff()
+        response = self._check_in("nobody@bar.com")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(), {"email": ["User nobody@bar.com does not exist."]}
+        )
+
+    def test_user_not_accepted(self):
+        self._review("Rejected")
+        self._login_as_staff()
+        response = self._check_in()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(),
+            {
+                "email": [
+                    f"User attendee@bar.com has not been Accepted to attend "
+                    f"{settings.HACKATHON_NAME}"
+                ]
+            },
+        )
+        self.assertFalse(UserActivityEvent.objects.exists())
+
+    def test_user_not_reviewed(self):
+        self._login_as_staff()
+        response = self._check_in()
+        self.assertEqual(
+            response.json(), {"email": ["User attendee@bar.com was not reviewed."]}
+        )
+
+    @override_settings(SIGN_IN_TIMES=[])
+    def test_no_event(self):
+        self._review()
+        self._login_as_staff()
+        response = self._check_in()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(),
+            {
+                "non_field_errors": [
+                    "There is currently no event happening for the user to sign in."
+                ]
+            },
+        )
+
+
+LUNCH_TIME = datetime(2024, 3, 2, 12, 0, tzinfo=settings.TZ_INFO)
+
+
+@override_settings(
+    SIGN_IN_TIMES=[
+        {
+            "name": "sign_in",
+            "description": "Sign In",
+            "time": LUNCH_TIME - timedelta(hours=4),
+        },
+        {"name": "lunch1", "description": "Lunch", "time": LUNCH_TIME},
+    ]
+)
+class CheckInBatchViewTestCase(SetupUserMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.view = reverse("api:event:check-in-batch")
+        self.attendees = []
+        for email in ("tom@bar.com", "jerry@bar.com"):
+            attendee = User.objects.create_user(
+                username=email, password="foobar123", email=email
+            )
+            application = self._apply_as_user(attendee, rsvp=True)
+            Review.objects.create(
+                application=application,
+                interest=10,
+                experience=10,
+                quality=10,
+                status="Accepted",
+            )
+            self.attendees.append(attendee)
+        cache.clear()
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_authenticate(self.user)
+
+    def _sync(self, *scans):
+        return self.client.post(
+            self.view,
+            {
+                "scans": [
+                    {"id": scan_id, "email": email, "scanned_at": scanned_at}
+                    for scan_id, email, scanned_at in scans
+                ]
+            },
+            format="json",
+        )
+
+    def _results(self, response):
+        return {
+            result["id"]: (result["status"], result["event"])
+            for result in response.json()["scans"]
+        }
+
+    def test_user_not_staff(self):
+        self.user.is_staff = False
+        self.user.save()
+        response = self._sync(("1", "tom@bar.com", LUNCH_TIME))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(reverse("api:event:sign-in-counts"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_sync(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._sync(
+                ("1", "tom@bar.com", LUNCH_TIME + timedelta(minutes=5)),
+                ("2", "jerry@bar.com", LUNCH_TIME),
+                ("3", "tom@bar.com", LUNCH_TIME),
+                ("4", "tom@bar.com", LUNCH_TIME - timedelta(hours=4)),
+                ("5", "nobody@bar.com", LUNCH_TIME),
+                ("6", "jerry@bar.com", LUNCH_TIME + timedelta(hours=3)),
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The attendees, their sign ins so far, one insert for the batch, then
+        # the sign ins it inserted
+        self.assertEqual(
+            [
+                query["sql"].split()[0]
+                for query in queries.captured_queries
+                if "SAVEPOINT" not in query["sql"]
+            ],
+            ["SELECT", "SELECT", "INSERT", "SELECT"],
+        )
+
+        self.assertEqual(
+            self._results(response),
+            {
+                "1": ("already_signed_in", "lunch1"),
+                "2": ("signed_in", "lunch1"),
+                "3": ("signed_in", "lunch1"),
+                "4": ("signed_in", "sign_in"),
+                "5": ("rejected", "lunch1"),
+                "6": ("rejected", None),
+            },
+        )
+        results = {result["id"]: result for result in response.json()["scans"]}
+        self.assertEqual(results["5"]["error"], "User nobody@bar.com does not exist.")
+        self.assertEqual(
+            results["6"]["error"],
+            "There is currently no event happening for the user to sign in.",
+        )
+        # The earliest scan wins
+        self.assertEqual(
+            datetime.fromisoformat(results["1"]["signed_in_at"]), LUNCH_TIME
+        )
+
+        self.assertEqual(
+            sorted(
+                UserActivityEvent.objects.values_list(
+                    "user__email", "event_name", "scanned_at"
+                )
+            ),
+            [
+                ("jerry@bar.com", "lunch1", LUNCH_TIME),
+                ("tom@bar.com", "lunch1", LUNCH_TIME),
+                ("tom@bar.com", "sign_in", LUNCH_TIME - timedelta(hours=4)),
+            ],
+        )
+
+    def test_sync_counts_sign_ins(self):
+        self.client.get(reverse("api:event:sign-in-counts"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self._sync(("1", "tom@bar.com", LUNCH_TIME))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._sync(
+                ("2", "tom@bar.com", LUNCH_TIME - timedelta(minutes=5)),
+                ("3", "jerry@bar.com", LUNCH_TIME),
+                ("4", "jerry@bar.com", LUNCH_TIME - timedelta(hours=4)),
+            )
+        # Moving tom's sign in earlier doesn't count them again
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("api:event:sign-in-counts"))
+        self.assertEqual(response.json(), {"counts": {"sign_in": 1, "lunch1": 2}})
+
+    def test_sign_in_recorded_at_the_same_time_not_counted(self):
+        now = timezone.now()
+        UserActivityEvent.objects.create(
+            user=self.attendees[0],
+            event_name="lunch1",
+            scanned_at=LUNCH_TIME,
+            recorded_at=now,
+        )
+        sign_in_counts.reconcile()
+
+        with patch("event.serializers.timezone.now", return_value=now):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self._sync(
+                    ("1", "tom@bar.com", LUNCH_TIME + timedelta(minutes=5))
+                )
+        self.assertEqual(
+            self._results(response), {"1": ("already_signed_in", "lunch1")}
+        )
+        self.assertEqual(sign_in_counts.get()["lunch1"], 1)
+
+    def test_sync_again(self):
+        scans = [("1", "tom@bar.com", LUNCH_TIME), ("2", "jerry@bar.com", LUNCH_TIME)]
+        self._sync(*scans)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self._sync(*scans)
+        self.assertNotIn(
+            "UPDATE", [query["sql"].split()[0] for query in queries.captured_queries],
+        )
+        self.assertEqual(
+            self._results(response),
+            {
+                "1": ("already_signed_in", "lunch1"),
+                "2": ("already_signed_in", "lunch1"),
+            },
+        )
+
+    def test_earlier_scan_synced_later(self):
+        attendee_index.build()
+        self._sync(("1", "tom@bar.com", LUNCH_TIME + timedelta(minutes=10)))
+
+        response = self._sync(
+            ("2", "tom@bar.com", LUNCH_TIME),
+            ("3", "tom@bar.com", LUNCH_TIME + timedelta(minutes=20)),
+        )
+        self.assertEqual(
+            self._results(response),
+            {"2": ("signed_in", "lunch1"), "3": ("already_signed_in", "lunch1")},
+        )
+        self.assertEqual(UserActivityEvent.objects.get().scanned_at, LUNCH_TIME)
+
+    def test_invalid_scans_rejected_alone(self):
+        response = self._sync(
+            ("1", "tom@bar.com", LUNCH_TIME),
+            ("1", "jerry@bar.com", LUNCH_TIME),
+            ("2", "not an email", LUNCH_TIME),
+            ("3", "jerry@bar.com", "yesterday"),
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [
+                (result["id"], result["status"], result["error"])
+                for result in response.json()["scans"]
+            ],
+            [
+                ("1", "signed_in", None),
+                ("1", "rejected", "Every scan must have a different id."),
+                ("2", "rejected", "email: Enter a valid email address."),
+                (
+                    "3",
+                    "rejected",
+                    "scanned_at: Datetime has wrong format. Use one of these "
+                    "formats instead: YYYY-MM-DDThh:mm[:ss[.uuuuuu]][+HH:MM|-HH:MM|Z].",
+                ),
+            ],
+        )
+        self.assertEqual(
+            list(UserActivityEvent.objects.values_list("user__email", flat=True)),
+            ["tom@bar.com"],
+        )
+
+        response = self.client.post(self.view, {"scans": ["1"]}, format="json")
+        self.assertEqual(
+            response.json()["scans"][0]["error"],
+            "Invalid data. Expected a dictionary, but got str.",
+        )
+
+    def test_future_scan_rejected(self):
+        response = self._sync(("1", "tom@bar.com", timezone.now() + timedelta(hours=1)))
+        self.assertEqual(
+            response.json()["scans"][0]["error"],
+            "scanned_at: Scans can't be in the future.",
+        )
+        self.assertFalse(UserActivityEvent.objects.exists())
+
+    def test_later_scan_inserted_concurrently(self):
+        bulk_create = UserActivityEvent.objects.bulk_create
+
+        def sync_concurrently(objs, **kwargs):
+            # Another sync inserts a later scan between the read and the insert
+            UserActivityEvent.objects.create(
+                user=self.attendees[0],
+                event_name="lunch1",
+                scanned_at=LUNCH_TIME + timedelta(minutes=10),
+                recorded_at=timezone.now(),
+            )
+            return bulk_create(objs, **kwargs)
+
+        with patch.object(
+            UserActivityEvent.objects, "bulk_create", side_effect=sync_concurrently
+        ):
+            response = self._sync(
+                ("1", "tom@bar.com", LUNCH_TIME), ("2", "jerry@bar.com", LUNCH_TIME),
+            )
+        self.assertEqual(
+            self._results(response),
+            {"1": ("signed_in", "lunch1"), "2": ("signed_in", "lunch1")},
+        )
+        self.assertEqual(
+            datetime.fromisoformat(response.json()["scans"][0]["signed_in_at"]),
+            LUNCH_TIME,
+        )
+        self.assertEqual(
+            UserActivityEvent.objects.get(user=self.attendees[0]).scanned_at,
+            LUNCH_TIME,
+        )
+
+    def test_invalid_batch(self):
+        response = self._sync()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(UserActivityEvent.objects.exists())
@@ -2,14 +2,22 @@ import re
 from unittest.mock import patch
 from datetime import datetime, timedelta, date
 
+from io import StringIO
+
 from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
 from django.contrib.auth.models import Group
 from django.conf import settings
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 
-from event.models import Profile, User, Team as EventTeam
+from event.eligibility import attendee_index, get_attendee, get_sign_in_error
+from event.models import Profile, User, Team as EventTeam, UserActivityEvent
+from event.sign_in_counts import SignInCounts, sign_in_counts
 from hackathon_site.tests import SetupUserMixin
 from registration.models import Team as RegistrationTeam, Application
 
@@ -27,6 +35,97 @@ from event.serializers import (
 from review.models import Review
 
 
+class AttendeeIndexTestCase(SetupUserMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.application = self._apply()
+        self.review = Review.objects.create(
+            application=self.application,
+            interest=10,
+            experience=10,
+            quality=10,
+            status="Waitlisted",
+        )
+
+    def test_not_built(self):
+        with self.assertRaises(LookupError):
+            attendee_index.get(self.user.email)
+        # Read from the database instead
+        attendee = get_attendee(self.user.email)
+        self.assertEqual(attendee["id"], self.user.id)
+        self.assertEqual(attendee["review_status"], "Waitlisted")
+
+    def test_build(self):
+        other_user = User.objects.create_user(
+            username="bar@foo.com", email="bar@foo.com"
+        )
+        call_command("build_attendee_index", stdout=StringIO())
+
+        with self.assertNumQueries(0):
+            attendee = get_attendee(self.user.email)
+        # Emails which aren't in the index are looked for in the database
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_attendee("nobody@bar.com"))
+        self.assertEqual(
+            attendee,
+            {
+                "id": self.user.id,
+                "first_name": "Test",
+                "last_name": "Bar",
+                "email": "foo@bar.com",
+                "application_id": self.application.id,
+                "student_number": "1234567890",
+                "dietary_restrictions": "halal",
+                "specific_dietary_requirement": "",
+                "rsvp": None,
+                "review_status": "Waitlisted",
+            },
+        )
+        self.assertEqual(
+            get_sign_in_error(get_attendee(other_user.email), other_user.email),
+            f"User bar@foo.com has not applied to {settings.HACKATHON_NAME}",
+        )
+
+    def test_evicted_attendee_read_from_database(self):
+        attendee_index.build()
+        cache.delete(attendee_index._email_key(self.user.email))
+
+        self.assertEqual(get_attendee(self.user.email)["id"], self.user.id)
+        # And added back to the index
+        with self.assertNumQueries(0):
+            self.assertEqual(get_attendee(self.user.email)["id"], self.user.id)
+
+    def test_kept_up_to_date(self):
+        attendee_index.build()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review.status = "Accepted"
+            self.review.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.application.rsvp = True
+            self.application.save()
+        attendee = get_attendee(self.user.email)
+        self.assertEqual(attendee["review_status"], "Accepted")
+        self.assertIsNone(get_sign_in_error(attendee, self.user.email))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.email = "new@bar.com"
+            self.user.save()
+        self.assertIsNone(get_attendee("foo@bar.com"))
+        self.assertEqual(get_attendee("new@bar.com")["id"], self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertIsNone(get_attendee("new@bar.com"))
+
+    def test_login_does_not_refresh(self):
+        attendee_index.build()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.login(username=self.user.username, password=self.password)
+        self.assertEqual(callbacks, [])
+
+
 class ProfileTestCase(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -1041,3 +1140,108 @@ class TeamModelTest(TestCase):
         self.assertTrue(
             hasattr(team, "project_description")
         )  # Check if the project_description field exists
+
+
+@override_settings(
+    SIGN_IN_TIMES=[
+        {
+            "name": "sign_in",
+            "description": "Sign In",
+            "time": datetime.now().replace(tzinfo=settings.TZ_INFO)
+            - timedelta(hours=4),
+        },
+        {
+            "name": "lunch1",
+            "description": "Lunch",
+            "time": datetime.now().replace(tzinfo=settings.TZ_INFO),
+        },
+    ]
+)
+class QRScannerViewTestCase(SetupUserMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.view = reverse("event:qr-scanner")
+        self.user.is_staff = True
+        self.user.save()
+        self.client.login(username=self.user.username, password=self.password)
+
+        self.attendees = []
+        for email in ("tom@bar.com", "jerry@bar.com"):
+            attendee = User.objects.create_user(username=email, email=email)
+            application = self._apply_as_user(attendee, rsvp=True)
+            Review.objects.create(
+                application=application,
+                interest=10,
+                experience=10,
+                quality=10,
+                status="Accepted",
+            )
+            self.attendees.append(attendee)
+        cache.clear()
+
+    def test_sign_in_counts(self):
+        now = datetime.now().replace(tzinfo=settings.TZ_INFO)
+        for attendee in self.attendees:
+            UserActivityEvent.objects.create(
+                user=attendee, event_name="lunch1", scanned_at=now
+            )
+        UserActivityEvent.objects.create(
+            user=self.attendees[0], event_name="sign_in", scanned_at=now
+        )
+        # Not in SIGN_IN_TIMES anymore
+        UserActivityEvent.objects.create(
+            user=self.attendees[0], event_name="dinner1", scanned_at=now
+        )
+
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                UserActivityEvent.objects.get_counts(),
+                {"sign_in": 1, "lunch1": 2, "dinner1": 1},
+            )
+        # Recounted the first time, then read from the cache
+        with self.assertNumQueries(1):
+            self.assertEqual(sign_in_counts.get(), {"sign_in": 1, "lunch1": 2})
+        with self.assertNumQueries(0):
+            self.assertEqual(sign_in_counts.get(), {"sign_in": 1, "lunch1": 2})
+
+        # Until it's time to recount
+        UserActivityEvent.objects.create(
+            user=self.attendees[1], event_name="sign_in", scanned_at=now
+        )
+        self.assertEqual(sign_in_counts.get(), {"sign_in": 1, "lunch1": 2})
+        cache.delete(SignInCounts.reconciled_key)
+        self.assertEqual(sign_in_counts.get(), {"sign_in": 2, "lunch1": 2})
+
+    def test_render(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.view)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The counts are fetched by the page from the API
+        self.assertFalse(
+            any(
+                "event_useractivityevent" in query["sql"]
+                for query in queries.captured_queries
+            )
+        )
+
+    def test_sign_in(self):
+        self.assertEqual(sign_in_counts.get(), {"sign_in": 0, "lunch1": 0})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                self.view, {"email": "tom@bar.com"}, follow=True
+            )
+        self.assertContains(response, "successfully signed in")
+        self.assertEqual(
+            UserActivityEvent.objects.get().event_name, "lunch1",
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(sign_in_counts.get(), {"sign_in": 0, "lunch1": 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                self.view, {"email": "tom@bar.com"}, follow=True
+            )
+        self.assertContains(response, "User tom@bar.com has already signed in!")
+        self.assertEqual(UserActivityEvent.objects.count(), 1)
+        self.assertEqual(sign_in_counts.get(), {"sign_in": 0, "lunch1": 1})
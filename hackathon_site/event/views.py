@@ -12,10 +12,11 @@ from django.views.generic.edit import FormView
 from django.conf import settings
 from django_filters import rest_framework as filters
 
-from rest_framework import generics, mixins
+from rest_framework import generics
 from rest_framework.filters import SearchFilter
 
 
+from hackathon_site.streaming import StreamingListModelMixin
 from hackathon_site.utils import (
     is_registration_open,
     is_hackathon_happening,
@@ -23,11 +24,12 @@ from hackathon_site.utils import (
     get_curr_sign_in_time,
 )
 from registration.forms import JoinTeamForm, SignInForm
-from registration.models import Team as RegistrationTeam, User, Application
+from registration.models import Team as RegistrationTeam
 
 
-from event.models import Team as EventTeam, UserActivity
+from event.models import Team as EventTeam, UserActivityEvent
 from event.serializers import TeamSerializer
+from event.sign_in_counts import sign_in_counts
 from event.api_filters import TeamFilter
 from event.permissions import FullDjangoModelPermissions
 
@@ -198,8 +200,8 @@ class DashboardView(LoginRequiredMixin, FormView):
         return super().post(request, *args, **kwargs)
 
 
-class TeamListView(mixins.ListModelMixin, generics.GenericAPIView):
-    queryset = EventTeam.objects.all()
+class TeamListView(StreamingListModelMixin, generics.GenericAPIView):
+    queryset = EventTeam.objects.all().prefetch_related("profiles__user")
     serializer_class = TeamSerializer
     permission_classes = [FullDjangoModelPermissions]
 
@@ -230,14 +232,6 @@ class QRScannerView(LoginRequiredMixin, FormView):
         if isinstance(context["form"], SignInForm):
             context["sign_in_form"] = context["form"]
 
-        # Get the total number of users who have signed in in each event
-        # Find the all rows that the sign in event is not null
-        # Then count the number of rows for each event
-        context["sign_in_counts"] = {
-            event: UserActivity.objects.filter(**{f"{event}__isnull": False}).count()
-            for event in ["breakfast2", "dinner1", "lunch1", "lunch2", "sign_in"]
-        }
-
         return context
 
     def get_form(self, form_class=None):
@@ -252,39 +246,35 @@ class QRScannerView(LoginRequiredMixin, FormView):
     def form_valid(self, form):
         if isinstance(form, SignInForm):
             try:
-                user = User.objects.get(email__exact=form.cleaned_data["email"])
-                sign_in_event = get_curr_sign_in_time()
+                attendee = form.attendee
+                sign_in_event = get_curr_sign_in_time(return_exception=True)
                 now = datetime.now().replace(tzinfo=settings.TZ_INFO)
-                application = Application.objects.get(user__exact=user)
-
-                try:
-                    user_activity = UserActivity.objects.get(user__exact=user)
-                    if getattr(user_activity, sign_in_event, None) is not None:
-                        messages.error(
-                            self.request,
-                            f'User {form.cleaned_data["email"]} has already signed in!',
-                        )
-                        return redirect(self.get_success_url())
-                    else:
-                        setattr(user_activity, sign_in_event, now)
-                        user_activity.save()
-                except UserActivity.DoesNotExist:
-                    sign_in_obj = {}
-                    sign_in_obj[sign_in_event] = now
-                    UserActivity.objects.create(user=user, **sign_in_obj)
+
+                _, signed_in = UserActivityEvent.objects.get_or_create(
+                    user_id=attendee["id"],
+                    event_name=sign_in_event,
+                    defaults={"scanned_at": now},
+                )
+                if not signed_in:
+                    messages.error(
+                        self.request,
+                        f'User {form.cleaned_data["email"]} has already signed in!',
+                    )
+                    return redirect(self.get_success_url())
+                sign_in_counts.incr(sign_in_event)
 
                 # Return the information need, and each information will start on a new line
 
                 return_string = (
-                    (user.first_name + " " + user.last_name)
+                    (attendee["first_name"] + " " + attendee["last_name"])
                     + " successfully signed in."
                     + " 🎓 Student Number: "
-                    + str(application.student_number)
+                    + str(attendee["student_number"])
                     + (
-                        " 🍽️ Dietary Restrictions: " + application.dietary_restrictions
-                        if application.specific_dietary_requirement == ""
+                        " 🍽️ Dietary Restrictions: " + attendee["dietary_restrictions"]
+                        if attendee["specific_dietary_requirement"] == ""
                         else " 🥗 Specific Dietary Requirement: "
-                        + application.specific_dietary_requirement
+                        + attendee["specific_dietary_requirement"]
                     )
                 )
 
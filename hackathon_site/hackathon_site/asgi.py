@@ -9,8 +9,19 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "hackathon_site.settings")
 
-application = get_asgi_application()
+# What get_asgi_application does, with a handler that can stream query results
+django.setup(set_prefix=False)
+
+from hackathon_site.push import EventStreamApplication  # noqa: E402
+from hackathon_site.streaming import StreamingASGIHandler  # noqa: E402
+from hardware.push import get_user_channels  # noqa: E402
+
+django_application = StreamingASGIHandler()
+
+application = EventStreamApplication(
+    django_application, "/api/hardware/events/", get_user_channels
+)
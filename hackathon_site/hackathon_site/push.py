@@ -0,0 +1,282 @@
+"""
+Server-sent events pushed to browsers over ASGI. Messages are published to
+named channels through a broker, and every open event stream receives the
+messages of the channels its user may see.
+
+RedisBroker shares messages between all worker processes through Redis pub/sub,
+with a single subscription per process however many clients are connected.
+LocalBroker only delivers messages within the current process, which is enough
+for tests and a single development server. Delivery is best effort: messages
+published while a stream is reconnecting are lost, so clients should refetch
+whatever they display when a stream (re)opens.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from importlib import import_module
+from io import BytesIO
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def encode_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+class Subscription:
+    """
+    The pending messages of one event stream. Messages are delivered from any
+    thread and read from the event loop serving the stream.
+    """
+
+    def __init__(self, channels, max_pending):
+        self.channels = frozenset(channels)
+        self.loop = asyncio.get_event_loop()
+        self.queue = asyncio.Queue(maxsize=max_pending)
+
+    def deliver(self, message):
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # The client isn't keeping up. Drop what it hasn't read, and tell it
+            # to start over from a fresh fetch.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class LocalBroker:
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels):
+        """
+        Must be called from the event loop which will read the subscription
+        """
+        subscription = Subscription(channels, settings.PUSH_MAX_PENDING_MESSAGES)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions[channel].discard(subscription)
+                if not self._subscriptions[channel]:
+                    del self._subscriptions[channel]
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+    def deliver(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+
+class RedisBroker(LocalBroker):
+    """
+    Publishes to Redis, and delivers what every process published to this
+    process' subscriptions from a listener thread.
+    """
+
+    reconnect_delay = 1
+
+    def __init__(self):
+        super().__init__()
+        self.prefix = settings.PUSH_CHANNEL_PREFIX
+        self._listener = None
+
+    @staticmethod
+    def _get_connection():
+        from django_redis import get_redis_connection
+
+        return get_redis_connection("default")
+
+    def subscribe(self, channels):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, name="push-broker", daemon=True
+                )
+                self._listener.start()
+        return super().subscribe(channels)
+
+    def publish(self, channel, message):
+        self._get_connection().publish(f"{self.prefix}{channel}", message)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._get_connection().pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f"{self.prefix}*")
+                for message in pubsub.listen():
+                    channel = message["channel"].decode()[len(self.prefix) :]
+                    self.deliver(channel, message["data"].decode())
+            except Exception:
+                logger.exception("Lost the push subscription to Redis, reconnecting")
+                time.sleep(self.reconnect_delay)
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.PUSH_BROKER)()
+        return _broker
+
+
+def publish(channel, event, data):
+    """
+    Push an event to every stream subscribed to the channel. Call this once the
+    change being announced is committed (e.g. from transaction.on_commit), so
+    that clients which refetch on the event see it.
+    """
+    try:
+        get_broker().publish(channel, encode_event(event, data))
+    except Exception:
+        # Clients get the change on their next fetch anyway, so a broker outage
+        # mustn't fail the request which made it
+        logger.exception("Failed to publish %s event to %s", event, channel)
+
+
+class EventStreamApplication:
+    """
+    ASGI application which answers requests for path with a text/event-stream
+    of the messages published to the channels get_channels(user) returns, and
+    passes every other request to the Django application.
+
+    Users are authenticated with their session cookie, since browsers' EventSource
+    can't send any other credentials.
+    """
+
+    def __init__(self, application, path, get_channels):
+        self.application = application
+        self.path = path
+        self.get_channels = get_channels
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            return await self.application(scope, receive, send)
+
+        channels = await sync_to_async(self.get_user_channels)(scope)
+        if channels is None:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 401,
+                    "headers": [(b"content-type", b"application/json")],
+                }
+            )
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": b'{"detail":"Authentication credentials were not provided."}',
+                }
+            )
+            return
+
+        broker = get_broker()
+        subscription = broker.subscribe(channels)
+        try:
+            await self.stream(subscription, receive, send)
+        finally:
+            broker.unsubscribe(subscription)
+
+    def get_user_channels(self, scope):
+        close_old_connections()
+        try:
+            request = ASGIRequest(scope, BytesIO())
+            engine = import_module(settings.SESSION_ENGINE)
+            request.session = engine.SessionStore(
+                request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+            )
+            user = get_user(request)
+            if not user.is_authenticated:
+                return None
+            return self.get_channels(user)
+        finally:
+            close_old_connections()
+
+    async def stream(self, subscription, receive, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    # Stop nginx from buffering the stream
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        await send(
+            {
+                "type": "http.response.body",
+                "body": b"retry: 3000\n\n",
+                "more_body": True,
+            }
+        )
+
+        disconnected = asyncio.ensure_future(self._wait_for_disconnect(receive))
+        try:
+            while True:
+                message = asyncio.ensure_future(subscription.queue.get())
+                done, _ = await asyncio.wait(
+                    {message, disconnected},
+                    timeout=settings.PUSH_KEEPALIVE_SECONDS,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if disconnected in done:
+                    message.cancel()
+                    return
+                if message not in done:
+                    # Comments keep proxies from closing an idle connection
+                    message.cancel()
+                    body = ": keepalive\n\n"
+                elif message.result() is None:
+                    break
+                else:
+                    body = message.result()
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": body.encode(),
+                        "more_body": True,
+                    }
+                )
+
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": encode_event("resync", {}).encode(),
+                }
+            )
+        finally:
+            disconnected.cancel()
+
+    @staticmethod
+    async def _wait_for_disconnect(receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
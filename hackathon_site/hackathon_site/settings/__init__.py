@@ -201,6 +201,12 @@ CACHES = {
     }
 }
 
+# Server-sent events, see hackathon_site.push
+PUSH_BROKER = "hackathon_site.push.RedisBroker"
+PUSH_CHANNEL_PREFIX = "push:"
+PUSH_KEEPALIVE_SECONDS = 15
+PUSH_MAX_PENDING_MESSAGES = 100
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
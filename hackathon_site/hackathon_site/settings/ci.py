@@ -32,6 +32,9 @@ CACHES = {
     }
 }
 
+# Push events to streams in this process only, rather than through redis
+PUSH_BROKER = "hackathon_site.push.LocalBroker"
+
 # For testing, make the media root a local folder to avoid
 # permissions errors
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
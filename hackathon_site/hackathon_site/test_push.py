@@ -0,0 +1,152 @@
+import json
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.test import TestCase, override_settings
+
+from hackathon_site.asgi import application
+from hackathon_site.push import EventStreamApplication, encode_event, get_broker
+from hackathon_site.tests import SetupUserMixin
+from hardware.models import Hardware
+
+
+async def inner_application(scope, receive, send):
+    await send({"type": "http.response.start", "status": 204, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+class CommunicatorMixin:
+    def _get_communicator(self, path=None, query_string=b""):
+        headers = [(b"host", b"testserver")]
+        if settings.SESSION_COOKIE_NAME in self.client.cookies:
+            session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+            headers.append(
+                (b"cookie", f"{settings.SESSION_COOKIE_NAME}={session_key}".encode())
+            )
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": path or self.path,
+            "root_path": "",
+            "query_string": query_string,
+            "headers": headers,
+        }
+        return ApplicationCommunicator(self.application, scope)
+
+
+@patch("hackathon_site.push.close_old_connections")
+class EventStreamApplicationTestCase(CommunicatorMixin, SetupUserMixin, TestCase):
+    path = "/api/hardware/events/"
+
+    def setUp(self):
+        super().setUp()
+        self.application = EventStreamApplication(
+            inner_application, self.path, lambda user: ["everyone", f"user.{user.id}"]
+        )
+
+    async def _open_stream(self):
+        communicator = self._get_communicator()
+        await communicator.send_input({"type": "http.request", "body": b""})
+        start = await communicator.receive_output()
+        self.assertEqual(start["status"], 200)
+        self.assertIn((b"content-type", b"text/event-stream"), start["headers"])
+        self.assertEqual(
+            (await communicator.receive_output())["body"], b"retry: 3000\n\n"
+        )
+        return communicator
+
+    async def test_other_paths_go_to_django(self, _):
+        communicator = self._get_communicator(path="/api/hardware/hardware/")
+        await communicator.send_input({"type": "http.request", "body": b""})
+        self.assertEqual((await communicator.receive_output())["status"], 204)
+
+    async def test_user_not_logged_in(self, _):
+        communicator = self._get_communicator()
+        await communicator.send_input({"type": "http.request", "body": b""})
+        self.assertEqual((await communicator.receive_output())["status"], 401)
+
+    async def test_streams_subscribed_channels(self, _):
+        await sync_to_async(self._login)()
+        communicator = await self._open_stream()
+
+        get_broker().publish("user.0", encode_event("order", {"id": 2}))
+        get_broker().publish(f"user.{self.user.id}", encode_event("order", {"id": 1}))
+        get_broker().publish("everyone", encode_event("stock", {"version": 3}))
+
+        self.assertEqual(
+            (await communicator.receive_output())["body"],
+            b'event: order\ndata: {"id": 1}\n\n',
+        )
+        self.assertEqual(
+            (await communicator.receive_output())["body"],
+            b'event: stock\ndata: {"version": 3}\n\n',
+        )
+
+        await communicator.send_input({"type": "http.disconnect"})
+        await communicator.wait()
+        self.assertEqual(get_broker()._subscriptions, {})
+
+    @override_settings(PUSH_KEEPALIVE_SECONDS=0.01)
+    async def test_keepalive(self, _):
+        await sync_to_async(self._login)()
+        communicator = await self._open_stream()
+        self.assertEqual(
+            (await communicator.receive_output())["body"], b": keepalive\n\n"
+        )
+        await communicator.send_input({"type": "http.disconnect"})
+        await communicator.wait()
+
+    @override_settings(PUSH_MAX_PENDING_MESSAGES=2)
+    async def test_slow_client_resyncs(self, _):
+        await sync_to_async(self._login)()
+        communicator = await self._open_stream()
+
+        # Nothing is read from the queue until the application gets to run again
+        for _ in range(3):
+            get_broker().deliver("everyone", encode_event("stock", {}))
+
+        output = await communicator.receive_output()
+        self.assertEqual(output["body"], b"event: resync\ndata: {}\n\n")
+        self.assertFalse(output.get("more_body", False))
+        await communicator.wait()
+
+
+class ASGIApplicationTestCase(CommunicatorMixin, SetupUserMixin, TestCase):
+    application = application
+
+    def setUp(self):
+        super().setUp()
+        # Like the test client, keep the test's connection (and transaction) open
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+
+        self.hardware = Hardware.objects.create(
+            name="hardware",
+            model_number="model",
+            manufacturer="manufacturer",
+            datasheet="/datasheet/location/",
+            quantity_available=1,
+            max_per_team=1,
+            picture="/picture/location",
+        )
+
+    async def test_stream_query_results(self):
+        await sync_to_async(self._login)()
+        communicator = self._get_communicator(
+            path="/api/hardware/hardware/", query_string=b"stream=json"
+        )
+        await communicator.send_input({"type": "http.request", "body": b""})
+        self.assertEqual((await communicator.receive_output())["status"], 200)
+
+        body = b""
+        while True:
+            message = await communicator.receive_output()
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+        self.assertEqual([row["id"] for row in json.loads(body)], [self.hardware.id])
@@ -33,13 +33,23 @@ def is_hackathon_happening():
     return settings.EVENT_START_DATE <= now < settings.EVENT_END_DATE
 
 
-def get_curr_sign_in_time(use_description=False, return_exception=False):
-    now = datetime.now().replace(tzinfo=settings.TZ_INFO)
+def get_sign_in_time(time, use_description=False):
+    """
+    The sign in event happening at the given time, or None
+    """
     for event in settings.SIGN_IN_TIMES:
         start_interval = event["time"] - relativedelta(hours=1)
         end_interval = event["time"] + relativedelta(hours=2)
-        if start_interval <= now <= end_interval:
+        if start_interval <= time <= end_interval:
             return event["description"] if use_description else event["name"]
+    return None
+
+
+def get_curr_sign_in_time(use_description=False, return_exception=False):
+    now = datetime.now().replace(tzinfo=settings.TZ_INFO)
+    event = get_sign_in_time(now, use_description)
+    if event is not None:
+        return event
 
     if use_description or not return_exception:
         return None
@@ -4,16 +4,72 @@ from urllib.parse import urlparse
 import requests
 from client_side_image_cropping import ClientsideCroppingWidget, DcsicAdminMixin
 from django import forms
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.models import ADDITION, CHANGE, LogEntry
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.contrib.contenttypes.models import ContentType
 from django.core.files.base import ContentFile
-from django.db import models
+from django.db import models, transaction
 from django.utils.html import mark_safe
-from import_export import resources
 from import_export.admin import ImportMixin
+from import_export.results import RowResult
 from import_export.widgets import ManyToManyWidget
 from import_export.fields import Field
 
-from hardware.models import Hardware, Category, Order, Incident, OrderItem
+from hardware.importing import BulkImportResource, CategoryImporter, HardwareImporter
+from hardware.models import (
+    Hardware,
+    Category,
+    Order,
+    Incident,
+    OrderItem,
+    QueuedEmail,
+)
+from hardware.serializers import OrderStatusBulkChangeSerializer
+from hardware.views import OrderStatusBulkChangeView
+
+
+class HardwareStockLookup:
+    """
+    The quantity remaining of every hardware on an admin page, fetched with one
+    annotated query the first time any of them is needed.
+    """
+
+    def __init__(self, hardware_ids):
+        self.hardware_ids = hardware_ids
+        self._quantities = None
+
+    def __getitem__(self, hardware_id):
+        if self._quantities is None:
+            self._quantities = dict(
+                Hardware.objects.filter(pk__in=self.hardware_ids).values_list(
+                    "id", "quantity_remaining"
+                )
+            )
+        return self._quantities[hardware_id]
+
+
+class HardwareStockMixin:
+    """
+    For inlines of a model with a hardware foreign key, looks up the quantity
+    remaining of every row's hardware at once. Inlines are instantiated for each
+    request, so the lookup only lives as long as the page. parent_field is the
+    foreign key to the object being edited.
+    """
+
+    parent_field = None
+
+    def quantity_remaining(self, obj):
+        if obj.hardware_id is None:
+            return None
+        if getattr(self, "hardware_stock", None) is None:
+            parent_id = getattr(obj, f"{self.parent_field}_id")
+            self.hardware_stock = HardwareStockLookup(
+                self.model.objects.filter(**{self.parent_field: parent_id}).values(
+                    "hardware_id"
+                )
+            )
+        return self.hardware_stock[obj.hardware_id]
 
 
 class OrderInline(admin.TabularInline):
@@ -23,8 +79,9 @@ class OrderInline(admin.TabularInline):
     readonly_fields = ("id", "updated_at", "created_at")
 
 
-class HardwareCategoryInline(admin.TabularInline):
+class HardwareCategoryInline(HardwareStockMixin, admin.TabularInline):
     model = Hardware.categories.through
+    parent_field = "category"
     extra = 0
     readonly_fields = (
         "hardware",
@@ -38,7 +95,7 @@ class HardwareCategoryInline(admin.TabularInline):
     )
 
     def get_queryset(self, request):
-        return super().get_queryset(request).prefetch_related("hardware")
+        return super().get_queryset(request).select_related("hardware")
 
     @staticmethod
     def name(obj):
@@ -61,19 +118,50 @@ class HardwareCategoryInline(admin.TabularInline):
     def quantity_available(obj):
         return obj.hardware.quantity_available
 
-    @staticmethod
-    def quantity_remaining(obj):
-        return obj.hardware.quantity_remaining
-
     @staticmethod
     def max_per_team(obj):
         return obj.hardware.max_per_team
 
 
+class SelectedAutocompleteSelect(AutocompleteSelect):
+    """
+    An autocomplete widget which labels its selected option with an object
+    already fetched, rather than querying for it. Falls back to the query if
+    the value is anything else, e.g. after a failed submission.
+    """
+
+    selected = None
+
+    def optgroups(self, name, value, attr=None):
+        if self.selected is None or [str(v) for v in value] != [str(self.selected.pk)]:
+            return super().optgroups(name, value, attr)
+
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, "", "", False, 0))
+        options.append(
+            self.create_option(
+                name,
+                self.selected.pk,
+                self.choices.field.label_from_instance(self.selected),
+                True,
+                len(options),
+            )
+        )
+        return [(None, options, 0)]
+
+
 class OrderItemForm(forms.ModelForm):
     class Meta:
         model = OrderItem
-        fields = ("hardware", "part_returned_health")
+        fields = ("hardware", "quantity", "part_returned_health")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.hardware_id is not None:
+            # Selected by OrderItemInline.get_queryset along with the item
+            widget = self.fields["hardware"].widget
+            getattr(widget, "widget", widget).selected = self.instance.hardware
 
     def clean_hardware(self):
         value = self.cleaned_data["hardware"]
@@ -85,8 +173,9 @@ class OrderItemForm(forms.ModelForm):
         return value
 
 
-class OrderItemInline(admin.TabularInline):
+class OrderItemInline(HardwareStockMixin, admin.TabularInline):
     model = OrderItem
+    parent_field = "order"
     form = OrderItemForm
     extra = 0
     autocomplete_fields = ("hardware",)
@@ -110,6 +199,13 @@ class OrderItemInline(admin.TabularInline):
             .prefetch_related("hardware__categories")
         )
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == "hardware":
+            kwargs["widget"] = SelectedAutocompleteSelect(
+                db_field, self.admin_site, using=kwargs.get("using")
+            )
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
     @staticmethod
     def name(obj: OrderItem):
         return obj.hardware.name
@@ -131,19 +227,6 @@ class OrderItemInline(admin.TabularInline):
     def quantity_available(obj: OrderItem):
         return obj.hardware.quantity_available
 
-    @staticmethod
-    def quantity_remaining(obj: OrderItem):
-        """
-        Get the quantity remaining by querying the Hardware model, which has the
-        necessary annotations.
-
-        This is quite inefficient, as every order item will generate a database
-        hit. That admin site should not be used heavily, so that's fine. If
-        performance becomes an issue, the hardware queryset can be cached on
-        a per-request basis to use here (probably in OrderAdmin.get_queryset).
-        """
-        return Hardware.objects.get(id=obj.hardware_id).quantity_remaining
-
     @staticmethod
     def max_per_team(obj: OrderItem):
         return obj.hardware.max_per_team
@@ -159,7 +242,7 @@ class IncidentInline(admin.TabularInline):
     verbose_name_plural = "Incidents"
     extra = 0
     readonly_fields = ("hardware", "state", "description", "time_occurred")
-    exclude = ("part_returned_health",)
+    exclude = ("quantity", "part_returned_health")
 
     @staticmethod
     def state(obj: OrderItem):
@@ -177,7 +260,7 @@ class IncidentInline(admin.TabularInline):
         return (
             super()
             .get_queryset(request)
-            .select_related("incident")
+            .select_related("incident", "hardware")
             .filter(incident__isnull=False)
         )
 
@@ -185,27 +268,62 @@ class IncidentInline(admin.TabularInline):
         return False
 
 
-class CategoryResource(resources.ModelResource):
+class BulkImportMixin:
+    """
+    For ImportMixin admins, logs the changes of an import with one query rather
+    than one per row
+    """
+
+    def generate_log_entries(self, result, request):
+        if self.get_skip_admin_log():
+            return
+
+        action_flags = {
+            RowResult.IMPORT_TYPE_NEW: ADDITION,
+            RowResult.IMPORT_TYPE_UPDATE: CHANGE,
+        }
+        content_type_id = ContentType.objects.get_for_model(self.model).pk
+        LogEntry.objects.bulk_create(
+            LogEntry(
+                user_id=request.user.pk,
+                content_type_id=content_type_id,
+                object_id=str(row.object_id),
+                object_repr=row.object_repr[:200],
+                action_flag=action_flags[row.import_type],
+                change_message=f"{row.import_type} through import_export",
+            )
+            for row in result
+            if row.import_type in action_flags
+        )
+
+
+class CategoryResource(BulkImportResource):
+    importer_class = CategoryImporter
+
     class Meta:
         model = Category
         exclude = (
             "id",
             "created_at",
             "updated_at",
+            "version",
         )
         import_id_fields = ("name",)
 
 
 @admin.register(Category)
-class CategoryAdmin(ImportMixin, admin.ModelAdmin):
+class CategoryAdmin(BulkImportMixin, ImportMixin, admin.ModelAdmin):
     resource_class = CategoryResource
     list_display = ("id", "name", "max_per_team")
     list_display_links = ("id", "name")
     search_fields = ("id", "name")
+    exclude = ("version",)
     inlines = (HardwareCategoryInline,)
 
 
-class HardwareResource(resources.ModelResource):
+class HardwareResource(BulkImportResource):
+    importer_class = HardwareImporter
+
     categories = Field(
         column_name="categories",
         attribute="categories",
@@ -219,6 +337,12 @@ class HardwareResource(resources.ModelResource):
             "created_at",
             "updated_at",
             "picture",
+            "picture_derivatives",
+            "image_mirror",
+            "quantity_checked_out",
+            "search_document",
+            "search_vector",
+            "version",
         )
         import_id_fields = (
             "name",
@@ -228,7 +352,7 @@ class HardwareResource(resources.ModelResource):
 
 
 @admin.register(Hardware)
-class HardwareAdmin(DcsicAdminMixin, ImportMixin, admin.ModelAdmin):
+class HardwareAdmin(DcsicAdminMixin, BulkImportMixin, ImportMixin, admin.ModelAdmin):
     resource_class = HardwareResource
     list_display = (
         "id",
@@ -243,6 +367,14 @@ class HardwareAdmin(DcsicAdminMixin, ImportMixin, admin.ModelAdmin):
     list_display_links = ("id", "name")
     search_fields = ("id", "name", "model_number", "manufacturer")
     autocomplete_fields = ("categories",)
+    readonly_fields = ("quantity_checked_out",)
+    exclude = (
+        "picture_derivatives",
+        "image_mirror",
+        "search_document",
+        "search_vector",
+        "version",
+    )
     formfield_overrides = {
         models.ImageField: {
             "widget": ClientsideCroppingWidget(
@@ -277,6 +409,12 @@ class OrderAdmin(admin.ModelAdmin):
     )
     list_select_related = True
     autocomplete_fields = ("team",)
+    actions = (
+        "mark_ready_for_pickup",
+        "mark_picked_up",
+        "mark_returned",
+        "mark_cancelled",
+    )
 
     def get_queryset(self, request):
         return super().get_queryset(request).select_related("team")
@@ -285,6 +423,54 @@ class OrderAdmin(admin.ModelAdmin):
     def get_team_code(self, obj: Order):
         return obj.team.team_code if obj.team else None
 
+    def change_status(self, request, queryset, new_status):
+        """
+        Change the status of every selected order the same way as the bulk
+        status change API, so the teams are notified and stock is updated
+        """
+        order_ids = sorted(queryset.values_list("id", flat=True))
+        serializer = OrderStatusBulkChangeSerializer(
+            data={
+                "orders": [
+                    {"id": order_id, "status": new_status} for order_id in order_ids
+                ]
+            }
+        )
+        with transaction.atomic():
+            if not serializer.is_valid():
+                for order_id, errors in zip(order_ids, serializer.errors["orders"]):
+                    for message in errors.get("status", []):
+                        self.message_user(
+                            request, f"Order {order_id}: {message}", messages.ERROR
+                        )
+                self.message_user(
+                    request, "No orders were changed.", messages.ERROR,
+                )
+                return
+            orders = serializer.save()
+            OrderStatusBulkChangeView.queue_notifications(orders)
+        self.message_user(
+            request,
+            f"Changed the status of {len(orders)} order(s) to {new_status}.",
+            messages.SUCCESS,
+        )
+
+    @admin.action(permissions=["change"], description="Mark as Ready for Pickup")
+    def mark_ready_for_pickup(self, request, queryset):
+        self.change_status(request, queryset, "Ready for Pickup")
+
+    @admin.action(permissions=["change"], description="Mark as Picked Up")
+    def mark_picked_up(self, request, queryset):
+        self.change_status(request, queryset, "Picked Up")
+
+    @admin.action(permissions=["change"], description="Mark as Returned")
+    def mark_returned(self, request, queryset):
+        self.change_status(request, queryset, "Returned")
+
+    @admin.action(permissions=["change"], description="Cancel")
+    def mark_cancelled(self, request, queryset):
+        self.change_status(request, queryset, "Cancelled")
+
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
@@ -292,6 +478,7 @@ class OrderItemAdmin(admin.ModelAdmin):
         "id",
         "order_id",
         "hardware_id",
+        "quantity",
         "part_returned_health",
     )
     search_fields = ("id", "order__team__team_code", "hardware__name")
@@ -315,3 +502,11 @@ class IncidentAdmin(admin.ModelAdmin):
         return (
             obj.order_item.order.team.team_code if obj.order_item.order.team else None
         )
+
+
+@admin.register(QueuedEmail)
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ("id", "subject", "attempts", "next_attempt_at", "sent_at")
+    list_filter = (("sent_at", admin.EmptyFieldListFilter),)
+    search_fields = ("subject", "recipient_list")
+    readonly_fields = ("attempts", "last_error", "sent_at", "created_at")
@@ -1,7 +1,14 @@
+import re
+
 from django import forms
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Case, F, IntegerField, Value, When
 from django_filters import rest_framework as filters, widgets
+from rest_framework.filters import SearchFilter
 
 from hardware.models import Hardware, Order, Incident, OrderItem
+from hardware.search import SEARCH_CONFIG, TrigramWordSimilarity
 from hardware.serializers import (
     HardwareSerializer,
     OrderListSerializer,
@@ -59,8 +66,10 @@ class HardwareFilter(filters.FilterSet):
         help_text="Comma separated list of hardware IDs",
     )
 
+    # Hardware in several of the categories would be returned once for each
     category_ids = IntegerCSVFilter(
         field_name="categories",
+        distinct=True,
         label="Comma separated list of category IDs",
         help_text="Comma separated list of category IDs",
     )
@@ -81,3 +90,55 @@ class OrderFilter(filters.FilterSet):
         label="Comma separated list of statuses",
         help_text="Comma separated list of statuses",
     )
+
+
+class HardwareSearchFilter(SearchFilter):
+    """
+    Search hardware by name, model number, manufacturer and category names,
+    ordered by relevance unless another ordering is requested. On postgres each
+    word matches as a prefix, and if nothing matches, near misses are found by
+    trigram similarity instead. Both are served from GIN indexes (see
+    hardware.search).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        if connections[queryset.db].vendor != "postgresql":
+            return self.filter_queryset_fallback(queryset, terms)
+
+        words = re.findall(r"\w+", " ".join(terms))
+        if not words:
+            return queryset.none()
+
+        query = SearchQuery(
+            " & ".join(f"{word}:*" for word in words),
+            search_type="raw",
+            config=SEARCH_CONFIG,
+        )
+        matches = queryset.filter(search_vector=query)
+        if matches.exists():
+            # Normalised by document length, so that focused names rank higher
+            rank = SearchRank(F("search_vector"), query, normalization=2)
+        else:
+            text = " ".join(words)
+            matches = queryset.filter(search_document__trigram_word_similar=text)
+            rank = TrigramWordSimilarity(text, "search_document")
+        return matches.annotate(search_rank=rank).order_by("-search_rank", "name")
+
+    @staticmethod
+    def filter_queryset_fallback(queryset, terms):
+        for term in terms:
+            queryset = queryset.filter(search_document__icontains=term)
+        text = " ".join(terms)
+        return queryset.annotate(
+            search_rank=Case(
+                When(name__iexact=text, then=Value(3)),
+                When(name__istartswith=text, then=Value(2)),
+                When(name__icontains=text, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        ).order_by("-search_rank", "name")
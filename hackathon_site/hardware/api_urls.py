@@ -6,7 +6,18 @@ app_name = "hardware"
 
 urlpatterns = [
     path("hardware/", views.HardwareListView.as_view(), name="hardware-list"),
+    path(
+        "hardware/changes/",
+        views.HardwareChangesView.as_view(),
+        name="hardware-changes",
+    ),
+    path("holds/", views.CartHoldView.as_view(), name="cart-hold"),
     path("orders/returns/", views.OrderItemReturnView.as_view(), name="order-return"),
+    path(
+        "orders/status/",
+        views.OrderStatusBulkChangeView.as_view(),
+        name="order-status-bulk-change",
+    ),
     path("orders/", views.OrderListView.as_view(), name="order-list"),
     path("categories/", views.CategoryListView.as_view(), name="category-list"),
     path("incidents/", views.IncidentListView.as_view(), name="incident-list"),
@@ -0,0 +1,217 @@
+"""
+Read-through cache for the serialized hardware catalog (the hardware and
+category lists), in two tiers: a small LRU in each worker process in front of
+the shared django cache (redis).
+
+Entries are keyed on a generation number kept in the shared cache, which
+hardware.signals increments whenever a change to hardware or categories
+commits. Workers only re-read the generation every generation_ttl seconds, so
+their local entries can be up to that stale, in exchange for answering most
+requests from memory.
+
+Stock changes with every order, so it's cached apart from the pages, per result
+and only briefly: CatalogCacheMixin overlays the views' live_fields (e.g.
+quantity_remaining) on the cached page. Those entries are keyed on a stock
+generation which is also bumped by changes to quantities checked out, and read
+from the shared cache on every request.
+"""
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from rest_framework.response import Response
+
+
+class CatalogCache:
+    key_prefix = "hardware:catalog"
+    generation_key = "hardware:catalog:generation"
+    stock_generation_key = "hardware:catalog:stock_generation"
+
+    timeout = 300
+    local_max_entries = 128
+    generation_ttl = 1
+    # Bounds how long stock read from the database just before it changed can
+    # outlive the stock generation being bumped
+    stock_timeout = 5
+    # How long a recompute may hold a key before another worker takes over
+    lock_timeout = 10
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Striped, so concurrent requests for different keys rarely wait on
+        # each other and the number of locks stays bounded
+        self._key_locks = [threading.Lock() for _ in range(32)]
+        self._generation = None
+        self._generation_checked_at = 0
+
+    def get_generation(self):
+        now = time.monotonic()
+        with self._lock:
+            if (
+                self._generation is not None
+                and now - self._generation_checked_at < self.generation_ttl
+            ):
+                return self._generation
+
+        generation = self._read_counter(self.generation_key)
+        self._set_generation(generation, now)
+        return generation
+
+    def _read_counter(self, key):
+        value = cache.get(key)
+        if value is None:
+            # Start from the clock rather than 1, so that a generation evicted
+            # from the cache can't come back with the number of an old one
+            cache.add(key, int(time.time() * 1000), timeout=None)
+            value = cache.get(key)
+        return value
+
+    def _incr_counter(self, key):
+        try:
+            return cache.incr(key)
+        except ValueError:
+            return self._read_counter(key)
+
+    def _set_generation(self, generation, checked_at):
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+            self._generation = generation
+            self._generation_checked_at = checked_at
+
+    def invalidate(self):
+        generation = self._incr_counter(self.generation_key)
+        self._set_generation(generation, time.monotonic())
+        # Changes to the catalog (e.g. to quantity_available) may change stock too
+        self.invalidate_stock()
+
+    def invalidate_stock(self):
+        self._incr_counter(self.stock_generation_key)
+
+    def _get_local(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def _set_local(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.local_max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        """
+        Get the value for key from the local or shared cache, or compute and
+        cache it. However many requests miss at once, only one of them per key
+        in each worker calls compute and the others in the worker wait for its
+        result. Only one worker at a time caches it, the rest compute it
+        themselves rather than waiting.
+        """
+        key = f"{self.key_prefix}:{self.get_generation()}:{key}"
+        value = self._get_local(key)
+        if value is not None:
+            return value
+
+        with self._key_locks[hash(key) % len(self._key_locks)]:
+            value = self._get_local(key)
+            if value is None:
+                value = self._get_shared(key, compute)
+                self._set_local(key, value)
+        return value
+
+    def _get_shared(self, key, compute):
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+        lock_key = f"{key}:lock"
+        if not cache.add(lock_key, True, timeout=self.lock_timeout):
+            # Another worker is already computing it. Read the database too
+            # rather than waiting on it, but leave caching it to that worker.
+            return compute()
+
+        try:
+            value = compute()
+            cache.set(key, value, timeout=self.timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    def get_stock(self, key, ids, compute):
+        """
+        Get the stock of each of ids from the shared cache, calling compute with
+        the ids that missed to read them from the database, in one go. compute
+        returns a dict of id -> value.
+        """
+        prefix = f"{self.key_prefix}:stock:{self._read_counter(self.stock_generation_key)}:{key}"
+        keys = {id: f"{prefix}:{id}" for id in ids}
+        cached = cache.get_many(list(keys.values()))
+        values = {id: cached[keys[id]] for id in ids if keys[id] in cached}
+
+        missing = [id for id in ids if id not in values]
+        if missing:
+            computed = compute(missing)
+            cache.set_many(
+                {keys[id]: value for id, value in computed.items()},
+                timeout=self.stock_timeout,
+            )
+            values.update(computed)
+        return values
+
+
+catalog_cache = CatalogCache()
+
+
+class CatalogCacheMixin:
+    """
+    Serve a list view's responses through the catalog cache. The response can't
+    depend on the user, only on the request's URL.
+
+    The live_fields of each result are cached separately from the page, since
+    they change without the catalog being invalidated, see CatalogCache.get_stock.
+    Requests whose results are filtered or ordered by them aren't cached at all,
+    see is_cacheable.
+    """
+
+    live_fields = ()
+
+    def is_cacheable(self, request):
+        stream_query_param = getattr(self, "stream_query_param", None)
+        return stream_query_param not in request.query_params
+
+    def get_live_values(self, ids):
+        """
+        A dict of id -> {field: value} of the live_fields of the given results,
+        read from the database
+        """
+        rows = self.get_queryset().filter(pk__in=ids).values("pk", *self.live_fields)
+        return {row.pop("pk"): row for row in rows}
+
+    def _apply_live_fields(self, data):
+        results = data["results"] if isinstance(data, dict) else data
+        live_values = catalog_cache.get_stock(
+            self.request.path, [item["id"] for item in results], self.get_live_values
+        )
+        results = [{**item, **live_values.get(item["id"], {})} for item in results]
+        return {**data, "results": results} if isinstance(data, dict) else results
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super().list(request, *args, **kwargs)
+
+        # The URL includes the host, which the picture URLs are built with
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        key = f"{request.build_absolute_uri(request.path)}?{query}"
+        data = catalog_cache.get_or_compute(
+            key,
+            lambda: super(CatalogCacheMixin, self).list(request, *args, **kwargs).data,
+        )
+        if self.live_fields:
+            data = self._apply_live_fields(data)
+        return Response(data)
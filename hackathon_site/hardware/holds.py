@@ -0,0 +1,216 @@
+"""
+Short-lived holds on the hardware in teams' carts, so that stock a team has put
+in its cart isn't taken by another team before the order is submitted.
+
+Holds live only in the shared django cache (redis). Each team has at most one
+hold, which is replaced whenever its cart changes and expires after timeout
+seconds unless it is renewed. Submitting an order turns the team's hold into
+order items and releases it.
+
+The total held of each hardware is kept in counters bucketed by when the holds
+in them expire, which are only changed with cache.incr (INCRBY on redis) so
+concurrent holds can't clobber each other. The total is the sum of the buckets
+which haven't expired yet, so expired holds drop out of it without anything
+having to clean up after them. Holds can outlive timeout by up to one bucket.
+Each bucket also keeps the set of hardware held in it, so that reading the
+holds on a page of hardware only fetches the counters of hardware which are
+actually held.
+"""
+import time
+from contextlib import contextmanager
+from uuid import uuid4
+
+from django.core.cache import cache
+
+
+class HoldLocked(Exception):
+    """
+    Raised when a lock on the holds couldn't be taken within lock_timeout,
+    because another request is holding it
+    """
+
+
+class StockHolds:
+    key_prefix = "hardware:hold"
+
+    timeout = 600
+    bucket_seconds = 60
+    # How long a team's hold may be locked while it is replaced
+    lock_timeout = 5
+    lock_poll_interval = 0.05
+
+    def _team_key(self, team_id):
+        return f"{self.key_prefix}:team:{team_id}"
+
+    def _counter_key(self, hardware_id, bucket):
+        return f"{self.key_prefix}:held:{hardware_id}:{bucket}"
+
+    def _held_ids_key(self, bucket):
+        return f"{self.key_prefix}:ids:{bucket}"
+
+    def _live_buckets(self):
+        first = int(time.time()) // self.bucket_seconds
+        return range(first, first + self.timeout // self.bucket_seconds + 2)
+
+    def _counter_timeout(self, bucket):
+        return max((bucket + 1) * self.bucket_seconds - time.time(), 1)
+
+    def _incr(self, hardware_id, bucket, delta):
+        key = self._counter_key(hardware_id, bucket)
+        cache.add(key, 0, timeout=self._counter_timeout(bucket))
+        try:
+            return cache.incr(key, delta)
+        except ValueError:
+            # The bucket expired in between, along with the holds in it
+            return 0
+
+    def get_held(self, hardware_ids, exclude_team_id=None):
+        """
+        The total quantity held of each of the given hardware, as a dict of
+        hardware id -> quantity, leaving out the hold of exclude_team_id.
+        Hardware which no team holds may be left out. Fetched with two round
+        trips to the cache however many hardware are given, plus one for the
+        excluded hold.
+        """
+        hardware_ids = set(hardware_ids)
+        buckets = {
+            self._held_ids_key(bucket): bucket for bucket in self._live_buckets()
+        }
+        keys = {
+            self._counter_key(hardware_id, buckets[ids_key]): hardware_id
+            for ids_key, held_ids in cache.get_many(buckets).items()
+            for hardware_id in held_ids & hardware_ids
+        }
+        held = {}
+        for key, quantity in cache.get_many(keys).items():
+            held[keys[key]] = held.get(keys[key], 0) + quantity
+
+        if exclude_team_id is not None:
+            hold = self.get(exclude_team_id)
+            for hardware_id, quantity in hold["hardware"].items():
+                if hardware_id in held:
+                    held[hardware_id] -= quantity
+        return {hardware_id: max(quantity, 0) for hardware_id, quantity in held.items()}
+
+    def get(self, team_id):
+        """
+        The team's current hold, as a dict with the hardware it holds (a dict of
+        hardware id -> quantity) and when it expires
+        """
+        hold = cache.get(self._team_key(team_id))
+        if hold is None or hold["bucket"] not in self._live_buckets():
+            return {"hardware": {}, "expires_at": None}
+        return {
+            "hardware": hold["hardware"],
+            "expires_at": (hold["bucket"] + 1) * self.bucket_seconds,
+        }
+
+    @contextmanager
+    def _lock(self, key):
+        """
+        Hold a lock on key, raising HoldLocked if another request holds it for
+        longer than lock_timeout
+        """
+        lock_key = f"{key}:lock"
+        token = uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        while not cache.add(lock_key, token, timeout=self.lock_timeout):
+            if time.monotonic() >= deadline:
+                raise HoldLocked(key)
+            time.sleep(self.lock_poll_interval)
+        try:
+            yield
+        finally:
+            # Unless it expired and was taken by another request in the meantime
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    def _add_held_id(self, hardware_id, bucket):
+        key = self._held_ids_key(bucket)
+        if hardware_id in cache.get(key, frozenset()):
+            return
+        with self._lock(key):
+            held_ids = cache.get(key, frozenset())
+            cache.set(key, held_ids | {hardware_id}, self._counter_timeout(bucket))
+
+    def _release(self, team_id):
+        hold = cache.get(self._team_key(team_id))
+        if hold is not None and hold["bucket"] in self._live_buckets():
+            for hardware_id, quantity in hold["hardware"].items():
+                self._incr(hardware_id, hold["bucket"], -quantity)
+        cache.delete(self._team_key(team_id))
+        return hold["hardware"] if hold is not None else {}
+
+    def hold(self, team_id, requested, remaining):
+        """
+        Replace the team's hold with one on the requested hardware (a dict of
+        hardware id -> quantity), as far as it isn't held by other teams.
+        remaining is the quantity remaining of each hardware in the database.
+
+        Each quantity is added to the counters before it is checked against
+        what's left, and given back if it's too much, so concurrent holds never
+        hold more than there is. Returns the new hold, like get. Raises
+        HoldLocked if the team's hold is being changed by another request.
+        """
+        with self._lock(self._team_key(team_id)):
+            bucket = int(time.time() + self.timeout) // self.bucket_seconds
+            # Before anything is changed, and before the counters so get_held
+            # never misses a hold
+            for hardware_id, quantity in requested.items():
+                if quantity > 0:
+                    self._add_held_id(hardware_id, bucket)
+
+            self._release(team_id)
+            held = {}
+            for hardware_id, quantity in requested.items():
+                if quantity <= 0:
+                    continue
+                self._incr(hardware_id, bucket, quantity)
+                total = self.get_held([hardware_id]).get(hardware_id, 0)
+                excess = min(total - remaining.get(hardware_id, 0), quantity)
+                if excess > 0:
+                    self._incr(hardware_id, bucket, -excess)
+                    quantity -= excess
+                if quantity > 0:
+                    held[hardware_id] = quantity
+
+            if held:
+                cache.set(
+                    self._team_key(team_id),
+                    {"bucket": bucket, "hardware": held},
+                    timeout=self._counter_timeout(bucket),
+                )
+        return self.get(team_id)
+
+    def release(self, team_id):
+        """
+        Give back everything the team holds, returning the hardware it held.
+        Raises HoldLocked like hold.
+        """
+        with self._lock(self._team_key(team_id)):
+            return self._release(team_id)
+
+    def apply(self, hardware_data, team_id=None):
+        """
+        Subtract the quantities held from serialized hardware (dicts with id and
+        quantity_remaining), returning new dicts for the ones which changed.
+        team_id's own hold is left in, since it's still there for them to order.
+        """
+        hardware_data = list(hardware_data)
+        held = self.get_held(
+            (item["id"] for item in hardware_data), exclude_team_id=team_id
+        )
+        return [
+            {
+                **item,
+                "quantity_remaining": max(
+                    item["quantity_remaining"] - held[item["id"]], 0
+                ),
+            }
+            if held.get(item["id"])
+            else item
+            for item in hardware_data
+        ]
+
+
+stock_holds = StockHolds()
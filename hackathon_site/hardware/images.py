@@ -0,0 +1,117 @@
+"""
+Smaller copies of uploaded hardware pictures for the catalog, which would
+otherwise send the full 600x600 upload to every card.
+
+Every picture gets each of DERIVATIVE_SIZES as a WebP, and as a JPEG (or PNG,
+if it has transparency) for clients without WebP support. They are rendered
+offline by the build_hardware_images command in a process pool, and recorded in
+Hardware.picture_derivatives along with the picture they were made from, so
+derivatives of a replaced picture are never served.
+"""
+import hashlib
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db.models import F, Q
+from django.db.models.fields.json import KeyTextTransform
+from PIL import Image, ImageOps
+
+from hardware.models import Hardware
+
+DERIVATIVE_SIZES = {
+    "thumbnail": 200,
+    "medium": 400,
+}
+DERIVATIVES_PATH = "uploads/hardware/derivatives/"
+
+JPEG_OPTIONS = {"quality": 85, "optimize": True, "progressive": True}
+PNG_OPTIONS = {"optimize": True}
+WEBP_OPTIONS = {"quality": 80, "method": 6}
+
+
+def render_derivatives(data):
+    """
+    Render every derivative of the image in data, returning a dict of name ->
+    (file extension, bytes). Runs in worker processes, so it only deals in
+    bytes.
+    """
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or (
+            image.mode == "P" and "transparency" in image.info
+        )
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    derivatives = {}
+    for name, size in DERIVATIVE_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+
+        output = BytesIO()
+        if has_alpha:
+            resized.save(output, "PNG", **PNG_OPTIONS)
+            derivatives[name] = ("png", output.getvalue())
+        else:
+            resized.save(output, "JPEG", **JPEG_OPTIONS)
+            derivatives[name] = ("jpg", output.getvalue())
+
+        output = BytesIO()
+        resized.save(output, "WEBP", **WEBP_OPTIONS)
+        derivatives[f"{name}_webp"] = ("webp", output.getvalue())
+    return derivatives
+
+
+def get_picture_storage():
+    return Hardware._meta.get_field("picture").storage
+
+
+def save_derivatives(source_data, derivatives):
+    """
+    Save rendered derivatives to the picture storage, and return a dict of name
+    -> file name. Files are named after a hash of the source picture, so
+    rendering the same picture again reuses them.
+    """
+    storage = get_picture_storage()
+    digest = hashlib.sha256(source_data).hexdigest()[:16]
+    names = {}
+    for name, (extension, content) in derivatives.items():
+        file_name = posixpath.join(DERIVATIVES_PATH, f"{digest}_{name}.{extension}")
+        if not storage.exists(file_name):
+            file_name = storage.save(file_name, ContentFile(content))
+        names[name] = file_name
+    return names
+
+
+def get_stale_pictures(queryset=None):
+    """
+    Hardware whose picture has no derivatives, or only ones made from a previous
+    picture
+    """
+    if queryset is None:
+        queryset = Hardware._base_manager.all()
+    return (
+        queryset.exclude(Q(picture="") | Q(picture__isnull=True))
+        .annotate(derivatives_source=KeyTextTransform("source", "picture_derivatives"))
+        .filter(
+            Q(derivatives_source__isnull=True) | ~Q(derivatives_source=F("picture"))
+        )
+    )
+
+
+def get_derivative_names(hardware):
+    """
+    The file names of the hardware's derivatives, or None if they haven't been
+    made from its current picture yet
+    """
+    derivatives = hardware.picture_derivatives or {}
+    if not hardware.picture or derivatives.get("source") != hardware.picture.name:
+        return None
+    names = {name: derivatives.get(name) for name in get_derivative_keys()}
+    return names if all(names.values()) else None
+
+
+def get_derivative_keys():
+    for name in DERIVATIVE_SIZES:
+        yield name
+        yield f"{name}_webp"
@@ -0,0 +1,345 @@
+"""
+Bulk imports of the hardware catalog from spreadsheets, used by the admin's
+import pages (through BulkImportResource) and the import_hardware command.
+
+django-import-export looks up and saves every row on its own, and resolves the
+categories of every row with another query, which takes minutes for a few
+thousand rows. Here the existing objects are loaded up front with one query,
+the rows are diffed against them in memory, and the changes are written with
+bulk_create/bulk_update and batched inserts of the category relations.
+
+Bulk writes skip the model signals, so the importers do what the signals would:
+everything written is stamped with a new catalog version, and the search
+documents of the imported hardware are rebuilt.
+"""
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from import_export import resources
+from import_export.results import Error, Result, RowResult
+
+from hardware.models import CatalogVersion, Category, Hardware
+from hardware.push import publish_stock
+
+
+def _key_value(value):
+    # Imports read empty cells as blank strings, while the admin saves them as
+    # nulls, so the two match the same object
+    return "" if value is None else value
+
+
+def _same(old, new):
+    return old == new or (_key_value(old) == "" and _key_value(new) == "")
+
+
+class CatalogImporter:
+    """
+    Imports a dataset with the columns of a resource, matching rows to existing
+    objects on the resource's import_id_fields. Columns missing from the dataset
+    are left unchanged on existing objects. Nothing is written if any row is
+    invalid.
+    """
+
+    batch_size = 500
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.model = resource._meta.model
+        self.key_fields = [
+            resource.fields[name] for name in resource.get_import_id_fields()
+        ]
+
+    def get_key(self, values):
+        return tuple(_key_value(values[field.attribute]) for field in self.key_fields)
+
+    def get_fields(self, headers):
+        return [
+            field
+            for field in self.resource.get_import_fields()
+            if field.attribute and field.column_name in headers
+        ]
+
+    def prepare(self, headers):
+        """
+        Load whatever import_row needs besides the existing objects, once per
+        import
+        """
+        self.update_fields = set()
+
+    def import_data(self, dataset, dry_run=False):
+        """
+        Import the dataset, rolling back if dry_run is set, and return an
+        import_export Result describing what happened to each row.
+        """
+        result = Result()
+        result.diff_headers = self.resource.get_diff_headers()
+        result.total_rows = len(dataset)
+
+        headers = set(dataset.headers or ())
+        missing = [
+            field.column_name
+            for field in self.key_fields
+            if field.column_name not in headers
+        ]
+        if missing:
+            result.append_base_error(
+                Error(ValueError(f"Missing column(s): {', '.join(missing)}"), "")
+            )
+            return result
+
+        with transaction.atomic():
+            self.prepare(headers)
+            fields = self.get_fields(headers)
+            existing = {
+                self.get_key(vars(instance)): instance
+                for instance in self.model._base_manager.all()
+            }
+            seen = {}
+            new, updated, imported = [], [], []
+
+            for number, row in enumerate(dataset.dict, 1):
+                row_result = RowResult()
+                row_result.diff = [
+                    row.get(header, "") for header in result.diff_headers
+                ]
+                try:
+                    values = {field.attribute: field.clean(row) for field in fields}
+                    key = self.get_key(values)
+                    if key in seen:
+                        raise ValidationError(f"Duplicate of row {seen[key]}.")
+                    seen[key] = number
+                    instance = existing.get(key)
+                    adding = instance is None
+                    if adding:
+                        instance = self.model()
+                    changed = self.import_row(instance, row, values)
+                except (ValueError, ValidationError) as e:
+                    if not isinstance(e, ValidationError):
+                        e = ValidationError(str(e))
+                    row_result.import_type = RowResult.IMPORT_TYPE_INVALID
+                    row_result.validation_error = e
+                    result.append_invalid_row(number, row, e)
+                else:
+                    if adding:
+                        row_result.import_type = RowResult.IMPORT_TYPE_NEW
+                        new.append(instance)
+                    elif changed:
+                        row_result.import_type = RowResult.IMPORT_TYPE_UPDATE
+                        updated.append(instance)
+                    else:
+                        row_result.import_type = RowResult.IMPORT_TYPE_SKIP
+                    row_result.object_repr = str(instance)
+                    imported.append((row_result, instance))
+                result.increment_row_result_total(row_result)
+                result.append_row_result(row_result)
+
+            if result.has_validation_errors():
+                return result
+
+            if new or updated:
+                self.save(new, updated)
+            for row_result, instance in imported:
+                row_result.object_id = instance.pk
+            if dry_run:
+                transaction.set_rollback(True)
+        return result
+
+    def import_row(self, instance, row, values):
+        """
+        Apply the cleaned values of a row to a new or existing instance, and
+        return whether it changed.
+        """
+        adding = instance.pk is None
+        changed = False
+        for attribute, value in values.items():
+            if adding:
+                setattr(instance, attribute, value)
+            elif not _same(getattr(instance, attribute), value):
+                setattr(instance, attribute, value)
+                self.update_fields.add(attribute)
+                changed = True
+
+        self.validate(instance, values if not adding else None)
+        return changed
+
+    def validate(self, instance, values=None):
+        """
+        Check the values of the given fields (or all the editable ones) against
+        what the database accepts. Unlike Model.clean_fields, nullable fields
+        may be left empty even if the admin's forms require them.
+        """
+        errors = {}
+        for field in self.model._meta.fields:
+            if values is not None and field.attname not in values:
+                continue
+            if field.primary_key or not field.editable:
+                continue
+
+            value = getattr(instance, field.attname)
+            try:
+                if value is None and not field.null:
+                    raise ValidationError(field.error_messages["null"])
+                if value in field.empty_values:
+                    if not field.null and not field.blank:
+                        raise ValidationError(field.error_messages["blank"])
+                else:
+                    field.clean(value, instance)
+            except ValidationError as e:
+                errors[field.name] = e.error_list
+        if errors:
+            raise ValidationError(errors)
+
+    def save(self, new, updated):
+        version = CatalogVersion.objects.bump()
+        now = timezone.now()
+        for instance in new + updated:
+            instance.version = version
+        for instance in updated:
+            instance.updated_at = now
+
+        manager = self.model._base_manager
+        manager.bulk_create(new, batch_size=self.batch_size)
+        manager.bulk_update(
+            updated,
+            sorted(self.update_fields | {"version", "updated_at"}),
+            batch_size=self.batch_size,
+        )
+
+        if new and new[0].pk is None:
+            # Only postgres returns the ids of bulk inserted rows, so look them
+            # up by the version they were all stamped with
+            key_attributes = [field.attribute for field in self.key_fields]
+            ids = {
+                tuple(_key_value(value) for value in values[1:]): values[0]
+                for values in manager.filter(version=version).values_list(
+                    "pk", *key_attributes
+                )
+            }
+            for instance in new:
+                instance.pk = ids[self.get_key(vars(instance))]
+
+
+class CategoryImporter(CatalogImporter):
+    pass
+
+
+class HardwareImporter(CatalogImporter):
+    """
+    Also sets the categories of every hardware to the ones named in its
+    categories column, which must all exist already.
+    """
+
+    def prepare(self, headers):
+        super().prepare(headers)
+        self.categories_field = self.resource.fields["categories"]
+        self.import_categories = self.categories_field.column_name in headers
+        self.category_changes = []
+        self.restocked = []
+        if not self.import_categories:
+            return
+
+        self.category_ids = defaultdict(list)
+        for category_id, name in Category.objects.values_list("id", "name"):
+            self.category_ids[name].append(category_id)
+        # Hardware id -> category id -> id of the relation
+        self.current_categories = defaultdict(dict)
+        for (
+            relation_id,
+            hardware_id,
+            category_id,
+        ) in Hardware.categories.through.objects.values_list(
+            "id", "hardware_id", "category_id"
+        ):
+            self.current_categories[hardware_id][category_id] = relation_id
+
+    def get_fields(self, headers):
+        return [
+            field
+            for field in super().get_fields(headers)
+            if field is not self.categories_field
+        ]
+
+    def import_row(self, instance, row, values):
+        hardware_id = instance.pk
+        quantity_available = instance.quantity_available
+        changed = super().import_row(instance, row, values)
+        if (
+            hardware_id is not None
+            and instance.quantity_available != quantity_available
+        ):
+            self.restocked.append(hardware_id)
+        if not self.import_categories:
+            return changed
+
+        widget = self.categories_field.widget
+        names = row[self.categories_field.column_name]
+        names = {
+            name.strip()
+            for name in str(names or "").split(widget.separator)
+            if name.strip()
+        }
+        unknown = sorted(name for name in names if name not in self.category_ids)
+        if unknown:
+            raise ValidationError(
+                {"categories": f"Unknown categories: {', '.join(unknown)}"}
+            )
+
+        category_ids = {
+            category_id for name in names for category_id in self.category_ids[name]
+        }
+        if category_ids != set(self.current_categories.get(hardware_id, ())):
+            self.category_changes.append((instance, category_ids))
+            changed = True
+        return changed
+
+    def save(self, new, updated):
+        super().save(new, updated)
+        if self.import_categories:
+            self.save_categories()
+
+        Hardware.objects.refresh_search_documents(
+            [instance.pk for instance in new + updated]
+        )
+        publish_stock(self.restocked)
+
+    def save_categories(self):
+        through = Hardware.categories.through
+        removed, added = [], []
+        for instance, category_ids in self.category_changes:
+            current = self.current_categories.get(instance.pk, {})
+            removed.extend(
+                relation_id
+                for category_id, relation_id in current.items()
+                if category_id not in category_ids
+            )
+            added.extend(
+                through(hardware_id=instance.pk, category_id=category_id)
+                for category_id in category_ids
+                if category_id not in current
+            )
+
+        for start in range(0, len(removed), self.batch_size):
+            through.objects.filter(
+                pk__in=removed[start : start + self.batch_size]
+            ).delete()
+        through.objects.bulk_create(added, batch_size=self.batch_size)
+
+
+class BulkImportResource(resources.ModelResource):
+    """
+    A resource whose imports go through importer_class rather than
+    django-import-export's row by row import.
+    """
+
+    importer_class = None
+
+    def import_data(self, dataset, dry_run=False, raise_errors=False, **kwargs):
+        result = self.importer_class(self).import_data(dataset, dry_run=dry_run)
+        if raise_errors:
+            if result.base_errors:
+                raise result.base_errors[0].error
+            if result.invalid_rows:
+                raise result.invalid_rows[0].error
+        return result
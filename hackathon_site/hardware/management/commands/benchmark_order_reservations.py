@@ -0,0 +1,178 @@
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from hardware.cache import catalog_cache
+from hardware.models import (
+    CatalogTombstone,
+    Hardware,
+    Order,
+    OrderItem,
+    catalog_changed,
+)
+from hardware.signals import invalidate_catalog_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Place orders for the same hardware from several threads at once, using "
+        "the same stock reservation as order creation, and report orders per second "
+        "and whether any hardware was oversold. Needs a database which supports "
+        "concurrent connections (i.e. postgres, not the in-memory sqlite used in "
+        "CI). The benchmark's hardware and orders are deleted afterwards, along "
+        "with the tombstones their deletion leaves in the catalog change feed, so "
+        "run it against a staging database: clients syncing the catalog while it "
+        "runs can keep the benchmark hardware. The catalog cache is left alone "
+        "while it runs, then invalidated once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--orders-per-thread", type=int, default=50)
+        parser.add_argument(
+            "--hardware", type=int, default=4, help="Number of hardware to order from"
+        )
+        parser.add_argument(
+            "--quantity-available",
+            type=int,
+            default=100,
+            help="Stock of each hardware, keep it low to force contention",
+        )
+        parser.add_argument(
+            "--max-quantity", type=int, default=3, help="Maximum quantity per line"
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor == "sqlite":
+            raise CommandError(
+                "The benchmark needs a database with concurrent connections"
+            )
+
+        # Otherwise every reservation would invalidate the cached stock of the
+        # whole catalog
+        catalog_changed.disconnect(dispatch_uid="catalog_cache_invalidate")
+        try:
+            self._benchmark(options)
+        finally:
+            catalog_changed.connect(
+                invalidate_catalog_cache, dispatch_uid="catalog_cache_invalidate"
+            )
+            # Drops any page cached with the benchmark hardware while it ran
+            catalog_cache.invalidate()
+
+    def _benchmark(self, options):
+        hardware_ids = [
+            Hardware.objects.create(
+                name=f"Reservation benchmark {i}",
+                quantity_available=options["quantity_available"],
+                max_per_team=options["quantity_available"],
+            ).id
+            for i in range(options["hardware"])
+        ]
+        results = Counter()
+        results_lock = threading.Lock()
+
+        def place_orders():
+            thread_results = Counter()
+            try:
+                for _ in range(options["orders_per_thread"]):
+                    requested = {
+                        hardware_id: random.randint(1, options["max_quantity"])
+                        for hardware_id in random.sample(
+                            hardware_ids, random.randint(1, len(hardware_ids))
+                        )
+                    }
+                    thread_results[self._place_order(requested)] += 1
+            finally:
+                connection.close()
+                with results_lock:
+                    results.update(thread_results)
+
+        threads = [
+            threading.Thread(target=place_orders) for _ in range(options["threads"])
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        try:
+            self._report(hardware_ids, results, elapsed)
+        finally:
+            with transaction.atomic():
+                Order.objects.filter(items__hardware_id__in=hardware_ids).delete()
+                Hardware.objects.filter(id__in=hardware_ids).delete()
+                CatalogTombstone.objects.filter(
+                    kind="hardware", object_id__in=hardware_ids
+                ).delete()
+
+    @staticmethod
+    def _place_order(requested):
+        with transaction.atomic():
+            order = Order.objects.create(
+                team=None,
+                status="Submitted",
+                request=[
+                    {"id": hardware_id, "requested_quantity": quantity}
+                    for hardware_id, quantity in requested.items()
+                ],
+            )
+            order_items = []
+            for hardware_id, quantity in sorted(requested.items()):
+                reserved = Hardware.objects.reserve(hardware_id, quantity)
+                if reserved > 0:
+                    order_items.append(
+                        OrderItem(
+                            order=order, hardware_id=hardware_id, quantity=reserved
+                        )
+                    )
+
+            if not order_items:
+                transaction.set_rollback(True)
+                return "rejected"
+            OrderItem.objects.bulk_create(order_items, update_stock=False)
+            reserved_quantity = sum(item.quantity for item in order_items)
+            if reserved_quantity < sum(requested.values()):
+                return "partial"
+            return "fulfilled"
+
+    def _report(self, hardware_ids, results, elapsed):
+        total_orders = sum(results.values())
+        self.stdout.write(
+            f"{total_orders} orders in {elapsed:.2f}s "
+            f"({total_orders / elapsed:.1f} orders/sec): "
+            f"{results['fulfilled']} fulfilled, {results['partial']} partially "
+            f"fulfilled, {results['rejected']} rejected"
+        )
+
+        oversold = False
+        checked_out_counts = Counter(
+            dict(
+                OrderItem.objects.filter(hardware_id__in=hardware_ids)
+                .values("hardware_id")
+                .annotate(count=Sum("quantity"))
+                .values_list("hardware_id", "count")
+            )
+        )
+        for hardware in Hardware.objects.filter(id__in=hardware_ids).order_by("id"):
+            checked_out = checked_out_counts[hardware.id]
+            self.stdout.write(
+                f"{hardware.name}: {checked_out} of {hardware.quantity_available} "
+                f"checked out, counter at {hardware.quantity_checked_out}"
+            )
+            if (
+                checked_out > hardware.quantity_available
+                or checked_out != hardware.quantity_checked_out
+            ):
+                oversold = True
+
+        if oversold:
+            raise CommandError("Hardware was oversold or its stock counter drifted")
+        self.stdout.write(self.style.SUCCESS("No hardware was oversold"))
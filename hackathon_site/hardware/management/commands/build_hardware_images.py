@@ -0,0 +1,123 @@
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from hardware.images import (
+    get_picture_storage,
+    get_stale_pictures,
+    render_derivatives,
+    save_derivatives,
+)
+from hardware.models import CatalogVersion, Hardware
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the thumbnail and medium sized copies of hardware pictures which "
+        "don't have them yet, in a pool of worker processes. Runs until "
+        "interrupted unless --once is given, so pictures uploaded later get their "
+        "copies too. Use --once to backfill existing hardware."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of worker processes, by default one per CPU",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=30,
+            help="Seconds to wait when there is nothing to render",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once every picture has its copies",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Render every picture again first, e.g. after changing the sizes",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            with transaction.atomic():
+                Hardware._base_manager.update(
+                    picture_derivatives={}, version=CatalogVersion.objects.bump()
+                )
+
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            try:
+                while True:
+                    built, failed = self.build_batch(executor, options["batch_size"])
+                    if built or failed:
+                        self.stdout.write(
+                            f"Rendered pictures of {built} hardware, {failed} failed"
+                        )
+                    if built + failed < options["batch_size"]:
+                        if options["once"]:
+                            break
+                        time.sleep(options["poll_interval"])
+            except KeyboardInterrupt:
+                pass
+
+    @classmethod
+    def build_batch(cls, executor, batch_size):
+        hardware = list(
+            get_stale_pictures()
+            .order_by("id")
+            .values_list("id", "picture")[:batch_size]
+        )
+        if not hardware:
+            return 0, 0
+
+        storage = get_picture_storage()
+        results = {}
+        pictures = {}
+        for hardware_id, picture in hardware:
+            try:
+                with storage.open(picture, "rb") as f:
+                    pictures[hardware_id] = (picture, f.read())
+            except OSError as e:
+                results[hardware_id] = cls.failure(hardware_id, picture, e)
+
+        renders = {
+            hardware_id: executor.submit(render_derivatives, data)
+            for hardware_id, (_, data) in pictures.items()
+        }
+        for hardware_id, (picture, data) in pictures.items():
+            try:
+                derivatives = save_derivatives(data, renders[hardware_id].result())
+            except Exception as e:
+                results[hardware_id] = cls.failure(hardware_id, picture, e)
+            else:
+                results[hardware_id] = {"source": picture, **derivatives}
+
+        with transaction.atomic():
+            # Serialized hardware includes the copies, so it changes in the
+            # catalog feed and cache
+            version = CatalogVersion.objects.bump()
+            for hardware_id, derivatives in results.items():
+                # Unless the picture was replaced while it was being rendered
+                Hardware._base_manager.filter(
+                    pk=hardware_id, picture=derivatives["source"]
+                ).update(picture_derivatives=derivatives, version=version)
+        failed = sum("error" in derivatives for derivatives in results.values())
+        return len(results) - failed, failed
+
+    @staticmethod
+    def failure(hardware_id, picture, error):
+        logger.error("Could not render picture of hardware %s: %s", hardware_id, error)
+        # Recorded against the picture so it isn't retried until it is replaced
+        # or --rebuild is given
+        return {"source": picture, "error": str(error)}
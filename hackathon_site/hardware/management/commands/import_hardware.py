@@ -0,0 +1,89 @@
+import os
+
+from django.core.exceptions import NON_FIELD_ERRORS
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from import_export.formats.base_formats import DEFAULT_FORMATS
+from import_export.results import RowResult
+
+from hardware.admin import CategoryResource, HardwareResource
+
+
+def load_dataset(path):
+    extension = os.path.splitext(path)[1][1:].lower()
+    for format_class in DEFAULT_FORMATS:
+        input_format = format_class()
+        if input_format.can_import() and input_format.get_extension() == extension:
+            break
+    else:
+        raise CommandError(f"Unsupported file type: {path}")
+
+    mode = input_format.get_read_mode()
+    # utf-8-sig drops the byte order mark Excel puts at the start of CSVs
+    encoding = None if "b" in mode else "utf-8-sig"
+    with open(path, mode, encoding=encoding) as f:
+        return input_format.create_dataset(f.read())
+
+
+class Command(BaseCommand):
+    help = (
+        "Import hardware from a spreadsheet with the same columns as the admin's "
+        "import, creating new hardware and updating existing ones (matched on "
+        "name, model number and manufacturer) in bulk. Categories can be imported "
+        "first from a second spreadsheet. Nothing is imported if any row is "
+        "invalid."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV, XLSX, JSON, etc. file of hardware")
+        parser.add_argument(
+            "--categories",
+            metavar="PATH",
+            help="File of categories to import before the hardware",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would change without changing anything",
+        )
+
+    def handle(self, *args, **options):
+        imports = [(HardwareResource, options["path"])]
+        if options["categories"]:
+            imports.insert(0, (CategoryResource, options["categories"]))
+        datasets = [
+            (resource_class(), load_dataset(path)) for resource_class, path in imports
+        ]
+
+        failed = False
+        with transaction.atomic():
+            for resource, dataset in datasets:
+                result = resource.import_data(dataset)
+                self.report(resource, result)
+                if result.has_errors() or result.has_validation_errors():
+                    failed = True
+                    break
+            if failed or options["dry_run"]:
+                transaction.set_rollback(True)
+
+        if failed:
+            raise CommandError("Nothing was imported")
+        verb = "would be" if options["dry_run"] else "were"
+        self.stdout.write(self.style.SUCCESS(f"Changes {verb} imported"))
+
+    def report(self, resource, result):
+        name = resource._meta.model._meta.verbose_name_plural
+        for error in result.base_errors:
+            self.stderr.write(f"{name.capitalize()}: {error.error}")
+        for row in result.invalid_rows:
+            for field, messages in row.error_dict.items():
+                prefix = "" if field == NON_FIELD_ERRORS else f"{field}: "
+                self.stderr.write(f"Row {row.number}: {prefix}{' '.join(messages)}")
+
+        totals = result.totals
+        self.stdout.write(
+            f"{name.capitalize()}: {totals[RowResult.IMPORT_TYPE_NEW]} new, "
+            f"{totals[RowResult.IMPORT_TYPE_UPDATE]} updated, "
+            f"{totals[RowResult.IMPORT_TYPE_SKIP]} unchanged, "
+            f"{totals[RowResult.IMPORT_TYPE_INVALID]} invalid"
+        )
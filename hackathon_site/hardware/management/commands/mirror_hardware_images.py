@@ -0,0 +1,135 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from hardware.mirror import fetch_image, link_hardware, link_new_urls, save_image
+from hardware.models import MirroredImage
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Keep local copies of the external images hardware link to with "
+        "image_url, fetching them in a pool of threads and revalidating them "
+        "periodically. Runs until interrupted unless --once is given. Several "
+        "workers can run at once on postgres."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument(
+            "--workers", type=int, default=8, help="Number of images to fetch at once",
+        )
+        parser.add_argument(
+            "--timeout", type=float, default=10, help="Seconds to wait on a server"
+        )
+        parser.add_argument(
+            "--max-age",
+            type=float,
+            default=86400,
+            help="Seconds to keep a copy before revalidating it",
+        )
+        parser.add_argument(
+            "--backoff",
+            type=float,
+            default=60,
+            help="Seconds to wait before retrying an image the first time, "
+            "doubled on each attempt after that up to --max-age",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=30,
+            help="Seconds to wait when there is nothing to fetch",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once every image due to be fetched has been",
+        )
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            try:
+                while True:
+                    link_new_urls()
+                    fetched, failed = self.mirror_batch(executor, options)
+                    if fetched or failed:
+                        self.stdout.write(
+                            f"Checked {fetched} image(s), {failed} failed"
+                        )
+                    if fetched + failed < options["batch_size"]:
+                        if options["once"]:
+                            break
+                        time.sleep(options["poll_interval"])
+            except KeyboardInterrupt:
+                pass
+
+    @staticmethod
+    def mirror_batch(executor, options):
+        """
+        Fetch or revalidate the next batch of images which are due. The rows stay
+        locked until the batch is done so that other workers skip them.
+        """
+        with transaction.atomic():
+            mirrors = list(
+                MirroredImage.objects.select_for_update(skip_locked=True)
+                .filter(next_check_at__lte=timezone.now())
+                .order_by("next_check_at", "id")[: options["batch_size"]]
+            )
+            if not mirrors:
+                return 0, 0
+
+            fetches = [
+                executor.submit(
+                    fetch_image,
+                    mirror.url,
+                    mirror.etag,
+                    mirror.last_modified,
+                    options["timeout"],
+                )
+                for mirror in mirrors
+            ]
+
+            changed_files = {}
+            failed = 0
+            for mirror, fetch in zip(mirrors, fetches):
+                try:
+                    image = fetch.result()
+                    if image is not None:
+                        name = save_image(image)
+                        if name != mirror.file.name:
+                            changed_files[mirror.url] = name
+                        mirror.file.name = name
+                        mirror.etag = image.etag
+                        mirror.last_modified = image.last_modified
+                except Exception as e:
+                    logger.error("Could not mirror %s: %s", mirror.url, e)
+                    mirror.record_failure(e, options["backoff"], options["max_age"])
+                    failed += 1
+                else:
+                    mirror.failures = 0
+                    mirror.last_error = ""
+                    mirror.next_check_at = timezone.now() + timedelta(
+                        seconds=options["max_age"]
+                    )
+
+            MirroredImage.objects.bulk_update(
+                mirrors,
+                [
+                    "file",
+                    "etag",
+                    "last_modified",
+                    "failures",
+                    "last_error",
+                    "next_check_at",
+                ],
+            )
+            link_hardware(changed_files)
+            return len(mirrors) - failed, failed
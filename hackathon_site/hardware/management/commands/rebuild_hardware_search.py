@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from hardware.models import Hardware
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the search document and search vector of every hardware. Run "
+        "this after loading fixtures, which skip the signals that keep them up to "
+        "date."
+    )
+
+    def handle(self, *args, **options):
+        hardware_ids = list(Hardware.objects.values_list("id", flat=True))
+        Hardware.objects.refresh_search_documents(hardware_ids)
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt search for {len(hardware_ids)} hardware")
+        )
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from hardware.models import Hardware
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the quantity checked out counter of every hardware from its order "
+        "items. Run this after loading fixtures, or if the counters are suspected "
+        "to have drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report out of date counters without changing them",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            changed = Hardware.objects.rebuild_checked_out()
+            for hardware_id, (old, new) in sorted(changed.items()):
+                self.stdout.write(
+                    f"Hardware {hardware_id}: quantity checked out {old} -> {new}"
+                )
+            if options["dry_run"]:
+                transaction.set_rollback(True)
+
+        verb = "would be" if options["dry_run"] else "were"
+        self.stdout.write(
+            self.style.SUCCESS(f"{len(changed)} hardware counter(s) {verb} rebuilt")
+        )
@@ -0,0 +1,119 @@
+import logging
+import time
+
+from django.core import mail
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from hardware.models import QueuedEmail
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Send emails queued by the order endpoints. Each batch is sent over one "
+        "SMTP connection, and emails which fail are retried with exponential "
+        "backoff until they run out of attempts. Runs until interrupted unless "
+        "--once is given. Several workers can run at once on postgres."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=5,
+            help="Give up on an email after this many failed attempts",
+        )
+        parser.add_argument(
+            "--backoff",
+            type=float,
+            default=30,
+            help="Seconds to wait before retrying an email the first time, "
+            "doubled on each attempt after that",
+        )
+        parser.add_argument(
+            "--max-backoff", type=float, default=3600, help="Longest wait in seconds"
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5,
+            help="Seconds to wait when there is nothing to send",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once there are no emails ready to be sent",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                sent, failed = self.send_batch(options)
+                if sent or failed:
+                    self.stdout.write(f"Sent {sent} email(s), {failed} failed")
+                if sent + failed < options["batch_size"]:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
+
+    @staticmethod
+    def send_batch(options):
+        """
+        Send the next batch of emails which are due. The rows stay locked until
+        the batch is done so that other workers skip them rather than sending
+        them twice.
+        """
+        with transaction.atomic():
+            emails = list(
+                QueuedEmail.objects.select_for_update(skip_locked=True)
+                .filter(
+                    sent_at__isnull=True,
+                    next_attempt_at__lte=timezone.now(),
+                    attempts__lt=options["max_attempts"],
+                )
+                .order_by("next_attempt_at", "id")[: options["batch_size"]]
+            )
+            if not emails:
+                return 0, 0
+
+            sent_ids = []
+            failed_emails = []
+            connection = mail.get_connection(fail_silently=False)
+            try:
+                connection.open()
+            except Exception as e:
+                logger.error(e)
+                failed_emails = emails
+                for email in emails:
+                    email.record_failure(e, options["backoff"], options["max_backoff"])
+            else:
+                try:
+                    for email in emails:
+                        try:
+                            email.to_message(connection).send()
+                        except Exception as e:
+                            logger.error(e)
+                            email.record_failure(
+                                e, options["backoff"], options["max_backoff"]
+                            )
+                            failed_emails.append(email)
+                        else:
+                            sent_ids.append(email.id)
+                finally:
+                    connection.close()
+
+            if sent_ids:
+                QueuedEmail.objects.filter(id__in=sent_ids).update(
+                    sent_at=timezone.now(), last_error=""
+                )
+            if failed_emails:
+                QueuedEmail.objects.bulk_update(
+                    failed_emails, ["attempts", "last_error", "next_attempt_at"]
+                )
+            return len(sent_ids), len(failed_emails)
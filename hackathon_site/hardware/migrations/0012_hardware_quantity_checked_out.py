@@ -0,0 +1,34 @@
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def apply_migration(apps, schema_editor):
+    Hardware = apps.get_model("hardware", "Hardware")
+    OrderItem = apps.get_model("hardware", "OrderItem")
+
+    checked_out_counts = (
+        OrderItem.objects.filter(
+            ~Q(part_returned_health="Healthy") & ~Q(order__status="Cancelled")
+        )
+        .values("hardware_id")
+        .annotate(count=Count("id"))
+        .values_list("hardware_id", "count")
+    )
+    for hardware_id, count in checked_out_counts:
+        Hardware.objects.filter(pk=hardware_id).update(quantity_checked_out=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hardware", "0011_alter_order_team"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hardware",
+            name="quantity_checked_out",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(apply_migration, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 08:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hardware", "0012_hardware_quantity_checked_out"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="orderitem",
+            name="quantity",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,55 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def apply_migration(apps, schema_editor):
+    """
+    Merge the order items for the same hardware in the same state into one item
+    holding the quantity. Items with an incident are kept as they are, since the
+    incident is about that particular unit.
+    """
+    OrderItem = apps.get_model("hardware", "OrderItem")
+
+    groups = (
+        OrderItem.objects.filter(incident__isnull=True)
+        .values("order_id", "hardware_id", "part_returned_health")
+        .annotate(first_id=Min("id"), count=Count("id"))
+        .filter(count__gt=1)
+    )
+    for group in groups:
+        items = OrderItem.objects.filter(
+            incident__isnull=True,
+            order_id=group["order_id"],
+            hardware_id=group["hardware_id"],
+            part_returned_health=group["part_returned_health"],
+        )
+        OrderItem.objects.filter(pk=group["first_id"]).update(quantity=group["count"])
+        items.exclude(pk=group["first_id"]).delete()
+
+
+def revert_migration(apps, schema_editor):
+    OrderItem = apps.get_model("hardware", "OrderItem")
+
+    for item in OrderItem.objects.filter(quantity__gt=1):
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(
+                    order_id=item.order_id,
+                    hardware_id=item.hardware_id,
+                    part_returned_health=item.part_returned_health,
+                    quantity=1,
+                )
+                for _ in range(item.quantity - 1)
+            ]
+        )
+        item.quantity = 1
+        item.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hardware", "0013_orderitem_quantity"),
+    ]
+
+    operations = [migrations.RunPython(apply_migration, revert_migration)]
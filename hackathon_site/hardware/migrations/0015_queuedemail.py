@@ -0,0 +1,49 @@
+# Generated by Django 3.2.15 on 2026-10-18 08:23
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hardware", "0014_merge_order_item_units"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueuedEmail",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("subject", models.CharField(max_length=998)),
+                ("message", models.TextField()),
+                ("html_message", models.TextField(blank=True, default="")),
+                ("from_email", models.CharField(max_length=255)),
+                ("recipient_list", models.JSONField()),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("last_error", models.TextField(blank=True, default="")),
+                ("sent_at", models.DateTimeField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="queuedemail",
+            index=models.Index(
+                fields=["sent_at", "next_attempt_at"],
+                name="hardware_qu_sent_at_af27d0_idx",
+            ),
+        ),
+    ]
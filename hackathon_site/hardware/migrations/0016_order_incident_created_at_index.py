@@ -0,0 +1,25 @@
+# Generated by Django 3.2.15 on 2026-10-18 08:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hardware", "0015_queuedemail"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="incident",
+            index=models.Index(
+                fields=["created_at", "id"], name="hardware_in_created_82c3da_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["created_at", "id"], name="hardware_or_created_d62f0c_idx"
+            ),
+        ),
+    ]
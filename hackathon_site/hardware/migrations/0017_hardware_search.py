@@ -0,0 +1,59 @@
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+from hardware.search import build_search_document, build_search_vector
+
+
+def apply_migration(apps, schema_editor):
+    Hardware = apps.get_model("hardware", "Hardware")
+
+    hardware = list(Hardware.objects.prefetch_related("categories"))
+    for item in hardware:
+        item.search_document = build_search_document(
+            item, [category.name for category in item.categories.all()]
+        )
+    Hardware.objects.bulk_update(hardware, ["search_document"], batch_size=500)
+
+    if schema_editor.connection.vendor == "postgresql":
+        Hardware.objects.update(search_vector=build_search_vector())
+        schema_editor.execute(
+            "CREATE INDEX hardware_search_vector_idx ON hardware_hardware "
+            "USING gin (search_vector)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX hardware_search_document_trgm_idx ON hardware_hardware "
+            "USING gin (search_document gin_trgm_ops)"
+        )
+
+
+def revert_migration(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX hardware_search_vector_idx")
+        schema_editor.execute("DROP INDEX hardware_search_document_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hardware", "0016_order_incident_created_at_index"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="hardware",
+            name="search_document",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="hardware",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                blank=True, null=True
+            ),
+        ),
+        # The GIN indexes are postgres only, so they are created here rather than
+        # in the model's Meta
+        migrations.RunPython(apply_migration, revert_migration),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 3.2.15 on 2026-10-18 08:45
+
+from django.db import migrations, models
+
+
+def apply_migration(apps, schema_editor):
+    CatalogVersion = apps.get_model("hardware", "CatalogVersion")
+    Category = apps.get_model("hardware", "Category")
+    Hardware = apps.get_model("hardware", "Hardware")
+
+    # Everything that already exists is part of the first version, so clients
+    # syncing from version 0 get the whole catalog
+    CatalogVersion.objects.create(pk=1, version=1)
+    Category.objects.update(version=1)
+    Hardware.objects.update(version=1)
+
+
+def revert_migration(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hardware", "0017_hardware_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CatalogTombstone",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("hardware", "hardware"), ("category", "category")],
+                        max_length=16,
+                    ),
+                ),
+                ("object_id", models.IntegerField()),
+                ("version", models.BigIntegerField(db_index=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="CatalogVersion",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="version",
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name="hardware",
+            name="version",
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(apply_migration, revert_migration),
+    ]
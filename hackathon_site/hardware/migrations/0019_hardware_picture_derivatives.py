@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 09:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hardware", "0018_catalog_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hardware",
+            name="picture_derivatives",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
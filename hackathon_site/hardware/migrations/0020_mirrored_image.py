@@ -0,0 +1,53 @@
+# Generated by Django 3.2.15 on 2026-10-18 09:19
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hardware", "0019_hardware_picture_derivatives"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MirroredImage",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("url", models.CharField(max_length=500, unique=True)),
+                (
+                    "file",
+                    models.FileField(blank=True, upload_to="uploads/hardware/mirror/"),
+                ),
+                ("etag", models.CharField(blank=True, default="", max_length=255)),
+                (
+                    "last_modified",
+                    models.CharField(blank=True, default="", max_length=64),
+                ),
+                ("failures", models.PositiveIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True, default="")),
+                (
+                    "next_check_at",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="hardware",
+            name="image_mirror",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+
+def apply_migration(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+
+    CatalogVersion = apps.get_model("hardware", "CatalogVersion")
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT txid_current()")
+        (txid,) = cursor.fetchone()
+
+    # Versions become transaction ids from now on, offset so that they're all
+    # higher than any version already handed out
+    counter = CatalogVersion.objects.filter(pk=1).values_list("version", flat=True)
+    offset = max((counter.first() or 0) - txid, 0)
+    CatalogVersion.objects.update_or_create(pk=1, defaults={"version": offset})
+
+
+def revert_migration(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+
+    CatalogVersion = apps.get_model("hardware", "CatalogVersion")
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT txid_current()")
+        (txid,) = cursor.fetchone()
+
+    # Count on from the last version handed out
+    offset = CatalogVersion.objects.filter(pk=1).values_list("version", flat=True)
+    CatalogVersion.objects.update_or_create(
+        pk=1, defaults={"version": txid + (offset.first() or 0)}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hardware", "0020_mirrored_image"),
+    ]
+
+    operations = [
+        migrations.RunPython(apply_migration, revert_migration),
+    ]
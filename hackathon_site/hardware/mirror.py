@@ -0,0 +1,146 @@
+"""
+Local copies of the external images which hardware link to with image_url, so
+the catalog doesn't depend on how fast (or whether) vendor CDNs respond.
+
+The mirror_hardware_images worker fetches linked images with a bounded pool of
+threads, and saves them under MEDIA_ROOT named after a hash of their content.
+Every copy is revalidated now and then with the ETag and Last-Modified headers
+it was served with, so unchanged images aren't downloaded again. Hardware
+record which copy belongs to their current image_url in image_mirror, and
+HardwareSerializer serves that copy instead of the external URL.
+"""
+import hashlib
+import posixpath
+from collections import namedtuple
+from urllib.parse import urlparse
+
+import requests
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.fields.json import KeyTextTransform
+
+from hardware.models import CatalogVersion, Hardware, MirroredImage
+
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+# SVGs aren't mirrored, since they could run scripts on our own domain
+IMAGE_EXTENSIONS = {
+    "image/gif": "gif",
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+}
+
+FetchedImage = namedtuple(
+    "FetchedImage", ("content", "content_type", "etag", "last_modified")
+)
+
+
+def is_mirrorable(url):
+    return urlparse(url).scheme in ("http", "https")
+
+
+def fetch_image(url, etag="", last_modified="", timeout=10):
+    """
+    Fetch the image at url, or revalidate the copy fetched with the given ETag
+    and Last-Modified headers. Returns None if that copy is still current, and
+    raises if the URL doesn't serve a supported image.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    with requests.get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+
+        content_type = response.headers.get("Content-Type", "")
+        content_type = content_type.split(";")[0].strip().lower()
+        if content_type not in IMAGE_EXTENSIONS:
+            raise ValueError(f"Unsupported content type: {content_type or 'none'}")
+
+        content = bytearray()
+        for chunk in response.iter_content(64 * 1024):
+            content += chunk
+            if len(content) > MAX_IMAGE_SIZE:
+                raise ValueError(f"Image is larger than {MAX_IMAGE_SIZE} bytes")
+
+        return FetchedImage(
+            bytes(content),
+            content_type,
+            response.headers.get("ETag", ""),
+            response.headers.get("Last-Modified", ""),
+        )
+
+
+def save_image(image):
+    """
+    Save a fetched image under a name derived from its content, and return the
+    name. Images which are already saved aren't written again.
+    """
+    storage = MirroredImage._meta.get_field("file").storage
+    digest = hashlib.sha256(image.content).hexdigest()[:32]
+    name = posixpath.join(
+        MirroredImage._meta.get_field("file").upload_to,
+        f"{digest}.{IMAGE_EXTENSIONS[image.content_type]}",
+    )
+    if not storage.exists(name):
+        name = storage.save(name, ContentFile(image.content))
+    return name
+
+
+def get_unlinked_hardware():
+    """
+    Hardware with an image_url whose copy isn't recorded in image_mirror, e.g.
+    because the image_url changed or hasn't been mirrored yet
+    """
+    return (
+        Hardware._base_manager.exclude(Q(image_url="") | Q(image_url__isnull=True))
+        .annotate(mirror_url=KeyTextTransform("url", "image_mirror"))
+        .filter(Q(mirror_url__isnull=True) | ~Q(mirror_url=F("image_url")))
+    )
+
+
+def link_hardware(files):
+    """
+    Point the hardware linking to each URL in files (a dict of URL -> file name)
+    at its copy
+    """
+    if not files:
+        return
+    with transaction.atomic():
+        # Serialized hardware includes the URL of the copy, so it changes in the
+        # catalog feed and cache
+        version = CatalogVersion.objects.bump()
+        for url, name in files.items():
+            Hardware._base_manager.filter(image_url=url).update(
+                image_mirror={"url": url, "file": name}, version=version
+            )
+
+
+def link_new_urls():
+    """
+    Start mirroring the URLs of hardware without a copy, and link the ones
+    whose URL has already been mirrored (e.g. for other hardware) straight away
+    """
+    urls = {
+        url
+        for url in get_unlinked_hardware().values_list("image_url", flat=True)
+        if is_mirrorable(url)
+    }
+    if not urls:
+        return
+
+    MirroredImage.objects.bulk_create(
+        [MirroredImage(url=url) for url in urls], ignore_conflicts=True
+    )
+    link_hardware(
+        dict(
+            MirroredImage.objects.filter(url__in=urls)
+            .exclude(file="")
+            .values_list("url", "file")
+        )
+    )
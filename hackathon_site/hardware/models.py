@@ -1,15 +1,152 @@
-from django.db import models
-from django.db.models import Count, F, Q
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.postgres.search import SearchVectorField
+from django.core.mail import EmailMultiAlternatives
+from django.db import connections, models
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+from django.utils import timezone
 
 from event.models import Team as TeamEvent
+from hardware.search import build_search_document, build_search_vector
+
+# Sent with the new version whenever CatalogVersion.objects.bump() is called,
+# and stock_only if the change was only to quantities checked out
+catalog_changed = Signal()
+
+
+class CatalogVersionManager(models.Manager):
+    # Every transaction id which isn't in progress any more, other than the
+    # current transaction's own, i.e. the highest version whose changes can all
+    # be seen. Offset by the version row, see 0021_catalog_version_txid.
+    current_sql = """
+        WITH s AS (SELECT txid_current_snapshot() AS snapshot)
+        SELECT COALESCE(
+            (
+                SELECT MIN(xip) FROM txid_snapshot_xip(s.snapshot) AS xip
+                WHERE xip IS DISTINCT FROM txid_current_if_assigned()
+            ),
+            txid_snapshot_xmax(s.snapshot)
+        ) - 1 + COALESCE((SELECT version FROM {table} WHERE id = 1), 0)
+        FROM s
+    """
+    bump_sql = """
+        SELECT txid_current() + COALESCE((SELECT version FROM {table} WHERE id = 1), 0)
+    """
+
+    def _execute(self, sql):
+        connection = connections[self.db]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql.format(table=connection.ops.quote_name(self.model._meta.db_table))
+            )
+            return cursor.fetchone()[0]
+
+    def current(self):
+        """
+        The highest version which clients can safely sync up to: no transaction
+        still in progress will stamp anything with this version or a lower one.
+        """
+        if connections[self.db].vendor == "postgresql":
+            return self._execute(self.current_sql)
+        return self.filter(pk=1).values_list("version", flat=True).first() or 0
+
+    def bump(self, stock_only=False):
+        """
+        Return the version to stamp the current transaction's catalog changes
+        with. On postgres this is the transaction's id, so nothing is locked and
+        concurrent transactions never wait on each other; current() holds back
+        versions until every transaction before them has ended, so a client which
+        has seen version N can never miss a change numbered N or lower.
+
+        Elsewhere (i.e. sqlite, which only runs one write transaction at a time
+        anyway) the version row is incremented, and stays locked until the
+        transaction ends.
+
+        Pass stock_only for changes to quantities checked out and nothing else,
+        which don't invalidate the catalog cache (see hardware.cache).
+        """
+        if connections[self.db].vendor == "postgresql":
+            version = self._execute(self.bump_sql)
+        else:
+            queryset = self.filter(pk=1)
+            if not queryset.update(version=F("version") + 1):
+                self.get_or_create(pk=1)
+                queryset.update(version=F("version") + 1)
+            version = queryset.values_list("version", flat=True).get()
+        catalog_changed.send(
+            sender=CatalogVersion, version=version, stock_only=stock_only
+        )
+        return version
+
+
+class CatalogVersion(models.Model):
+    """
+    A single row versioning changes to the hardware catalog. Every change to a
+    hardware (including its stock) or category stamps it with a new version, see
+    HardwareChangesView. On postgres, versions are transaction ids and this row
+    only holds the offset they're shifted by, otherwise it counts the changes.
+    """
+
+    objects = CatalogVersionManager()
+
+    version = models.BigIntegerField(null=False, default=0)
+
+    def __str__(self):
+        return f"{self.version}"
+
+
+class CatalogTombstone(models.Model):
+    """
+    Records the version at which a hardware or category was deleted, so clients
+    syncing the catalog can drop it.
+    """
+
+    KIND_CHOICES = [
+        ("hardware", "hardware"),
+        ("category", "category"),
+    ]
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES, null=False)
+    object_id = models.IntegerField(null=False)
+    version = models.BigIntegerField(null=False, db_index=True)
+
+    created_at = models.DateTimeField(auto_now_add=True, null=False)
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
+
+
+class CategoryQuerySet(models.QuerySet):
+    def with_stock_summary(self):
+        """
+        Annotate each category with how many hardware are in it, and their total
+        quantity available and remaining, in one grouped query.
+        """
+        return self.annotate(
+            unique_hardware_count=Count("hardware"),
+            total_quantity_available=Coalesce(Sum("hardware__quantity_available"), 0),
+            total_quantity_remaining=Coalesce(
+                Sum(
+                    F("hardware__quantity_available")
+                    - F("hardware__quantity_checked_out")
+                ),
+                0,
+            ),
+        )
 
 
 class Category(models.Model):
+    objects = CategoryQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = "categories"
 
     name = models.CharField(max_length=255, null=False)
     max_per_team = models.IntegerField(null=True)
+    # Catalog version of the last change, see CatalogVersion
+    version = models.BigIntegerField(null=False, default=0, db_index=True)
 
     created_at = models.DateTimeField(auto_now_add=True, null=False)
     updated_at = models.DateTimeField(auto_now=True, null=False)
@@ -19,25 +156,140 @@ class Category(models.Model):
 
 
 class AnnotatedHardwareManager(models.Manager):
+    """
+    Annotates every hardware with its quantity remaining. This is derived from the
+    stored quantity_checked_out counter, so it doesn't need to join over the order
+    history.
+
+    The counter is kept up to date by the OrderItem and Order signals in
+    hardware.signals, and by OrderItemQuerySet.bulk_create. Anything which
+    changes order items or order statuses with QuerySet.update() or bulk_update()
+    must call adjust_checked_out itself, in the same transaction.
+
+    Every change to the counter also stamps the hardware with a new catalog
+    version (see CatalogVersion), so stock changes show up in the change feed.
+
+    Hardware reached through a join which can repeat it (e.g. order.hardware, or
+    filtering on several categories) needs .distinct() to only be returned once.
+    """
+
     def get_queryset(self):
         return (
             super()
             .get_queryset()
-            .annotate(
-                quantity_checked_out=Count(
-                    "order_items",
-                    filter=(
-                        ~Q(order_items__part_returned_health="Healthy")
-                        & ~Q(order_items__order__status="Cancelled")
-                    ),
-                    distinct=True,
-                )
-            )
             .annotate(
                 quantity_remaining=(F("quantity_available") - F("quantity_checked_out"))
             )
         )
 
+    def adjust_checked_out(self, deltas):
+        """
+        Apply a mapping of hardware id -> change in quantity checked out. The
+        update is done with F expressions so concurrent changes don't clobber
+        each other.
+        """
+        deltas = {hardware_id: delta for hardware_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+
+        queryset = super().get_queryset()
+        version = CatalogVersion.objects.bump(stock_only=True)
+        for hardware_id, delta in deltas.items():
+            queryset.filter(pk=hardware_id).update(
+                quantity_checked_out=F("quantity_checked_out") + delta, version=version,
+            )
+
+    def touch(self, hardware_ids):
+        """
+        Stamp the given hardware with a new catalog version, after a change which
+        doesn't go through Hardware.save (e.g. to its categories).
+        """
+        hardware_ids = list(hardware_ids)
+        if hardware_ids:
+            super().get_queryset().filter(pk__in=hardware_ids).update(
+                version=CatalogVersion.objects.bump()
+            )
+
+    def reserve(self, hardware_id, quantity, keep=0):
+        """
+        Take up to quantity items of a hardware out of stock with a conditional
+        update, so concurrent orders can never oversell. Only the one hardware row
+        is locked, until the surrounding transaction ends. keep items are left in
+        stock, e.g. for other teams' holds (see hardware.holds).
+
+        Returns how many items were reserved, which is less than requested if
+        other orders got to the stock first.
+        """
+        queryset = super().get_queryset().filter(pk=hardware_id)
+        while quantity > 0:
+            reserved = queryset.filter(
+                quantity_available__gte=F("quantity_checked_out") + quantity + keep
+            ).update(quantity_checked_out=F("quantity_checked_out") + quantity)
+            if reserved:
+                # Only versioned once the stock actually changed. The row is
+                # locked by the update above until the transaction ends anyway.
+                queryset.update(version=CatalogVersion.objects.bump(stock_only=True))
+                return quantity
+
+            remaining = (
+                queryset.annotate(
+                    remaining=F("quantity_available") - F("quantity_checked_out") - keep
+                )
+                .values_list("remaining", flat=True)
+                .first()
+            )
+            quantity = min(quantity, remaining or 0)
+        return 0
+
+    def rebuild_checked_out(self, hardware_ids=None):
+        """
+        Recompute the quantity checked out from the order items, for all hardware
+        or just the ones given. Returns a dict of hardware id -> (old, new) for
+        every counter that was out of date.
+        """
+        queryset = super().get_queryset()
+        if hardware_ids is not None:
+            queryset = queryset.filter(pk__in=hardware_ids)
+
+        order_items = OrderItem.objects.filter(OrderItem.CHECKED_OUT_Q)
+        if hardware_ids is not None:
+            order_items = order_items.filter(hardware_id__in=hardware_ids)
+        actual_counts = dict(
+            order_items.values("hardware_id")
+            .annotate(count=Sum("quantity"))
+            .values_list("hardware_id", "count")
+        )
+
+        changed = {}
+        for hardware in queryset.only("id", "quantity_checked_out"):
+            actual = actual_counts.get(hardware.id, 0)
+            if hardware.quantity_checked_out != actual:
+                changed[hardware.id] = (hardware.quantity_checked_out, actual)
+        if changed:
+            version = CatalogVersion.objects.bump(stock_only=True)
+            for hardware_id, (_, actual) in changed.items():
+                queryset.filter(pk=hardware_id).update(
+                    quantity_checked_out=actual, version=version
+                )
+        return changed
+
+    def refresh_search_documents(self, hardware_ids):
+        """
+        Rebuild the search document (and on postgres the search vector) of the
+        given hardware, after they or their categories changed. Called by the
+        signals in hardware.signals, and needed after any bulk change to names,
+        model numbers, manufacturers or categories.
+        """
+        queryset = super().get_queryset().filter(pk__in=hardware_ids)
+        hardware = list(queryset.prefetch_related("categories"))
+        for item in hardware:
+            item.search_document = build_search_document(
+                item, [category.name for category in item.categories.all()]
+            )
+        queryset.bulk_update(hardware, ["search_document"])
+        if connections[queryset.db].vendor == "postgresql":
+            queryset.update(search_vector=build_search_vector())
+
 
 class Hardware(models.Model):
     objects = AnnotatedHardwareManager()
@@ -46,20 +298,32 @@ class Hardware(models.Model):
         verbose_name_plural = "hardware"
 
     class Config:
-        annotated_fields = ("quantity_checked_out", "quantity_remaining")
+        annotated_fields = ("quantity_remaining",)
 
     name = models.CharField(max_length=255, null=False)
     model_number = models.CharField(max_length=255, null=True, blank=True)
     manufacturer = models.CharField(max_length=255, null=True, blank=True)
     datasheet = models.URLField(null=True, blank=True)
     quantity_available = models.IntegerField(null=False)
+    # Maintained counter of items out on non-cancelled orders, see
+    # AnnotatedHardwareManager
+    quantity_checked_out = models.IntegerField(null=False, default=0)
     notes = models.TextField(null=True, blank=True)
     max_per_team = models.IntegerField(null=True)
     picture = models.ImageField(
         upload_to="uploads/hardware/pictures/", null=True, blank=True
     )
     image_url = models.CharField(max_length=500, null=True, blank=True)
+    # Resized copies of the picture, see hardware.images
+    picture_derivatives = models.JSONField(null=False, blank=True, default=dict)
+    # Local copy of the image at image_url, see hardware.mirror
+    image_mirror = models.JSONField(null=False, blank=True, default=dict)
     categories = models.ManyToManyField(Category)
+    # Derived from the fields above and the category names, see hardware.search
+    search_document = models.TextField(null=False, blank=True, default="")
+    search_vector = SearchVectorField(null=True, blank=True)
+    # Catalog version of the last change, see CatalogVersion
+    version = models.BigIntegerField(null=False, default=0, db_index=True)
 
     created_at = models.DateTimeField(auto_now_add=True, null=False)
     updated_at = models.DateTimeField(auto_now=True, null=False)
@@ -79,7 +343,36 @@ class Hardware(models.Model):
         return f"{self.name} | {self.manufacturer}"
 
 
+class OrderItemQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, update_stock=True, **kwargs):
+        """
+        Pass update_stock=False if the items were already taken out of stock with
+        AnnotatedHardwareManager.reserve.
+        """
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if not update_stock:
+            return objs
+
+        deltas = Counter()
+        for item in objs:
+            deltas[item.hardware_id] += item.quantity_checked_out
+        Hardware.objects.adjust_checked_out(deltas)
+        return objs
+
+
 class OrderItem(models.Model):
+    """
+    A quantity of identical units of a hardware in an order, which have all been
+    returned in the same state (or not returned yet). Orders get one item per
+    hardware when they are created, and returning part of an item splits it.
+    """
+
+    objects = OrderItemQuerySet.as_manager()
+
+    # Order items which count against their hardware's stock: anything not
+    # returned in a healthy state, on an order which hasn't been cancelled
+    CHECKED_OUT_Q = ~Q(part_returned_health="Healthy") & ~Q(order__status="Cancelled")
+
     HEALTH_CHOICES = [
         ("Healthy", "Healthy"),
         ("Heavily Used", "Heavily Used"),
@@ -95,6 +388,16 @@ class OrderItem(models.Model):
     part_returned_health = models.CharField(
         max_length=64, choices=HEALTH_CHOICES, null=True, blank=True
     )
+    quantity = models.PositiveIntegerField(null=False, default=1)
+
+    @property
+    def quantity_checked_out(self):
+        """
+        How many of this item's units count against the hardware's stock
+        """
+        if self.part_returned_health == "Healthy" or self.order.status == "Cancelled":
+            return 0
+        return self.quantity
 
     def __str__(self):
         return f"{self.id} | {self.hardware.name} | Team {self.order.team.team_code if self.order.team else None}"
@@ -119,6 +422,9 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, null=False)
     updated_at = models.DateTimeField(auto_now=True, null=False)
 
+    class Meta:
+        indexes = [models.Index(fields=["created_at", "id"])]
+
     def __str__(self):
         return f"{self.id}"
 
@@ -142,5 +448,95 @@ class Incident(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, null=False)
     updated_at = models.DateTimeField(auto_now=True, null=False)
 
+    class Meta:
+        indexes = [models.Index(fields=["created_at", "id"])]
+
     def __str__(self):
         return f"{self.id}"
+
+
+class MirroredImage(models.Model):
+    """
+    A local copy of an external image which hardware link to with image_url,
+    kept up to date by the mirror_hardware_images worker (see hardware.mirror).
+    The file stays empty until the image is first fetched.
+    """
+
+    url = models.CharField(max_length=500, null=False, unique=True)
+    file = models.FileField(upload_to="uploads/hardware/mirror/", blank=True)
+    # Validators of the fetched copy, sent back to revalidate it
+    etag = models.CharField(max_length=255, null=False, blank=True, default="")
+    last_modified = models.CharField(max_length=64, null=False, blank=True, default="")
+
+    failures = models.PositiveIntegerField(null=False, default=0)
+    last_error = models.TextField(null=False, blank=True, default="")
+    next_check_at = models.DateTimeField(
+        null=False, default=timezone.now, db_index=True
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True, null=False)
+    updated_at = models.DateTimeField(auto_now=True, null=False)
+
+    def __str__(self):
+        return self.url
+
+    def record_failure(self, error, backoff, max_backoff):
+        """
+        Schedule the next attempt with exponential backoff. Any copy fetched
+        before is kept, since a stale image is better than none.
+        """
+        self.failures += 1
+        self.last_error = str(error)
+        delay = min(backoff * 2 ** (self.failures - 1), max_backoff)
+        self.next_check_at = timezone.now() + timedelta(seconds=delay)
+
+
+class QueuedEmail(models.Model):
+    """
+    An email waiting to be sent by the send_queued_emails worker. Order
+    endpoints write these in the same transaction as the change they notify
+    about, so a slow or unavailable mail server never holds up a request, and
+    nothing is sent for a change that gets rolled back.
+    """
+
+    subject = models.CharField(max_length=998, null=False)
+    message = models.TextField(null=False)
+    html_message = models.TextField(null=False, blank=True, default="")
+    from_email = models.CharField(max_length=255, null=False)
+    recipient_list = models.JSONField(null=False)
+
+    attempts = models.PositiveIntegerField(null=False, default=0)
+    next_attempt_at = models.DateTimeField(null=False, default=timezone.now)
+    last_error = models.TextField(null=False, blank=True, default="")
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True, null=False)
+    updated_at = models.DateTimeField(auto_now=True, null=False)
+
+    class Meta:
+        indexes = [models.Index(fields=["sent_at", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"{self.id}"
+
+    def to_message(self, connection=None):
+        email = EmailMultiAlternatives(
+            subject=self.subject,
+            body=self.message,
+            from_email=self.from_email,
+            to=self.recipient_list,
+            connection=connection,
+        )
+        if self.html_message:
+            email.attach_alternative(self.html_message, "text/html")
+        return email
+
+    def record_failure(self, error, backoff, max_backoff):
+        """
+        Schedule the next attempt with exponential backoff, i.e. backoff seconds
+        after the first failure and doubling on each one after that.
+        """
+        self.attempts += 1
+        self.last_error = str(error)
+        delay = min(backoff * 2 ** (self.attempts - 1), max_backoff)
+        self.next_attempt_at = timezone.now() + timedelta(seconds=delay)
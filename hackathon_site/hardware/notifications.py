@@ -0,0 +1,175 @@
+from html.parser import HTMLParser
+from uuid import uuid4
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from markupsafe import Markup, escape
+
+from hardware.models import QueuedEmail
+
+# Fields of the recipient which change from one team member to the next. Any
+# other attribute of the recipient a template uses (e.g. their team) must be
+# the same for every member.
+PER_RECIPIENT_FIELDS = ("first_name", "last_name", "email")
+
+
+class _RecipientPlaceholder:
+    """
+    Stands in for the recipient while the participant body is rendered, leaving
+    a unique token wherever a per-recipient field is used. The fields the
+    template used are kept in used_fields.
+    """
+
+    def __init__(self, user):
+        self._user = user
+        self.tokens = {
+            field: f"recipient{field.replace('_', '')}{uuid4().hex}"
+            for field in PER_RECIPIENT_FIELDS
+        }
+        self.used_fields = set()
+
+    def __getattr__(self, name):
+        if name in self.tokens:
+            self.used_fields.add(name)
+            return self.tokens[name]
+        return getattr(self._user, name)
+
+
+class _PlainTextParser(HTMLParser):
+    BLOCK_TAGS = {"p", "div", "table", "thead", "tbody", "tr", "ul", "ol", "li"}
+    PARAGRAPH_TAGS = {"p", "table", "ul", "ol"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines = [""]
+        self.href = None
+
+    def _newline(self, blank=False):
+        # None marks a paragraph break, empty lines are dropped
+        if blank:
+            self.lines.append(None)
+        self.lines.append("")
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "br" or tag in self.BLOCK_TAGS:
+            self._newline()
+        elif tag in ("td", "th") and self.lines[-1].strip():
+            self.lines[-1] += " | "
+        elif tag == "a":
+            self.href = dict(attrs).get("href")
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self.href:
+            self.lines[-1] += f" ({self.href})"
+            self.href = None
+        elif tag in self.BLOCK_TAGS:
+            self._newline(blank=tag in self.PARAGRAPH_TAGS)
+
+    def handle_data(self, data):
+        self.lines[-1] += data
+
+    def get_text(self):
+        text_lines = []
+        for line in self.lines:
+            if line is None:
+                if text_lines and text_lines[-1]:
+                    text_lines.append("")
+                continue
+            line = " ".join(line.split())
+            if line:
+                text_lines.append(line)
+        return "\n".join(text_lines).strip()
+
+
+def html_to_text(html):
+    """
+    Derive the plaintext alternative of an HTML email, keeping paragraphs,
+    table rows and link targets.
+    """
+    parser = _PlainTextParser()
+    parser.feed(html)
+    parser.close()
+    return parser.get_text()
+
+
+class OrderNotification:
+    """
+    The emails sent to the hardware admins and to every member of a team when
+    something happens to one of their orders. The subject and each body are
+    rendered once however large the team is, and each member's details are
+    spliced into the participant body afterwards. If the participant template
+    transforms a member's details (e.g. with |upper) so that they can't be
+    spliced in, the participant body is rendered for each member instead.
+    """
+
+    admin_recipient = "Hardware Inventory Admins"
+
+    def __init__(self, subject_template, admin_template, participant_template, context):
+        self.subject_template = subject_template
+        self.admin_template = admin_template
+        self.participant_template = participant_template
+        self.context = context
+
+    def _build_email(self, subject, html_message, recipient_list, message=None):
+        return QueuedEmail(
+            subject=subject,
+            message=html_to_text(html_message) if message is None else message,
+            html_message=html_message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=recipient_list,
+        )
+
+    def build_emails(self, participants):
+        """
+        Build the admin email followed by one email per participant, ready to be
+        saved to the outbox.
+        """
+        participants = list(participants)
+        subject = render_to_string(self.subject_template, self.context)
+        emails = [
+            self._build_email(
+                subject,
+                render_to_string(
+                    self.admin_template,
+                    {**self.context, "recipient": self.admin_recipient},
+                ),
+                [settings.HSS_ADMIN_EMAIL],
+            )
+        ]
+        if not participants:
+            return emails
+
+        placeholder = _RecipientPlaceholder(participants[0])
+        shared_html = render_to_string(
+            self.participant_template, {**self.context, "recipient": placeholder}
+        )
+        if any(
+            placeholder.tokens[field] not in shared_html
+            for field in placeholder.used_fields
+        ):
+            return emails + [
+                self._build_email(
+                    subject,
+                    render_to_string(
+                        self.participant_template,
+                        {**self.context, "recipient": participant},
+                    ),
+                    [participant.email],
+                )
+                for participant in participants
+            ]
+
+        shared_text = html_to_text(shared_html)
+        for participant in participants:
+            html_message, message = shared_html, shared_text
+            for field, token in placeholder.tokens.items():
+                # Same as the |striptags the templates apply
+                value = Markup(str(getattr(participant, field))).striptags()
+                html_message = html_message.replace(token, escape(value))
+                message = message.replace(token, value)
+            emails.append(
+                self._build_email(
+                    subject, html_message, [participant.email], message=message
+                )
+            )
+        return emails
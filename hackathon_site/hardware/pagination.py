@@ -0,0 +1,211 @@
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class OptionalCursorPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination, unless the request has a cursor parameter (empty
+    for the first page), in which case pages are found by seeking past the
+    (created_at, id) of the last row of the previous page. Every page then costs
+    the same however deep it is, and no count query is made. Views can key
+    the cursor on other fields by setting cursor_ordering, the last of which
+    must be unique.
+
+    The cursor follows an ordering on the first key field set by a filter
+    backend (e.g. ?ordering=-created_at), and otherwise runs in ascending order.
+    """
+
+    cursor_query_param = "cursor"
+    default_cursor_ordering = ("created_at", "id")
+    invalid_cursor_message = "Invalid cursor"
+
+    use_cursor = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.fields = tuple(
+            getattr(view, "cursor_ordering", self.default_cursor_ordering)
+        )
+        self.descending = list(queryset.query.order_by[:1]) == [f"-{self.fields[0]}"]
+        values, reverse = self.decode_cursor(request)
+        if values is not None:
+            values = self._parse_values(queryset.model, values)
+
+        # Walking backwards through an ascending ordering is the same as walking
+        # forwards through the descending one, and vice versa
+        backwards = self.descending != reverse
+        queryset = queryset.order_by(
+            *(f"-{field}" if backwards else field for field in self.fields)
+        )
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, backwards))
+
+        results = list(queryset[: self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[: self.limit]
+        if reverse:
+            results.reverse()
+
+        self.next_values = self.previous_values = None
+        if results:
+            if reverse:
+                self.next_values = self._get_values(results[-1])
+                if has_more:
+                    self.previous_values = self._get_values(results[0])
+            else:
+                if has_more:
+                    self.next_values = self._get_values(results[-1])
+                if values is not None:
+                    self.previous_values = self._get_values(results[0])
+        return results
+
+    def _seek(self, values, backwards):
+        """
+        Rows after the given key in the ordering, i.e. (a, b) > (x, y) becomes
+        a > x OR (a = x AND b > y).
+        """
+        lookup = "lt" if backwards else "gt"
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            condition |= Q(
+                **{self.fields[j]: values[j] for j in range(i)},
+                **{f"{field}__{lookup}": values[i]},
+            )
+        return condition
+
+    def _parse_values(self, model, values):
+        """
+        Convert the values of a cursor with the model fields they are for, since
+        the cursor comes from the client and may have been tampered with.
+        """
+        parsed = []
+        for field, value in zip(self.fields, values):
+            *relations, name = field.split("__")
+            opts = model._meta
+            for relation in relations:
+                opts = opts.get_field(relation).related_model._meta
+            try:
+                value = opts.get_field(name).to_python(value)
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            parsed.append(value)
+        return parsed
+
+    def _get_values(self, obj):
+        values = []
+        for field in self.fields:
+            value = obj
+            for attr in field.split("__"):
+                value = getattr(value, attr)
+            values.append(value.isoformat() if isinstance(value, datetime) else value)
+        return values
+
+    def decode_cursor(self, request):
+        encoded = request.query_params[self.cursor_query_param]
+        if not encoded:
+            return None, False
+
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            values, reverse = cursor["v"], bool(cursor["r"])
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def encode_cursor(self, values, reverse=False):
+        cursor = json.dumps({"v": values, "r": int(reverse)})
+        encoded = urlsafe_b64encode(cursor.encode("utf-8")).decode("ascii")
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.offset_query_param
+        )
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if self.next_values is None:
+            return None
+        return self.encode_cursor(self.next_values)
+
+    def get_previous_link(self):
+        if not self.use_cursor:
+            return super().get_previous_link()
+        if self.previous_values is None:
+            return None
+        return self.encode_cursor(self.previous_values, reverse=True)
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+
+class OrderItemUnitPagination(OptionalCursorPagination):
+    """
+    Without a cursor, order items are listed once per unit (see
+    OrderItemUnitListSerializer), so the limit, offset and count are in units
+    rather than items. The items at either end of a page may only have some of
+    their units on it, which is set on them as page_units.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.use_cursor = False
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.request = request
+        if not queryset.ordered:
+            queryset = queryset.order_by("pk")
+
+        # Only the quantities of the whole list are read, to find which items
+        # the units on the page belong to
+        page_units = {}
+        self.count = 0
+        for pk, quantity in queryset.values_list("pk", "quantity"):
+            units = min(self.count + quantity, self.offset + self.limit) - max(
+                self.count, self.offset
+            )
+            if units > 0:
+                page_units[pk] = units
+            self.count += quantity
+
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        if not page_units:
+            return []
+
+        items = list(queryset.filter(pk__in=page_units))
+        for item in items:
+            item.page_units = page_units[item.pk]
+        return items
@@ -0,0 +1,79 @@
+"""
+Order and stock events pushed to the dashboard, see hackathon_site.push.
+
+Every signed in user gets stock events, participants get the events for their
+own team's orders, and hardware admins get the events for every order.
+"""
+from django.db import transaction
+
+from hackathon_site.push import publish
+from hardware.holds import stock_holds
+from hardware.models import CatalogVersion, Hardware
+
+STOCK_CHANNEL = "stock"
+ORDERS_CHANNEL = "orders"
+
+
+def team_channel(team_id):
+    return f"team.{team_id}"
+
+
+def get_user_channels(user):
+    channels = [STOCK_CHANNEL]
+    if user.has_perm("hardware.view_order"):
+        channels.append(ORDERS_CHANNEL)
+    profile = getattr(user, "profile", None)
+    if profile is not None and profile.team_id is not None:
+        channels.append(team_channel(profile.team_id))
+    return channels
+
+
+def publish_order_status(order_id, status, team_id):
+    """
+    Push the order's status to its team and the hardware admins once the
+    current transaction commits.
+    """
+    data = {"id": order_id, "status": status, "team_id": team_id}
+    channels = [ORDERS_CHANNEL]
+    if team_id is not None:
+        channels.append(team_channel(team_id))
+
+    def send():
+        for channel in channels:
+            publish(channel, "order", data)
+
+    transaction.on_commit(send)
+
+
+def publish_stock(hardware_ids):
+    """
+    Push the quantity remaining of the given hardware once the current
+    transaction commits, along with the catalog version to sync from. Items
+    held in teams' carts don't count as remaining.
+    """
+    hardware_ids = list(hardware_ids)
+    if not hardware_ids:
+        return
+
+    def send():
+        publish(
+            STOCK_CHANNEL,
+            "stock",
+            {
+                "version": CatalogVersion.objects.current(),
+                "hardware": stock_holds.apply(
+                    Hardware.objects.filter(pk__in=hardware_ids)
+                    .order_by("id")
+                    .values("id", "quantity_remaining")
+                ),
+            },
+        )
+
+    transaction.on_commit(send)
+
+
+def publish_order_status_change(order):
+    publish_order_status(order.id, order.status, order.team_id)
+    # Cancelling is the only change of status which puts items back in stock
+    if order.status == "Cancelled":
+        publish_stock(order.items.values_list("hardware_id", flat=True))
@@ -0,0 +1,58 @@
+"""
+Ranked search over the hardware catalog. On postgres every hardware stores a
+weighted tsvector (search_vector) for prefix matching, and a plain text
+document (search_document) covering its name, model number, manufacturer and
+category names, which a trigram index makes typo tolerant. Both are GIN indexed
+and kept up to date by AnnotatedHardwareManager.refresh_search_documents.
+
+Other databases (i.e. sqlite in CI) fall back to substring matching on the
+search document.
+"""
+from django.contrib.postgres.lookups import PostgresOperatorLookup
+from django.contrib.postgres.search import SearchVector
+from django.db import models
+
+SEARCH_CONFIG = "simple"
+
+
+def build_search_document(hardware, category_names):
+    return " ".join(
+        value
+        for value in (
+            hardware.name,
+            hardware.model_number,
+            hardware.manufacturer,
+            *sorted(category_names),
+        )
+        if value
+    )
+
+
+def build_search_vector():
+    return (
+        SearchVector("name", weight="A", config=SEARCH_CONFIG)
+        + SearchVector("model_number", weight="A", config=SEARCH_CONFIG)
+        + SearchVector("manufacturer", weight="B", config=SEARCH_CONFIG)
+        + SearchVector("search_document", weight="C", config=SEARCH_CONFIG)
+    )
+
+
+class TrigramWordSimilarity(models.Func):
+    """
+    How closely the string matches a run of words in the expression, from 0 to
+    1 (pg_trgm's word_similarity)
+    """
+
+    function = "WORD_SIMILARITY"
+    output_field = models.FloatField()
+
+    def __init__(self, string, expression, **extra):
+        if not hasattr(string, "resolve_expression"):
+            string = models.Value(string)
+        super().__init__(string, expression, **extra)
+
+
+@models.TextField.register_lookup
+class TrigramWordSimilar(PostgresOperatorLookup):
+    lookup_name = "trigram_word_similar"
+    postgres_operator = "%%>"
@@ -1,18 +1,46 @@
 from collections import Counter
 import functools
+import logging
 from datetime import datetime
 
-from django.db.models import Count, Q
+from django.db import models, transaction
+from django.db.models import Q, Sum
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 
 from event.models import Profile
-from hardware.models import Hardware, Category, OrderItem, Order, Incident
+from hardware.holds import HoldLocked, stock_holds
+from hardware.images import get_derivative_names, get_picture_storage
+from hardware.models import (
+    Hardware,
+    Category,
+    OrderItem,
+    Order,
+    Incident,
+    MirroredImage,
+)
+from hardware.push import publish_order_status, publish_stock
+
+logger = logging.getLogger(__name__)
+
+
+def release_hold(team_id):
+    """
+    Release a team's hold once its order has been committed. If another request
+    has the hold locked, it's left to expire rather than failing the order.
+    """
+    try:
+        stock_holds.release(team_id)
+    except HoldLocked:
+        logger.warning("Could not release the hold of team %s", team_id)
 
 
 class HardwareSerializer(serializers.ModelSerializer):
     quantity_remaining = serializers.IntegerField()
+    picture_derivatives = serializers.SerializerMethodField()
+    image_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Hardware
@@ -26,22 +54,86 @@ class HardwareSerializer(serializers.ModelSerializer):
             "notes",
             "max_per_team",
             "picture",
+            "picture_derivatives",
             "image_url",
             "categories",
             "quantity_remaining",
         )
 
+    def get_picture_derivatives(self, obj: Hardware):
+        """
+        URLs of the resized copies of the picture, or None until they have been
+        made from the current picture
+        """
+        names = get_derivative_names(obj)
+        if names is None:
+            return None
+
+        storage = get_picture_storage()
+        return {
+            name: self._build_url(storage.url(file_name))
+            for name, file_name in names.items()
+        }
+
+    def get_image_url(self, obj: Hardware):
+        """
+        The local copy of the image at image_url once it has been mirrored, see
+        hardware.mirror
+        """
+        mirror = obj.image_mirror or {}
+        if obj.image_url and mirror.get("url") == obj.image_url:
+            storage = MirroredImage._meta.get_field("file").storage
+            return self._build_url(storage.url(mirror["file"]))
+        return obj.image_url
+
+    def _build_url(self, url):
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
 
 class CategorySerializer(serializers.ModelSerializer):
-    unique_hardware_count = serializers.SerializerMethodField()
+    """
+    Expects categories from Category.objects.with_stock_summary(), and queries
+    the summary of any other category on its own.
+    """
+
+    unique_hardware_count = serializers.IntegerField(read_only=True)
+    total_quantity_available = serializers.IntegerField(read_only=True)
+    total_quantity_remaining = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Category
-        fields = ("id", "name", "max_per_team", "unique_hardware_count")
+        fields = (
+            "id",
+            "name",
+            "max_per_team",
+            "unique_hardware_count",
+            "total_quantity_available",
+            "total_quantity_remaining",
+        )
 
-    @staticmethod
-    def get_unique_hardware_count(obj: Category) -> int:
-        return obj.hardware_set.annotate(Count("id", distinct=True)).count()
+    def to_representation(self, instance):
+        if not hasattr(instance, "unique_hardware_count"):
+            instance = Category.objects.with_stock_summary().get(pk=instance.pk)
+        return super().to_representation(instance)
+
+
+class CatalogCategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ("id", "name", "max_per_team")
+
+
+class CatalogChangesQuerySerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, default=0)
+
+
+class CatalogChangesSerializer(serializers.Serializer):
+    version = serializers.IntegerField()
+    hardware = HardwareSerializer(many=True)
+    deleted_hardware = serializers.ListField(child=serializers.IntegerField())
+    categories = CatalogCategorySerializer(many=True)
+    deleted_categories = serializers.ListField(child=serializers.IntegerField())
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -52,6 +144,9 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
 class IncidentCreateSerializer(serializers.ModelSerializer):
     team_id = serializers.SerializerMethodField()
+    # Without the unique validator of the one to one field, since an item of
+    # several units can get an incident for each of them (see create)
+    order_item = serializers.PrimaryKeyRelatedField(queryset=OrderItem.objects.all())
 
     class Meta:
         model = Incident
@@ -71,6 +166,31 @@ class IncidentCreateSerializer(serializers.ModelSerializer):
     def get_team_id(obj: Incident) -> int:
         return obj.order_item.order.team.id if obj.order_item.order.team else None
 
+    def create(self, validated_data):
+        """
+        An incident is about one unit, so if the item holds several, one of them
+        is split off into an item of its own for the incident. The rest stay in
+        the original item, which can get incidents in the same way.
+        """
+        order_item = (
+            OrderItem.objects.select_for_update(of=("self",))
+            .select_related("order")
+            .get(pk=validated_data["order_item"].pk)
+        )
+        if order_item.quantity > 1:
+            order_item.quantity -= 1
+            order_item.save(update_fields=["quantity"])
+            order_item = OrderItem.objects.create(
+                order=order_item.order,
+                hardware_id=order_item.hardware_id,
+                part_returned_health=order_item.part_returned_health,
+            )
+        elif Incident.objects.filter(order_item=order_item).exists():
+            raise serializers.ValidationError(
+                {"order_item": ["An incident has already been filed for this unit."]}
+            )
+        return super().create({**validated_data, "order_item": order_item})
+
 
 class IncidentSerializer(IncidentCreateSerializer):
     order_item = OrderItemSerializer()
@@ -98,9 +218,36 @@ class IncidentPatchSerializer(serializers.ModelSerializer):
         return obj.order_item.order.team.id if obj.order_item.order.team else None
 
 
+class OrderItemUnitListSerializer(serializers.ListSerializer):
+    """
+    Order items hold a quantity of identical units, but are listed once per unit
+    so that clients which count the items in an order keep working. Pass
+    expand_units=False in the context to list each item once with its quantity.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        if not self.context.get("expand_units", True):
+            return [self.child.to_representation(item) for item in iterable]
+
+        units = []
+        for item in iterable:
+            representation = self.child.to_representation(item)
+            if "quantity" in representation:
+                representation["quantity"] = 1
+            # Paginated lists may only hold some of an item's units, see
+            # OrderItemUnitPagination
+            units += [
+                representation.copy()
+                for _ in range(getattr(item, "page_units", item.quantity))
+            ]
+        return units
+
+
 class OrderItemInOrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
+        list_serializer_class = OrderItemUnitListSerializer
         fields = (
             "id",
             "hardware_id",
@@ -117,6 +264,7 @@ class OrderItemListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = OrderItem
+        list_serializer_class = OrderItemUnitListSerializer
         fields = (
             "id",
             "order_id",
@@ -125,6 +273,7 @@ class OrderItemListSerializer(serializers.ModelSerializer):
             "updated_at",
             "part_returned_health",
             "hardware",
+            "quantity",
         )
 
     @staticmethod
@@ -198,6 +347,101 @@ class TeamOrderChangeSerializer(OrderChangeSerializer):
     }
 
 
+class OrderStatusBulkChangeSerializer(serializers.Serializer):
+    """
+    Changes the status of many orders at once, with the same transitions allowed
+    as OrderChangeSerializer. Either every change is made or none are.
+    """
+
+    class OrderStatusChangeSerializer(serializers.Serializer):
+        id = serializers.IntegerField(required=True)
+        status = serializers.ChoiceField(choices=Order.STATUS_CHOICES, required=True)
+
+    orders = OrderStatusChangeSerializer(many=True, required=True, allow_empty=False)
+
+    change_options = OrderChangeSerializer.change_options
+
+    def validate_orders(self, data):
+        # The orders stay locked until the changes are saved, so their status
+        # can't change in between
+        orders = (
+            Order.objects.select_related("team")
+            .prefetch_related("items")
+            .select_for_update(of=("self",))
+            .in_bulk({change["id"] for change in data})
+        )
+
+        errors = []
+        seen = set()
+        for change in data:
+            order = orders.get(change["id"])
+            if order is None:
+                errors.append({"id": [f"Order {change['id']} does not exist."]})
+            elif order.id in seen:
+                errors.append({"id": [f"Order {order.id} is changed more than once."]})
+            elif order.status not in self.change_options:
+                errors.append({"status": ["Cannot change the status for this order."]})
+            elif change["status"] not in self.change_options[order.status]:
+                errors.append(
+                    {
+                        "status": [
+                            f"Cannot change the status of an order from "
+                            f"{order.status} to {change['status']}."
+                        ]
+                    }
+                )
+            else:
+                errors.append({})
+                change["order"] = order
+            seen.add(change["id"])
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return data
+
+    def create(self, validated_data):
+        changes = validated_data["orders"]
+        order_ids_by_status = {}
+        for change in changes:
+            order_ids_by_status.setdefault(change["status"], []).append(
+                change["order"].id
+            )
+
+        # Cancelling an order puts its unreturned items back in stock. The
+        # updates below don't send the Order signals which would otherwise do
+        # it, so the items are counted before the orders are cancelled.
+        returned_counts = {}
+        if "Cancelled" in order_ids_by_status:
+            returned_counts = dict(
+                OrderItem.objects.filter(
+                    OrderItem.CHECKED_OUT_Q,
+                    order_id__in=order_ids_by_status["Cancelled"],
+                )
+                .values("hardware_id")
+                .annotate(count=Sum("quantity"))
+                .values_list("hardware_id", "count")
+            )
+
+        updated_at = timezone.now()
+        for new_status, order_ids in order_ids_by_status.items():
+            Order.objects.filter(pk__in=order_ids).update(
+                status=new_status, updated_at=updated_at
+            )
+        Hardware.objects.adjust_checked_out(
+            {hardware_id: -count for hardware_id, count in returned_counts.items()}
+        )
+
+        orders = []
+        for change in changes:
+            order = change["order"]
+            order.status = change["status"]
+            order.updated_at = updated_at
+            publish_order_status(order.id, order.status, order.team_id)
+            orders.append(order)
+        publish_stock(returned_counts.keys())
+        return orders
+
+
 class OrderCreateSerializer(serializers.Serializer):
     class OrderCreateHardwareSerializer(serializers.Serializer):
         id = serializers.PrimaryKeyRelatedField(
@@ -219,6 +463,74 @@ class OrderCreateSerializer(serializers.Serializer):
             Counter(),
         )
 
+    @staticmethod
+    def check_team_quotas(team, requested_hardware):
+        """
+        Check a merged hardware request against stock and the max_per_team limits
+        of the hardware and their categories. The team's unreturned items and the
+        categories of all requested hardware are each fetched in one query, so
+        this does not get slower as the cart grows.
+
+        Only the team's unreturned items of the requested hardware count towards
+        category limits. Items which other teams hold (see hardware.holds) don't
+        count as in stock. Returns a list of error messages.
+        """
+        hardware_ids = [hardware.id for hardware in requested_hardware.keys()]
+        held_by_others = stock_holds.get_held(hardware_ids, exclude_team_id=team.id)
+        unreturned_counts = dict(
+            OrderItem.objects.filter(
+                Q(order__team=team)
+                & Q(hardware_id__in=hardware_ids)
+                & Q(part_returned_health__isnull=True)
+                & ~Q(order__status="Cancelled")
+            )
+            .values("hardware_id")
+            .annotate(count=Sum("quantity"))
+            .values_list("hardware_id", "count")
+        )
+        hardware_categories = {}
+        for hardware_category in (
+            Hardware.categories.through.objects.filter(hardware_id__in=hardware_ids)
+            .select_related("category")
+            .order_by("id")
+        ):
+            hardware_categories.setdefault(hardware_category.hardware_id, []).append(
+                hardware_category.category
+            )
+
+        categories = dict()
+        category_counts = dict()
+        error_messages = []
+        for (hardware, requested_quantity) in requested_hardware.items():
+            team_hardware_count = unreturned_counts.get(hardware.id, 0)
+            in_stock = hardware.quantity_remaining - held_by_others.get(hardware.id, 0)
+            if in_stock - requested_quantity < 0:
+                error_messages.append(
+                    f"Unable to order Hardware {hardware.name} because there are not enough items in stock"
+                )
+            elif (team_hardware_count + requested_quantity) > hardware.max_per_team:
+                error_messages.append(
+                    "Maximum number of items for Hardware {} is reached (limit of {} per team)".format(
+                        hardware.name, hardware.max_per_team
+                    )
+                )
+            for category in hardware_categories.get(hardware.id, []):
+                categories[category.id] = category
+                category_counts[category.id] = (
+                    category_counts.get(category.id, 0)
+                    + team_hardware_count
+                    + requested_quantity
+                )
+        for (category_id, count) in category_counts.items():
+            category = categories[category_id]
+            if count > category.max_per_team:
+                error_messages.append(
+                    "Maximum number of items for the Category {} is reached (limit of {} items per team)".format(
+                        category.name, category.max_per_team
+                    )
+                )
+        return error_messages
+
     # check that the requests are within per-team constraints
     def validate(self, data):
         if (
@@ -251,50 +563,9 @@ class OrderCreateSerializer(serializers.Serializer):
         requested_hardware = self.merge_requests(hardware_requests=data["hardware"])
         if not requested_hardware:
             raise serializers.ValidationError("No hardware submitted")
-        hardware_query = (
-            Hardware.objects.filter(
-                id__in=[hardware.id for hardware in requested_hardware.keys()],
-            )
-            .all()
-            .prefetch_related("categories", "order_items")
+        error_messages = self.check_team_quotas(
+            team=user_profile.team, requested_hardware=requested_hardware
         )
-        team_unreturned_orders = hardware_query.annotate(
-            past_order_count=Count(
-                "order_items",
-                filter=Q(order_items__part_returned_health__isnull=True)
-                & ~Q(order_items__order__status="Cancelled")
-                & Q(order_items__order__team=user_profile.team),
-                distinct=True,
-            )
-        )
-        category_counts = dict()
-        error_messages = []
-        for (hardware, requested_quantity) in requested_hardware.items():
-            team_hardware = team_unreturned_orders.get(id=hardware.id)
-            team_hardware_count = getattr(team_hardware, "past_order_count", 0)
-            if hardware.quantity_remaining - requested_quantity < 0:
-                error_messages.append(
-                    f"Unable to order Hardware {hardware.name} because there are not enough items in stock"
-                )
-            elif (team_hardware_count + requested_quantity) > hardware.max_per_team:
-                error_messages.append(
-                    "Maximum number of items for Hardware {} is reached (limit of {} per team)".format(
-                        hardware.name, hardware.max_per_team
-                    )
-                )
-            for category in hardware.categories.all():
-                category_counts[category] = (
-                    category_counts.get(category, 0)
-                    + team_hardware_count
-                    + requested_quantity
-                )
-        for (category, count) in category_counts.items():
-            if count > category.max_per_team:
-                error_messages.append(
-                    "Maximum number of items for the Category {} is reached (limit of {} items per team)".format(
-                        category.name, category.max_per_team
-                    )
-                )
         if error_messages:
             raise serializers.ValidationError(error_messages)
         return data
@@ -315,9 +586,29 @@ class OrderCreateSerializer(serializers.Serializer):
                 {"id": hardware.id, "requested_quantity": requested_quantity}
             )
 
+        # Stock is reserved in hardware id order, so that concurrent orders lock
+        # the same hardware rows in the same order and can't deadlock. Another
+        # order may have taken stock since validation, in which case only part
+        # of the request is fulfilled. What other teams hold is left in stock,
+        # and the team's own hold becomes the order.
+        team = self.context["request"].user.profile.team
+        held_by_others = stock_holds.get_held(
+            [hardware.id for hardware in requested_hardware.keys()],
+            exclude_team_id=team.id,
+        )
+        reserved_quantities = {
+            hardware.id: Hardware.objects.reserve(
+                hardware.id, requested_quantity, keep=held_by_others.get(hardware.id, 0)
+            )
+            for (hardware, requested_quantity) in sorted(
+                requested_hardware.items(), key=lambda request: request[0].id
+            )
+        }
+        transaction.on_commit(lambda: release_hold(team.id))
+
         order_items = []
         for (hardware, requested_quantity) in requested_hardware.items():
-            num_order_items = min(hardware.quantity_remaining, requested_quantity)
+            num_order_items = reserved_quantities[hardware.id]
             if num_order_items <= 0:
                 response_data["hardware"].append(
                     {"hardware_id": hardware.id, "quantity_fulfilled": 0}
@@ -331,15 +622,14 @@ class OrderCreateSerializer(serializers.Serializer):
                 continue
             if new_order is None:
                 new_order = Order.objects.create(
-                    team=self.context["request"].user.profile.team,
+                    team=team,
                     status="Submitted",
                     request=serialized_requested_hardware,
                 )
                 response_data["order_id"] = new_order.id
-            order_items += [
-                OrderItem(order=new_order, hardware=hardware)
-                for _ in range(num_order_items)
-            ]
+            order_items.append(
+                OrderItem(order=new_order, hardware=hardware, quantity=num_order_items)
+            )
             response_data["hardware"].append(
                 {"hardware_id": hardware.id, "quantity_fulfilled": num_order_items}
             )
@@ -353,7 +643,7 @@ class OrderCreateSerializer(serializers.Serializer):
                     }
                 )
         if order_items:
-            OrderItem.objects.bulk_create(order_items)
+            OrderItem.objects.bulk_create(order_items, update_stock=False)
         return response_data
 
 
@@ -379,6 +669,72 @@ class OrderCreateResponseSerializer(serializers.Serializer):
     errors = OrderCreateResponseErrorSerializer(many=True, required=True)
 
 
+class CartHoldSerializer(serializers.Serializer):
+    class CartHoldHardwareSerializer(serializers.Serializer):
+        id = serializers.IntegerField(required=True)
+        quantity = serializers.IntegerField(required=True, min_value=1)
+
+    hardware = CartHoldHardwareSerializer(many=True, required=True)
+
+    def validate_hardware(self, data):
+        requested = Counter()
+        for item in data:
+            requested[item["id"]] += item["quantity"]
+        hardware = Hardware.objects.in_bulk(requested.keys())
+        missing = sorted(set(requested) - set(hardware))
+        if missing:
+            raise serializers.ValidationError(
+                f"Hardware {', '.join(map(str, missing))} does not exist."
+            )
+        # Nothing is held beyond what the team could order
+        return {
+            hardware[hardware_id]: min(quantity, hardware[hardware_id].max_per_team)
+            if hardware[hardware_id].max_per_team is not None
+            else quantity
+            for hardware_id, quantity in requested.items()
+        }
+
+    def create(self, validated_data):
+        team = self.context["request"].user.profile.team
+        previous = stock_holds.get(team.id)["hardware"]
+        hold = stock_holds.hold(
+            team.id,
+            {
+                hardware.id: quantity
+                for hardware, quantity in validated_data["hardware"].items()
+            },
+            {
+                hardware.id: hardware.quantity_remaining
+                for hardware in validated_data["hardware"].keys()
+            },
+        )
+        publish_stock(set(previous) | set(hold["hardware"]))
+        return hold
+
+
+class CartHoldResponseSerializer(serializers.Serializer):
+    class CartHoldQuantitySerializer(serializers.Serializer):
+        hardware_id = serializers.IntegerField()
+        quantity_held = serializers.IntegerField()
+
+    hardware = CartHoldQuantitySerializer(many=True)
+    expires_at = serializers.DateTimeField(allow_null=True)
+
+    def to_representation(self, instance):
+        expires_at = instance["expires_at"]
+        return super().to_representation(
+            {
+                "hardware": [
+                    {"hardware_id": hardware_id, "quantity_held": quantity}
+                    for hardware_id, quantity in sorted(instance["hardware"].items())
+                ],
+                "expires_at": None
+                if expires_at is None
+                else datetime.fromtimestamp(expires_at, tz=timezone.utc),
+            }
+        )
+
+
 class OrderItemReturnSerializer(serializers.Serializer):
     class HardwareItemReturnSerializer(serializers.Serializer):
         HEALTH_CHOICES = ["Healthy", "Heavily Used", "Broken", "Lost"]
@@ -390,7 +746,10 @@ class OrderItemReturnSerializer(serializers.Serializer):
 
     hardware = HardwareItemReturnSerializer(many=True, required=True)
     order = serializers.PrimaryKeyRelatedField(
-        queryset=Order.objects.all(), many=False, required=True
+        queryset=Order.objects.all(), many=False, required=False
+    )
+    orders = serializers.PrimaryKeyRelatedField(
+        queryset=Order.objects.all(), many=True, required=False
     )
 
     def validate(self, data):
@@ -398,17 +757,49 @@ class OrderItemReturnSerializer(serializers.Serializer):
         hardware_array = data["hardware"]
         if len(hardware_array) < 1:
             raise ValidationError("No hardware specified in return request")
+
+        orders = list(data.get("orders", []))
+        if data.get("order") is not None and data["order"] not in orders:
+            orders.append(data["order"])
+        if len(orders) < 1:
+            raise serializers.ValidationError(
+                {"order": "No order specified in return request"}
+            )
+        if len({order.team_id for order in orders}) > 1:
+            raise serializers.ValidationError(
+                {"orders": "All orders in a return request must belong to one team"}
+            )
+        # Units are returned from the oldest order first
+        data["orders"] = sorted(orders, key=lambda order: order.id)
         return data
 
     def create(self, validated_data):
         hardware = validated_data["hardware"]
-        order = validated_data["order"]
-        order_items_in_order = OrderItem.objects.filter(order=order)
+        orders = validated_data["orders"]
+        order_statuses = {order.id: order.status for order in orders}
+        if len(orders) == 1:
+            orders_label = f"order #{orders[0]}"
+        else:
+            orders_label = f"orders {', '.join(f'#{order}' for order in orders)}"
+
+        # Fetch every outstanding item of the orders once, and work out the
+        # return in memory before writing it back in bulk
+        outstanding_items = {}
+        for order_item in OrderItem.objects.filter(
+            order__in=orders, part_returned_health__isnull=True
+        ).order_by("order_id", "id"):
+            outstanding_items.setdefault(order_item.hardware_id, []).append(order_item)
+
+        returned_item_ids = {}
+        shrunk_items = {}
+        split_items = []
+        stock_deltas = Counter()
 
         response_data = {
-            "order_id": order.id,
+            "order_id": orders[0].id,
+            "order_ids": [order.id for order in orders],
             "returned_items": [],
-            "team_code": order.team.team_code,
+            "team_code": orders[0].team.team_code,
             "errors": [],
         }
 
@@ -425,18 +816,18 @@ class OrderItemReturnSerializer(serializers.Serializer):
                 )
                 continue
 
-            order_items_with_hardware = list(
-                order_items_in_order.filter(
-                    hardware=hardware_item["id"], part_returned_health__isnull=True
-                )
+            order_items_with_hardware = outstanding_items.get(
+                hardware_item["id"].id, []
+            )
+            num_checked_out_order_items = sum(
+                item.quantity for item in order_items_with_hardware
             )
-            num_checked_out_order_items = len(order_items_with_hardware)
 
             if num_checked_out_order_items == 0 and hardware_item["quantity"] > 0:
                 response_data["errors"].append(
                     {
                         "hardware_id": hardware_item["id"].id,
-                        "message": f"There are no checked out items for hardware item {hardware_item['id'].name} for order #{order}.",
+                        "message": f"There are no checked out items for hardware item {hardware_item['id'].name} for {orders_label}.",
                     }
                 )
 
@@ -451,11 +842,34 @@ class OrderItemReturnSerializer(serializers.Serializer):
                         }
                     )
 
-            for quantity_idx in range(max_available_quantity):
-                order_items_with_hardware[
-                    quantity_idx
-                ].part_returned_health = hardware_item["part_returned_health"]
-                order_items_with_hardware[quantity_idx].save()
+            health = hardware_item["part_returned_health"]
+            quantity_to_return = max_available_quantity
+            while quantity_to_return > 0:
+                order_item = order_items_with_hardware[0]
+                returned_quantity = min(order_item.quantity, quantity_to_return)
+                if order_item.quantity > returned_quantity:
+                    # Only some of the units are being returned, split them off
+                    # into their own item
+                    order_item.quantity -= returned_quantity
+                    shrunk_items[order_item.id] = order_item
+                    split_items.append(
+                        OrderItem(
+                            order_id=order_item.order_id,
+                            hardware_id=order_item.hardware_id,
+                            quantity=returned_quantity,
+                            part_returned_health=health,
+                        )
+                    )
+                else:
+                    order_items_with_hardware.pop(0)
+                    returned_item_ids.setdefault(health, []).append(order_item.id)
+
+                if (
+                    health == "Healthy"
+                    and order_statuses[order_item.order_id] != "Cancelled"
+                ):
+                    stock_deltas[order_item.hardware_id] -= returned_quantity
+                quantity_to_return -= returned_quantity
 
             if max_available_quantity > 0:
                 response_data["returned_items"].append(
@@ -465,6 +879,18 @@ class OrderItemReturnSerializer(serializers.Serializer):
                     }
                 )
 
+        # Bulk writes skip the stock signals, so the counter is adjusted once
+        # at the end for everything returned healthy
+        if shrunk_items:
+            OrderItem.objects.bulk_update(shrunk_items.values(), ["quantity"])
+        for health, order_item_ids in returned_item_ids.items():
+            OrderItem.objects.filter(id__in=order_item_ids).update(
+                part_returned_health=health
+            )
+        if split_items:
+            OrderItem.objects.bulk_create(split_items, update_stock=False)
+        Hardware.objects.adjust_checked_out(stock_deltas)
+
         return response_data
 
 
@@ -486,6 +912,7 @@ class OrderItemReturnResponseSerializer(serializers.Serializer):
     order_id = serializers.PrimaryKeyRelatedField(
         queryset=Order.objects.all(), many=False, required=True
     )
+    order_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
     team_code = serializers.CharField(required=True)
     returned_items = OrderReturnResponseReturnItemSerializer(many=True, required=True)
     errors = OrderReturnResponseErrorSerializer(many=True, required=True)
@@ -0,0 +1,191 @@
+from collections import Counter
+
+from django.db.models import Sum
+from django.db.models.signals import (
+    pre_save,
+    post_save,
+    pre_delete,
+    post_delete,
+    m2m_changed,
+)
+from django.db import transaction
+from django.dispatch import receiver
+from hardware.cache import catalog_cache
+from hardware.models import (
+    CatalogTombstone,
+    CatalogVersion,
+    Category,
+    Hardware,
+    Order,
+    OrderItem,
+    catalog_changed,
+)
+
+
+@receiver(pre_save, sender=OrderItem, dispatch_uid="order_item_stock_pre_save")
+def remember_order_item_stock(sender, instance, raw=False, **kwargs):
+    """
+    Remember how much of the saved version of an order item counted against
+    stock, so that post_save can work out how the hardware's counter should change.
+    """
+    instance._checked_out_before = None
+    if raw or instance._state.adding:
+        return
+
+    try:
+        previous = sender.objects.select_related("order").get(pk=instance.pk)
+    except sender.DoesNotExist:
+        return
+    instance._checked_out_before = (
+        previous.hardware_id,
+        previous.quantity_checked_out,
+    )
+
+
+@receiver(post_save, sender=OrderItem, dispatch_uid="order_item_stock_post_save")
+def update_order_item_stock(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    deltas = Counter()
+    previous = getattr(instance, "_checked_out_before", None)
+    if previous is not None:
+        deltas[previous[0]] -= previous[1]
+    deltas[instance.hardware_id] += instance.quantity_checked_out
+    Hardware.objects.adjust_checked_out(deltas)
+
+
+@receiver(post_delete, sender=OrderItem, dispatch_uid="order_item_stock_delete")
+def delete_order_item_stock(sender, instance, **kwargs):
+    """
+    Order items are deleted before the order or hardware they cascade from, so
+    both still exist here.
+    """
+    try:
+        checked_out = instance.quantity_checked_out
+    except Order.DoesNotExist:
+        return
+    Hardware.objects.adjust_checked_out({instance.hardware_id: -checked_out})
+
+
+@receiver(pre_save, sender=Order, dispatch_uid="order_stock_pre_save")
+def remember_order_status(sender, instance, raw=False, **kwargs):
+    instance._status_before = None
+    if raw or instance._state.adding:
+        return
+
+    instance._status_before = (
+        sender.objects.filter(pk=instance.pk).values_list("status", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Order, dispatch_uid="order_stock_post_save")
+def update_order_stock(sender, instance, raw=False, **kwargs):
+    """
+    Cancelling an order puts its unreturned items back in stock, and moving it
+    out of cancelled takes them out again.
+    """
+    previous_status = getattr(instance, "_status_before", None)
+    if raw or previous_status is None:
+        return
+
+    was_cancelled = previous_status == "Cancelled"
+    is_cancelled = instance.status == "Cancelled"
+    if was_cancelled == is_cancelled:
+        return
+
+    sign = 1 if was_cancelled else -1
+    hardware_counts = (
+        instance.items.exclude(part_returned_health="Healthy")
+        .values("hardware_id")
+        .annotate(count=Sum("quantity"))
+        .values_list("hardware_id", "count")
+    )
+    Hardware.objects.adjust_checked_out(
+        {hardware_id: sign * count for hardware_id, count in hardware_counts}
+    )
+
+
+@receiver(pre_save, sender=Hardware, dispatch_uid="hardware_version_pre_save")
+@receiver(pre_save, sender=Category, dispatch_uid="category_version_pre_save")
+def bump_catalog_version(sender, instance, **kwargs):
+    instance.version = CatalogVersion.objects.bump()
+
+
+@receiver(post_delete, sender=Hardware, dispatch_uid="hardware_tombstone")
+@receiver(post_delete, sender=Category, dispatch_uid="category_tombstone")
+def create_catalog_tombstone(sender, instance, **kwargs):
+    CatalogTombstone.objects.create(
+        kind="hardware" if sender is Hardware else "category",
+        object_id=instance.pk,
+        version=CatalogVersion.objects.bump(),
+    )
+
+
+def _hardware_categories_changed(hardware_ids):
+    hardware_ids = list(hardware_ids)
+    Hardware.objects.refresh_search_documents(hardware_ids)
+    Hardware.objects.touch(hardware_ids)
+
+
+@receiver(post_save, sender=Hardware, dispatch_uid="hardware_search_post_save")
+def update_hardware_search(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Hardware.objects.refresh_search_documents([instance.pk])
+
+
+@receiver(
+    m2m_changed,
+    sender=Hardware.categories.through,
+    dispatch_uid="hardware_categories_search_changed",
+)
+def update_hardware_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Hardware search documents include category names, so they are rebuilt
+    whenever categories are added to or removed from hardware, from either side
+    of the relation. The hardware also get a new catalog version, since their
+    list of categories changed.
+    """
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            _hardware_categories_changed([instance.pk])
+    elif action == "pre_clear":
+        instance._search_hardware_ids = list(
+            instance.hardware_set.values_list("id", flat=True)
+        )
+    elif action == "post_clear":
+        _hardware_categories_changed(instance._search_hardware_ids)
+    elif action in ("post_add", "post_remove"):
+        _hardware_categories_changed(pk_set)
+
+
+@receiver(post_save, sender=Category, dispatch_uid="category_search_post_save")
+def update_category_search(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        Hardware.objects.refresh_search_documents(
+            instance.hardware_set.values_list("id", flat=True)
+        )
+
+
+@receiver(pre_delete, sender=Category, dispatch_uid="category_search_pre_delete")
+def remember_category_hardware(sender, instance, **kwargs):
+    instance._search_hardware_ids = list(
+        instance.hardware_set.values_list("id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Category, dispatch_uid="category_search_post_delete")
+def update_deleted_category_hardware(sender, instance, **kwargs):
+    _hardware_categories_changed(instance._search_hardware_ids)
+
+
+@receiver(catalog_changed, dispatch_uid="catalog_cache_invalidate")
+def invalidate_catalog_cache(sender, stock_only=False, **kwargs):
+    """
+    Invalidated once the transaction commits, since other workers would only
+    cache the catalog as it was before the commit until then. Changes to stock
+    only invalidate the cached stock, not the pages.
+    """
+    transaction.on_commit(
+        catalog_cache.invalidate_stock if stock_only else catalog_cache.invalidate
+    )
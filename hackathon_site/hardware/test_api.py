@@ -1,24 +1,44 @@
+import json
+from base64 import urlsafe_b64encode
 from datetime import datetime
+from unittest import skipUnless
+from unittest.mock import call, patch
 
 from dateutil.relativedelta import relativedelta
 from django.contrib.auth.models import Permission, Group
+from django.core import mail
+from django.core.cache import cache
 from django.test import override_settings
 from django.urls import reverse
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework import status, serializers
 from rest_framework.test import APITestCase
 
 from event.models import Team, User, Profile
-from hardware.models import Hardware, Category, Order, OrderItem, Incident
+from hardware.models import (
+    CatalogVersion,
+    Hardware,
+    Category,
+    Order,
+    OrderItem,
+    Incident,
+    QueuedEmail,
+)
 from hardware.serializers import (
     HardwareSerializer,
     CategorySerializer,
     OrderListSerializer,
     OrderItemListSerializer,
     IncidentSerializer,
+    OrderCreateSerializer,
 )
 from hackathon_site.tests import SetupUserMixin
+from hardware.cache import catalog_cache
+from hardware.holds import stock_holds
+from hardware.views import OrderListView
 
 
 class HardwareListViewTestCase(SetupUserMixin, APITestCase):
@@ -67,6 +87,9 @@ class HardwareListViewTestCase(SetupUserMixin, APITestCase):
         self.hardware3.categories.add(self.category3)
 
         self.view = reverse("api:hardware:hardware-list")
+        # Changes to the catalog only invalidate the cache once they commit,
+        # which they never do in tests
+        catalog_cache.invalidate()
 
         self.team = Team.objects.create()
         self.order = Order.objects.create(
@@ -102,6 +125,77 @@ class HardwareListViewTestCase(SetupUserMixin, APITestCase):
             [self.hardware1.id, self.hardware2.id, self.hardware3.id],
         )
 
+    def test_cached_with_live_stock(self):
+        self._login()
+        self.client.get(self.view)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.view)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The quantities remaining are cached too
+        self.assertFalse(
+            [query for query in queries if "hardware_hardware" in query["sql"]]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderItem.objects.create(order=self.order, hardware=self.hardware2)
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(self.view).json()
+        # Only the quantities remaining are read from the database again
+        hardware_queries = [
+            query for query in queries if "hardware_hardware" in query["sql"]
+        ]
+        self.assertEqual(len(hardware_queries), 1)
+        self.assertNotIn("hardware_category", hardware_queries[0]["sql"])
+        self.assertEqual(
+            {res["id"]: res["quantity_remaining"] for res in data["results"]},
+            {self.hardware1.id: 1, self.hardware2.id: 3, self.hardware3.id: 5},
+        )
+
+    def test_stock_filters_not_cached(self):
+        self._login()
+        url = self._build_filter_url(in_stock="true")
+        self.client.get(url)
+
+        OrderItem.objects.create(order=self.order, hardware=self.hardware1)
+        data = self.client.get(url).json()
+        self.assertNotIn(self.hardware1.id, [res["id"] for res in data["results"]])
+
+    def _get_streamed_rows(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_stream_ndjson(self):
+        self._login()
+
+        content = self._get_streamed_rows(
+            self._build_filter_url(stream="ndjson", ordering="name")
+        )
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(
+            [row["id"] for row in rows],
+            [self.hardware1.id, self.hardware2.id, self.hardware3.id],
+        )
+        self.assertEqual(rows[1]["categories"], [self.category1.id, self.category2.id])
+        self.assertEqual(rows[1]["quantity_remaining"], 4)
+
+    def test_stream_json_with_filter(self):
+        self._login()
+
+        content = self._get_streamed_rows(
+            self._build_filter_url(stream="json", search="bHardware")
+        )
+        self.assertEqual(
+            [row["id"] for row in json.loads(content)], [self.hardware2.id]
+        )
+
+        content = self._get_streamed_rows(
+            self._build_filter_url(stream="json", search="nothing")
+        )
+        self.assertEqual(json.loads(content), [])
+
     def test_search_by_name(self):
         self._login()
 
@@ -114,6 +208,61 @@ class HardwareListViewTestCase(SetupUserMixin, APITestCase):
         self.assertEqual(len(data["results"]), 1)
         self.assertEqual(data["results"][0]["id"], 2)
 
+    def _search(self, term):
+        response = self.client.get(self._build_filter_url(search=term))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [res["id"] for res in response.json()["results"]]
+
+    def test_search_other_fields(self):
+        self._login()
+        Hardware.objects.create(
+            name="Arduino Uno",
+            model_number="A000066",
+            manufacturer="Arduino",
+            quantity_available=1,
+            max_per_team=1,
+        )
+        self.hardware3.name = "Raspberry Pi"
+        self.hardware3.manufacturer = "Raspberry Pi Foundation"
+        self.hardware3.save()
+
+        self.assertEqual(self._search("category2"), [self.hardware2.id])
+        self.assertEqual(self._search("Foundation"), [self.hardware3.id])
+        self.assertEqual(
+            self._search("A000066"), [Hardware.objects.get(name="Arduino Uno").id]
+        )
+        # All terms have to match
+        self.assertEqual(self._search("category1 bHardware"), [self.hardware2.id])
+
+    def test_search_ordered_by_relevance(self):
+        self._login()
+        self.hardware3.name = "Breadboard jumper wires for a breadboard"
+        self.hardware3.save()
+        self.hardware1.name = "Breadboard"
+        self.hardware1.save()
+
+        self.assertEqual(
+            self._search("breadboard"), [self.hardware1.id, self.hardware3.id]
+        )
+
+    def test_search_category_rename(self):
+        self._login()
+        self.category3.name = "Sensors"
+        self.category3.save()
+
+        self.assertEqual(self._search("sensors"), [self.hardware3.id])
+        # On postgres the old name is still similar to the other categories
+        self.assertNotIn(self.hardware3.id, self._search("category3"))
+
+    @skipUnless(connection.vendor == "postgresql", "Trigram search needs postgres")
+    def test_search_typo_tolerance(self):
+        self._login()
+        self.hardware3.name = "Raspberry Pi"
+        self.hardware3.save()
+
+        self.assertEqual(self._search("rasberry"), [self.hardware3.id])
+        self.assertEqual(self._search("raspb"), [self.hardware3.id])
+
     def test_in_stock_true(self):
         self._login()
         OrderItem.objects.create(hardware=self.hardware1, order=self.order)
@@ -278,6 +427,7 @@ class HardwareDetailViewTestCase(SetupUserMixin, APITestCase):
             "notes": None,
             "max_per_team": 1,
             "picture": "http://testserver/media/picture/location",
+            "picture_derivatives": None,
             "image_url": None,
         }
 
@@ -288,12 +438,135 @@ class HardwareDetailViewTestCase(SetupUserMixin, APITestCase):
         self.assertEqual(expected_response, data)
 
 
+class HardwareChangesViewTestCase(SetupUserMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name="category", max_per_team=4)
+        self.hardware1 = Hardware.objects.create(name="Arduino", quantity_available=2)
+        self.hardware2 = Hardware.objects.create(name="ESP32", quantity_available=3)
+        self.hardware1.categories.add(self.category)
+        self.view = reverse("api:hardware:hardware-changes")
+
+    def _get_changes(self, since):
+        response = self.client.get(self.view, {"since": since})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_user_not_logged_in(self):
+        response = self.client.get(self.view)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_since_zero_returns_whole_catalog(self):
+        self._login()
+        data = self._get_changes(0)
+
+        self.assertEqual(
+            data["hardware"],
+            [
+                HardwareSerializer(Hardware.objects.get(pk=hardware.pk)).data
+                for hardware in (self.hardware1, self.hardware2)
+            ],
+        )
+        self.assertEqual(
+            data["categories"],
+            [{"id": self.category.id, "name": "category", "max_per_team": 4}],
+        )
+        self.assertEqual(data["deleted_hardware"], [])
+        self.assertEqual(data["deleted_categories"], [])
+
+    def test_no_changes(self):
+        self._login()
+        version = self._get_changes(0)["version"]
+
+        self.assertEqual(
+            self._get_changes(version),
+            {
+                "version": version,
+                "hardware": [],
+                "deleted_hardware": [],
+                "categories": [],
+                "deleted_categories": [],
+            },
+        )
+
+    def test_stock_changes(self):
+        self._login()
+        version = self._get_changes(0)["version"]
+
+        team = Team.objects.create()
+        order = Order.objects.create(status="Submitted", team=team, request={})
+        OrderItem.objects.create(order=order, hardware=self.hardware2, quantity=2)
+        data = self._get_changes(version)
+        self.assertGreater(data["version"], version)
+        self.assertEqual(
+            [
+                (hardware["id"], hardware["quantity_remaining"])
+                for hardware in data["hardware"]
+            ],
+            [(self.hardware2.id, 1)],
+        )
+        self.assertEqual(data["categories"], [])
+
+        order.status = "Cancelled"
+        order.save()
+        data = self._get_changes(data["version"])
+        self.assertEqual(
+            [
+                (hardware["id"], hardware["quantity_remaining"])
+                for hardware in data["hardware"]
+            ],
+            [(self.hardware2.id, 3)],
+        )
+
+    def test_category_changes(self):
+        self._login()
+        version = self._get_changes(0)["version"]
+
+        self.category.name = "renamed"
+        self.category.save()
+        self.hardware2.categories.add(self.category)
+        data = self._get_changes(version)
+
+        self.assertEqual(
+            [category["name"] for category in data["categories"]], ["renamed"]
+        )
+        self.assertEqual(
+            [hardware["id"] for hardware in data["hardware"]], [self.hardware2.id]
+        )
+
+    def test_deletions(self):
+        self._login()
+        version = self._get_changes(0)["version"]
+
+        category_id, hardware_id = self.category.id, self.hardware2.id
+        self.category.delete()
+        self.hardware2.delete()
+        data = self._get_changes(version)
+
+        self.assertEqual(data["deleted_hardware"], [hardware_id])
+        self.assertEqual(data["deleted_categories"], [category_id])
+        # Losing its category changed the other hardware
+        self.assertEqual(
+            [hardware["id"] for hardware in data["hardware"]], [self.hardware1.id]
+        )
+        self.assertEqual(
+            self._get_changes(data["version"])["deleted_hardware"], [],
+        )
+
+    def test_invalid_since(self):
+        self._login()
+        response = self.client.get(self.view, {"since": "-1"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("since", response.json())
+
+
 class CategoryListViewTestCase(SetupUserMixin, APITestCase):
     def setUp(self):
         super().setUp()
         self.category = Category.objects.create(name="category", max_per_team=4)
         self.category_serializer = CategorySerializer(self.category)
         self.view = reverse("api:hardware:category-list")
+        catalog_cache.invalidate()
 
     def test_user_not_logged_in(self):
         response = self.client.get(self.view)
@@ -307,6 +580,8 @@ class CategoryListViewTestCase(SetupUserMixin, APITestCase):
             "name": "category",
             "max_per_team": 4,
             "unique_hardware_count": 0,
+            "total_quantity_available": 0,
+            "total_quantity_remaining": 0,
         }
 
         response = self.client.get(self.view)
@@ -337,6 +612,42 @@ class CategoryListViewTestCase(SetupUserMixin, APITestCase):
 
         self.assertEqual(expected_unique_hardware_counts, actual_unique_hardware_counts)
 
+    def test_stock_summary_in_one_query(self):
+        self._login()
+
+        category2 = Category.objects.create(name="Microcontrollers", max_per_team=4)
+        hardware1 = Hardware.objects.create(name="Arduino", quantity_available=2)
+        hardware2 = Hardware.objects.create(name="ESP32", quantity_available=3)
+        hardware1.categories.add(category2, self.category)
+        hardware2.categories.add(category2)
+        for i in range(5):
+            Category.objects.create(name=f"empty{i}")
+
+        team = Team.objects.create()
+        order = Order.objects.create(status="Submitted", team=team, request={})
+        OrderItem.objects.create(order=order, hardware=hardware2, quantity=2)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.view)
+        results = response.json()["results"]
+        # The pagination count, the page, then the live quantities remaining on
+        # it, however many categories there are
+        self.assertEqual(
+            len([query for query in queries if "hardware_hardware" in query["sql"]]), 3,
+        )
+
+        self.assertEqual(
+            [
+                (
+                    result["unique_hardware_count"],
+                    result["total_quantity_available"],
+                    result["total_quantity_remaining"],
+                )
+                for result in results[:3]
+            ],
+            [(1, 2, 2), (2, 5, 3), (0, 0, 0)],
+        )
+
 
 class IncidentListViewTestCase(SetupUserMixin, APITestCase):
     def setUp(self):
@@ -652,6 +963,102 @@ class OrderListViewGetTestCase(SetupUserMixin, APITestCase):
         returned_ids = [res["id"] for res in results]
         self.assertCountEqual(returned_ids, [self.order_3.id, self.order_4.id])
 
+    def _get_cursor_pages(self, url):
+        pages = []
+        while url is not None:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.json()
+            self.assertNotIn("count", data)
+            pages.append([res["id"] for res in data["results"]])
+            url = data["next"]
+        return pages, data
+
+    def test_cursor_pagination(self):
+        self._login(self.view_permissions)
+        # Ties on created_at are broken by id
+        Order.objects.filter(id__in=[self.order_2.id, self.order_3.id]).update(
+            created_at=self.order_2.created_at
+        )
+
+        pages, last_page = self._get_cursor_pages(
+            self._build_filter_url(cursor="", limit=1)
+        )
+        self.assertEqual(
+            pages,
+            [[self.order.id], [self.order_2.id], [self.order_3.id], [self.order_4.id]],
+        )
+
+        response = self.client.get(last_page["previous"])
+        self.assertEqual(
+            [res["id"] for res in response.json()["results"]], [self.order_3.id]
+        )
+
+    def test_cursor_pagination_descending(self):
+        self._login(self.view_permissions)
+
+        pages, last_page = self._get_cursor_pages(
+            self._build_filter_url(cursor="", limit=3, ordering="-created_at")
+        )
+        self.assertEqual(
+            pages,
+            [[self.order_4.id, self.order_3.id, self.order_2.id], [self.order.id]],
+        )
+
+        response = self.client.get(last_page["previous"])
+        data = response.json()
+        self.assertEqual(
+            [res["id"] for res in data["results"]],
+            [self.order_4.id, self.order_3.id, self.order_2.id],
+        )
+        self.assertIsNone(data["previous"])
+
+    def test_cursor_pagination_with_filters(self):
+        self._login(self.view_permissions)
+
+        pages, _ = self._get_cursor_pages(
+            self._build_filter_url(cursor="", limit=1, search="ABCDE")
+        )
+        self.assertEqual(pages, [[self.order_3.id], [self.order_4.id]])
+
+    def test_stream_ndjson(self):
+        self._login(self.view_permissions)
+
+        # Related items are prefetched for each chunk of orders
+        with patch.object(OrderListView, "stream_chunk_size", 3):
+            response = self.client.get(
+                self._build_filter_url(stream="ndjson", ordering="created_at")
+            )
+            content = b"".join(response.streaming_content).decode()
+
+        expected_response = OrderListSerializer(
+            Order.objects.order_by("created_at"),
+            many=True,
+            context={"request": response.wsgi_request},
+        ).data
+        self.assertEqual(
+            [json.loads(line) for line in content.splitlines()],
+            json.loads(json.dumps(expected_response)),
+        )
+
+    def test_invalid_cursor(self):
+        self._login(self.view_permissions)
+
+        response = self.client.get(self._build_filter_url(cursor="invalid"))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        for values in (
+            ["2020-01-01T00:00:00Z", "abc"],
+            ["notadate", 1],
+            [None, None],
+            [[], {}],
+        ):
+            cursor = urlsafe_b64encode(json.dumps({"v": values, "r": 0}).encode())
+            response = self.client.get(
+                self._build_filter_url(cursor=cursor.decode("ascii"))
+            )
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, values)
+
 
 class OrderItemListViewGetTestCase(SetupUserMixin, APITestCase):
     def setUp(self):
@@ -804,6 +1211,61 @@ class OrderItemListViewGetTestCase(SetupUserMixin, APITestCase):
             returned_ids, [self.order_item_5.id, self.order_item_6.id]
         )
 
+    def test_cursor_pagination(self):
+        self._login(self.view_permissions)
+        # Order items are paginated by the time of their order, then their id
+        Order.objects.filter(pk=self.order.pk).update(
+            created_at=self.order_4.created_at + relativedelta(minutes=1)
+        )
+
+        returned_ids = []
+        url = self._build_filter_url(cursor="", limit=4)
+        while url is not None:
+            data = self.client.get(url).json()
+            returned_ids.extend(res["id"] for res in data["results"])
+            url = data["next"]
+        self.assertEqual(
+            returned_ids,
+            [
+                self.order_item_3.id,
+                self.order_item_4.id,
+                self.order_item_5.id,
+                self.order_item_6.id,
+                self.order_item_1.id,
+                self.order_item_2.id,
+            ],
+        )
+
+    def test_cursor_pages_are_not_expanded_into_units(self):
+        self._login(self.view_permissions)
+        OrderItem.objects.filter(pk=self.order_item_1.pk).update(quantity=3)
+
+        data = self.client.get(self._build_filter_url(cursor="", limit=2)).json()
+        self.assertEqual(
+            [(res["id"], res["quantity"]) for res in data["results"]],
+            [(self.order_item_1.id, 3), (self.order_item_2.id, 1)],
+        )
+
+        # Without a cursor, items are still listed once per unit
+        data = self.client.get(self._build_filter_url(limit=1)).json()
+        self.assertEqual(
+            [(res["id"], res["quantity"]) for res in data["results"]],
+            [(self.order_item_1.id, 1)],
+        )
+
+    def test_pages_count_units(self):
+        self._login(self.view_permissions)
+        OrderItem.objects.filter(pk=self.order_item_1.pk).update(quantity=3)
+
+        data = self.client.get(self._build_filter_url(limit=2, offset=2)).json()
+        # The units of all 6 items, 2 of which are the units of order_item_1
+        self.assertEqual(data["count"], 8)
+        self.assertEqual(
+            [res["id"] for res in data["results"]],
+            [self.order_item_1.id, self.order_item_2.id],
+        )
+        self.assertIsNotNone(data["next"])
+
 
 class IncidentListViewPostTestCase(SetupUserMixin, APITestCase):
     def setUp(self):
@@ -866,6 +1328,39 @@ class IncidentListViewPostTestCase(SetupUserMixin, APITestCase):
         for attribute in similar_attributes:
             self.assertEqual(final_response[attribute], self.request_data[attribute])
 
+    def test_incidents_for_several_units_of_an_item(self):
+        self._login(self.permissions)
+        OrderItem.objects.filter(pk=self.order_item.pk).update(quantity=3)
+        Hardware.objects.rebuild_checked_out()
+
+        incident_ids = []
+        for _ in range(3):
+            response = self.client.post(self.view, self.request_data)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            incident_ids.append(response.json()["id"])
+
+        # Each unit was split off into its own item
+        items = OrderItem.objects.filter(order=self.order).order_by("id")
+        self.assertEqual([item.quantity for item in items], [1, 1, 1])
+        self.assertEqual(
+            sorted(
+                Incident.objects.filter(id__in=incident_ids).values_list(
+                    "order_item_id", flat=True
+                )
+            ),
+            [item.id for item in items],
+        )
+        self.assertEqual(
+            Hardware.objects.get(pk=self.hardware.pk).quantity_checked_out, 3
+        )
+
+        response = self.client.post(self.view, self.request_data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(),
+            {"order_item": ["An incident has already been filed for this unit."]},
+        )
+
 
 class IncidentDetailViewGetTestCase(SetupUserMixin, APITestCase):
     def setUp(self):
@@ -1355,7 +1850,7 @@ class OrderListViewPostTestCase(SetupUserMixin, APITestCase):
         self.assertEqual(response.json(), expected_response)
 
         order = Order.objects.get(pk=2)
-        self.assertEqual(order.items.count(), 4)
+        self.assertEqual(order.items.get().quantity, 4)
         self.assertCountEqual(order.hardware.all(), [hardware])
 
     @override_settings(HARDWARE_SIGN_OUT_START_DATE=datetime.now(settings.TZ_INFO))
@@ -1537,7 +2032,7 @@ class OrderListViewPostTestCase(SetupUserMixin, APITestCase):
         self.assertEqual(response.json(), expected_response)
 
         order = Order.objects.get(pk=2)
-        self.assertEqual(order.items.count(), 4)
+        self.assertEqual(order.items.get().quantity, 4)
         self.assertCountEqual(order.hardware.all(), [hardware])
 
     @override_settings(HARDWARE_SIGN_OUT_START_DATE=datetime.now(settings.TZ_INFO))
@@ -1698,10 +2193,10 @@ class OrderListViewPostTestCase(SetupUserMixin, APITestCase):
         order = Order.objects.get(pk=order_id)
         self.assertCountEqual(order.hardware.all(), [hardware_1, hardware_2])
         self.assertEqual(
-            order.items.filter(hardware=hardware_1).count(), num_hardware_1_requested
+            order.items.get(hardware=hardware_1).quantity, num_hardware_1_requested
         )
         self.assertEqual(
-            order.items.filter(hardware=hardware_2).count(), num_hardware_2_requested
+            order.items.get(hardware=hardware_2).quantity, num_hardware_2_requested
         )
 
     @override_settings(HARDWARE_SIGN_OUT_START_DATE=datetime.now(settings.TZ_INFO))
@@ -1747,7 +2242,7 @@ class OrderListViewPostTestCase(SetupUserMixin, APITestCase):
         self.assertEqual(response.json(), expected_response)
 
         order = Order.objects.get(pk=1)
-        self.assertEqual(order.items.all().count(), num_hardware_requested)
+        self.assertEqual(order.items.get().quantity, num_hardware_requested)
         self.assertCountEqual(order.hardware.all(), [hardware])
 
     @override_settings(HARDWARE_SIGN_OUT_START_DATE=datetime.now(settings.TZ_INFO))
@@ -1863,6 +2358,56 @@ class OrderListViewPostTestCase(SetupUserMixin, APITestCase):
         }
         self.assertEqual(response.json(), expected_response)
 
+    @override_settings(
+        HARDWARE_SIGN_OUT_END_DATE=datetime.now(settings.TZ_INFO)
+        + relativedelta(days=1)
+    )
+    def test_stock_taken_after_validation(self):
+        self._login()
+        self.create_min_number_of_profiles()
+
+        hardware = Hardware.objects.create(
+            name="name",
+            model_number="model",
+            manufacturer="manufacturer",
+            datasheet="/datasheet/location/",
+            notes="notes",
+            quantity_available=5,
+            max_per_team=10,
+            picture="/picture/location",
+        )
+        hardware.categories.add(self.category_limit_10.pk)
+
+        validate = OrderCreateSerializer.validate
+
+        def validate_then_lose_stock(serializer, data):
+            # Simulate another team's order being placed between validation and
+            # creation
+            data = validate(serializer, data)
+            Hardware.objects.reserve(hardware.id, 3)
+            return data
+
+        request_data = {"hardware": [{"id": hardware.id, "quantity": 4}]}
+        with patch.object(OrderCreateSerializer, "validate", validate_then_lose_stock):
+            response = self.client.post(self.view, request_data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        order = Order.objects.get(team=self.team)
+        expected_response = {
+            "order_id": order.id,
+            "hardware": [{"hardware_id": hardware.id, "quantity_fulfilled": 2}],
+            "errors": [
+                {
+                    "hardware_id": hardware.id,
+                    "message": f"Only 2 of 4 {hardware.name}(s) were available",
+                }
+            ],
+        }
+        self.assertEqual(response.json(), expected_response)
+        self.assertEqual(order.items.get().quantity, 2)
+        hardware.refresh_from_db()
+        self.assertEqual(hardware.quantity_remaining, 0)
+
     @override_settings(HARDWARE_SIGN_OUT_START_DATE=datetime.now(settings.TZ_INFO))
     def test_team_less_min_order(self):
         self._login()
@@ -1939,6 +2484,48 @@ class OrderListPatchTestCase(SetupUserMixin, APITestCase):
         response = self.client.patch(self._build_view(self.pk), request_data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(request_data["status"], Order.objects.get(id=self.pk).status)
+        # The notification is queued for the worker rather than sent right away
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            QueuedEmail.objects.get().recipient_list, [settings.HSS_ADMIN_EMAIL]
+        )
+
+    @patch("hardware.push.publish")
+    def test_status_change_pushed(self, mock_publish):
+        self._login(self.change_permissions)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                self._build_view(self.pk), {"status": "Ready for Pickup"}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        data = {"id": self.pk, "status": "Ready for Pickup", "team_id": self.team.id}
+        self.assertEqual(
+            mock_publish.call_args_list,
+            [
+                call("orders", "order", data),
+                call(f"team.{self.team.id}", "order", data),
+            ],
+        )
+
+    @patch("hardware.push.publish")
+    def test_cancellation_pushes_stock(self, mock_publish):
+        self._login(self.change_permissions)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                self._build_view(self.pk), {"status": "Cancelled"}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        hardware = Hardware.objects.get()
+        mock_publish.assert_called_with(
+            "stock",
+            "stock",
+            {
+                "version": CatalogVersion.objects.current(),
+                "hardware": [{"id": hardware.id, "quantity_remaining": 4}],
+            },
+        )
 
     def test_unallowed_status_change(self):
         self._login(self.change_permissions)
@@ -1977,6 +2564,304 @@ class OrderListPatchTestCase(SetupUserMixin, APITestCase):
         self.assertFalse(request_data["status"] == Order.objects.get(id=self.pk).status)
 
 
+class CartHoldViewTestCase(SetupUserMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        catalog_cache.invalidate()
+        self.view = reverse("api:hardware:cart-hold")
+        self.team = Team.objects.create()
+        self.other_team = Team.objects.create()
+        users = [self.user] + [
+            User.objects.create_user(username=f"user{i}@bar.com", password="foobar123")
+            for i in range(3)
+        ]
+        # Both teams are big enough to order
+        for user, team in zip(users, [self.team, self.team] + [self.other_team] * 2):
+            Profile.objects.create(user=user, team=team)
+        self.other_user = users[2]
+        self.hardware = Hardware.objects.create(
+            name="name", quantity_available=5, max_per_team=4
+        )
+
+    def _hold(self, quantity):
+        return self.client.post(
+            self.view,
+            {"hardware": [{"id": self.hardware.id, "quantity": quantity}]},
+            format="json",
+        )
+
+    def test_user_not_logged_in(self):
+        response = self._hold(1)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_hold(self):
+        self._login()
+        response = self._hold(3)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(
+            data["hardware"], [{"hardware_id": self.hardware.id, "quantity_held": 3}]
+        )
+        self.assertIsNotNone(data["expires_at"])
+        self.assertEqual(self.client.get(self.view).json(), data)
+
+        # Held items only show as remaining in the catalog to the holding team
+        for user, remaining in ((self.user, 5), (self.other_user, 2)):
+            self.client.force_login(user)
+            response = self.client.get(reverse("api:hardware:hardware-list"))
+            self.assertEqual(
+                response.json()["results"][0]["quantity_remaining"], remaining
+            )
+            response = self.client.get(
+                reverse("api:hardware:hardware-detail", kwargs={"pk": self.hardware.id})
+            )
+            self.assertEqual(response.json()["quantity_remaining"], remaining)
+
+    def test_hold_limited_to_max_per_team_and_stock(self):
+        self._login()
+        self.assertEqual(self._hold(5).json()["hardware"][0]["quantity_held"], 4)
+        self.client.force_login(self.other_user)
+        self.assertEqual(self._hold(4).json()["hardware"][0]["quantity_held"], 1)
+
+    def test_hold_nonexistent_hardware(self):
+        self._login()
+        response = self.client.post(
+            self.view, {"hardware": [{"id": 0, "quantity": 1}]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(), {"hardware": ["Hardware 0 does not exist."]},
+        )
+
+    def test_hold_locked(self):
+        self._login()
+        cache.add(f"{stock_holds._team_key(self.team.id)}:lock", "other request")
+        with patch.object(stock_holds, "lock_timeout", 0):
+            response = self._hold(1)
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+            response = self.client.delete(self.view)
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_release(self):
+        self._login()
+        self._hold(3)
+        response = self.client.delete(self.view)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            self.client.get(self.view).json(), {"hardware": [], "expires_at": None}
+        )
+
+    @override_settings(
+        HARDWARE_SIGN_OUT_START_DATE=datetime.now(settings.TZ_INFO)
+        - relativedelta(days=1),
+        HARDWARE_SIGN_OUT_END_DATE=datetime.now(settings.TZ_INFO)
+        + relativedelta(days=1),
+    )
+    def test_held_items_are_ordered_by_holding_team_only(self):
+        self._login()
+        self._hold(4)
+
+        self.client.force_login(self.other_user)
+        response = self.client.post(
+            reverse("api:hardware:order-list"),
+            {"hardware": [{"id": self.hardware.id, "quantity": 2}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(),
+            {
+                "non_field_errors": [
+                    "Unable to order Hardware name because there are not enough items in stock"
+                ]
+            },
+        )
+
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("api:hardware:order-list"),
+                {"hardware": [{"id": self.hardware.id, "quantity": 4}]},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            response.json()["hardware"],
+            [{"hardware_id": self.hardware.id, "quantity_fulfilled": 4}],
+        )
+        # The hold became the order
+        self.assertEqual(
+            self.client.get(self.view).json(), {"hardware": [], "expires_at": None}
+        )
+        self.assertEqual(Hardware.objects.get().quantity_remaining, 1)
+
+
+class OrderStatusBulkChangeViewTestCase(SetupUserMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.view = reverse("api:hardware:order-status-bulk-change")
+        self.change_permissions = Permission.objects.filter(
+            content_type__app_label="hardware", codename="change_order"
+        )
+        self.team = Team.objects.create()
+        self.other_team = Team.objects.create()
+        self.user2 = User.objects.create_user(
+            username="bar@foo.com", password="foobar123", email="bar@foo.com"
+        )
+        Profile.objects.create(user=self.user, team=self.team)
+        Profile.objects.create(user=self.user2, team=self.other_team)
+        self.hardware = Hardware.objects.create(
+            name="name", quantity_available=10, max_per_team=10
+        )
+        self.orders = [
+            self._make_order(self.team, "Submitted"),
+            self._make_order(self.team, "Submitted"),
+            self._make_order(self.other_team, "Ready for Pickup"),
+        ]
+
+    def _make_order(self, team, order_status):
+        order = Order.objects.create(status=order_status, team=team, request={})
+        OrderItem.objects.create(order=order, hardware=self.hardware, quantity=2)
+        return order
+
+    def _changes(self, *changes):
+        return {
+            "orders": [
+                {"id": order.id, "status": new_status} for order, new_status in changes
+            ]
+        }
+
+    def test_user_not_logged_in(self):
+        response = self.client.patch(
+            self.view, self._changes((self.orders[0], "Ready for Pickup"))
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_lack_perms(self):
+        self._login()
+        response = self.client.patch(
+            self.view, self._changes((self.orders[0], "Ready for Pickup"))
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_successful_status_change(self):
+        self._login(self.change_permissions)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                self.view,
+                self._changes(
+                    (self.orders[0], "Ready for Pickup"),
+                    (self.orders[1], "Ready for Pickup"),
+                    (self.orders[2], "Picked Up"),
+                ),
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(order["id"], order["status"]) for order in response.json()],
+            [
+                (self.orders[0].id, "Ready for Pickup"),
+                (self.orders[1].id, "Ready for Pickup"),
+                (self.orders[2].id, "Picked Up"),
+            ],
+        )
+        self.assertEqual(
+            dict(Order.objects.values_list("id", "status")),
+            {
+                self.orders[0].id: "Ready for Pickup",
+                self.orders[1].id: "Ready for Pickup",
+                self.orders[2].id: "Picked Up",
+            },
+        )
+        updates = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith('UPDATE "hardware_order"')
+        ]
+        self.assertEqual(len(updates), 2)
+
+        # One notification per team, each sent to the admins and the team
+        self.assertEqual(
+            sorted(email.recipient_list for email in QueuedEmail.objects.all()),
+            sorted(
+                [
+                    [settings.HSS_ADMIN_EMAIL],
+                    [settings.HSS_ADMIN_EMAIL],
+                    [self.user.email],
+                    [self.user2.email],
+                ]
+            ),
+        )
+        email = QueuedEmail.objects.get(recipient_list=[self.user.email])
+        self.assertIn(f"Order #{self.orders[0].id} is Ready for Pickup!", email.message)
+        self.assertIn(f"Order #{self.orders[1].id} is Ready for Pickup!", email.message)
+
+    def test_invalid_changes(self):
+        self._login(self.change_permissions)
+        response = self.client.patch(
+            self.view,
+            {
+                "orders": [
+                    {"id": self.orders[0].id, "status": "Ready for Pickup"},
+                    {"id": self.orders[1].id, "status": "Picked Up"},
+                    {"id": self.orders[0].id, "status": "Cancelled"},
+                    {"id": 0, "status": "Cancelled"},
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(),
+            {
+                "orders": [
+                    {},
+                    {
+                        "status": [
+                            "Cannot change the status of an order from Submitted "
+                            "to Picked Up."
+                        ]
+                    },
+                    {"id": [f"Order {self.orders[0].id} is changed more than once."]},
+                    {"id": ["Order 0 does not exist."]},
+                ]
+            },
+        )
+        # Nothing is changed if any change is invalid
+        self.assertEqual(
+            list(Order.objects.order_by("id").values_list("status", flat=True)),
+            ["Submitted", "Submitted", "Ready for Pickup"],
+        )
+        self.assertFalse(QueuedEmail.objects.exists())
+
+    @patch("hardware.push.publish")
+    def test_cancellation_puts_items_back_in_stock(self, mock_publish):
+        self._login(self.change_permissions)
+        self.assertEqual(Hardware.objects.get().quantity_remaining, 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                self.view,
+                self._changes(
+                    (self.orders[0], "Cancelled"), (self.orders[1], "Cancelled")
+                ),
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Hardware.objects.get().quantity_remaining, 8)
+
+        data = {"id": self.orders[0].id, "status": "Cancelled", "team_id": self.team.id}
+        self.assertIn(call("orders", "order", data), mock_publish.call_args_list)
+        mock_publish.assert_called_with(
+            "stock",
+            "stock",
+            {
+                "version": CatalogVersion.objects.current(),
+                "hardware": [{"id": self.hardware.id, "quantity_remaining": 8}],
+            },
+        )
+
+
 class OrderItemReturnViewTestCase(SetupUserMixin, APITestCase):
     def setUp(self):
         super().setUp()
@@ -1,13 +1,59 @@
+import os
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from smtplib import SMTPException
+from tempfile import TemporaryDirectory
+from unittest import skipUnless
+from unittest.mock import Mock, call, patch
+
+from django.conf import settings
+from django.contrib.admin.models import ADDITION, LogEntry
+from django.contrib.auth.models import Permission
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import EmailMultiAlternatives
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
 from rest_framework import serializers
+from tablib import Dataset
 
-from hardware.models import Hardware, Category, Order, OrderItem, Incident
-from event.models import Team
+from hardware import notifications
+from hardware.admin import HardwareResource
+from hardware.cache import CatalogCache
+from hardware.holds import HoldLocked, StockHolds
+from hardware.images import render_derivatives
+from hardware.notifications import OrderNotification, html_to_text
+from hardware.push import get_user_channels
+from hardware.models import (
+    CatalogVersion,
+    Hardware,
+    MirroredImage,
+    Category,
+    Order,
+    OrderItem,
+    Incident,
+    QueuedEmail,
+)
+from event.models import Profile, Team, User
 from hardware.serializers import (
     HardwareSerializer,
     CategorySerializer,
     OrderListSerializer,
     IncidentSerializer,
+    OrderCreateSerializer,
+    OrderItemReturnSerializer,
 )
 
 
@@ -44,6 +90,7 @@ class HardwareSerializerTestCase(TestCase):
             "notes": None,
             "max_per_team": 1,
             "picture": "/media/picture/location",
+            "picture_derivatives": None,
             "image_url": None,
         }
 
@@ -74,6 +121,7 @@ class HardwareSerializerTestCase(TestCase):
             "notes": None,
             "max_per_team": 1,
             "picture": "/media/picture/location",
+            "picture_derivatives": None,
             "image_url": None,
         }
         data = hardware_serializer.data
@@ -105,6 +153,7 @@ class HardwareSerializerTestCase(TestCase):
             "notes": None,
             "max_per_team": 1,
             "picture": "/media/picture/location",
+            "picture_derivatives": None,
             "image_url": None,
         }
         data = hardware_serializer.data
@@ -188,6 +237,823 @@ class HardwareQuantityRemainingTestCase(TestCase):
         self.assertEqual(hardware_serializer.data["quantity_remaining"], 4)
 
 
+class HardwareQuantityCheckedOutTestCase(TestCase):
+    def setUp(self):
+        self.hardware = Hardware.objects.create(
+            name="name",
+            model_number="model",
+            manufacturer="manufacturer",
+            datasheet="/datasheet/location/",
+            quantity_available=4,
+            max_per_team=1,
+            picture="/picture/location",
+        )
+        self.order = Order.objects.create(
+            status="Submitted",
+            team=Team.objects.create(),
+            request={"hardware": [{"id": 1, "quantity": 2}]},
+        )
+
+    def _quantity_checked_out(self):
+        return Hardware.objects.get(pk=self.hardware.pk).quantity_checked_out
+
+    def test_bulk_create_updates_counter(self):
+        OrderItem.objects.bulk_create(
+            [OrderItem(order=self.order, hardware=self.hardware) for _ in range(3)]
+        )
+        self.assertEqual(self._quantity_checked_out(), 3)
+
+    def test_cancel_and_restore_order(self):
+        OrderItem.objects.create(order=self.order, hardware=self.hardware)
+        OrderItem.objects.create(
+            order=self.order, hardware=self.hardware, part_returned_health="Healthy"
+        )
+        self.assertEqual(self._quantity_checked_out(), 1)
+
+        self.order.status = "Cancelled"
+        self.order.save()
+        self.assertEqual(self._quantity_checked_out(), 0)
+
+        self.order.status = "Submitted"
+        self.order.save()
+        self.assertEqual(self._quantity_checked_out(), 1)
+
+    def test_return_item(self):
+        item = OrderItem.objects.create(order=self.order, hardware=self.hardware)
+        item.part_returned_health = "Broken"
+        item.save()
+        self.assertEqual(self._quantity_checked_out(), 1)
+
+        item.part_returned_health = "Healthy"
+        item.save()
+        self.assertEqual(self._quantity_checked_out(), 0)
+
+    def test_delete_order(self):
+        OrderItem.objects.create(order=self.order, hardware=self.hardware)
+        self.order.delete()
+        self.assertEqual(self._quantity_checked_out(), 0)
+
+    def test_partial_return_splits_item(self):
+        item = OrderItem.objects.create(
+            order=self.order, hardware=self.hardware, quantity=3
+        )
+        serializer = OrderItemReturnSerializer(
+            data={
+                "order": self.order.id,
+                "hardware": [
+                    {
+                        "id": self.hardware.id,
+                        "quantity": 2,
+                        "part_returned_health": "Healthy",
+                    }
+                ],
+            }
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, 1)
+        self.assertIsNone(item.part_returned_health)
+        returned_item = self.order.items.get(part_returned_health="Healthy")
+        self.assertEqual(returned_item.quantity, 2)
+        self.assertEqual(self._quantity_checked_out(), 1)
+
+    def test_reserve_in_stock(self):
+        self.assertEqual(Hardware.objects.reserve(self.hardware.id, 3), 3)
+        self.assertEqual(self._quantity_checked_out(), 3)
+
+    def test_reserve_partially_in_stock(self):
+        Hardware.objects.filter(pk=self.hardware.pk).update(quantity_checked_out=3)
+        self.assertEqual(Hardware.objects.reserve(self.hardware.id, 3), 1)
+        self.assertEqual(self._quantity_checked_out(), 4)
+
+    def test_reserve_out_of_stock(self):
+        Hardware.objects.filter(pk=self.hardware.pk).update(quantity_checked_out=4)
+        version = CatalogVersion.objects.current()
+        self.assertEqual(Hardware.objects.reserve(self.hardware.id, 1), 0)
+        self.assertEqual(self._quantity_checked_out(), 4)
+        # Nothing changed, so the catalog isn't versioned
+        self.assertEqual(CatalogVersion.objects.current(), version)
+
+    def test_bulk_create_without_updating_stock(self):
+        reserved = Hardware.objects.reserve(self.hardware.id, 2)
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(order=self.order, hardware=self.hardware)
+                for _ in range(reserved)
+            ],
+            update_stock=False,
+        )
+        self.assertEqual(self._quantity_checked_out(), 2)
+
+    def test_rebuild_command(self):
+        OrderItem.objects.create(order=self.order, hardware=self.hardware)
+        Hardware.objects.filter(pk=self.hardware.pk).update(quantity_checked_out=3)
+
+        out = StringIO()
+        call_command("rebuild_hardware_stock", "--dry-run", stdout=out)
+        self.assertIn("quantity checked out 3 -> 1", out.getvalue())
+        self.assertEqual(self._quantity_checked_out(), 3)
+
+        call_command("rebuild_hardware_stock", stdout=StringIO())
+        self.assertEqual(self._quantity_checked_out(), 1)
+
+
+class HardwareSearchDocumentTestCase(TestCase):
+    def setUp(self):
+        self.hardware = Hardware.objects.create(
+            name="name",
+            model_number="model",
+            manufacturer="manufacturer",
+            quantity_available=1,
+            max_per_team=1,
+        )
+        self.category = Category.objects.create(name="category", max_per_team=1)
+
+    def _search_document(self):
+        return Hardware.objects.get(pk=self.hardware.pk).search_document
+
+    def test_hardware_fields(self):
+        self.assertEqual(self._search_document(), "name model manufacturer")
+        self.hardware.model_number = None
+        self.hardware.save()
+        self.assertEqual(self._search_document(), "name manufacturer")
+
+    def test_categories_changed(self):
+        self.hardware.categories.add(self.category)
+        self.assertEqual(self._search_document(), "name model manufacturer category")
+        self.hardware.categories.clear()
+        self.assertEqual(self._search_document(), "name model manufacturer")
+
+    def test_categories_changed_from_category(self):
+        self.category.hardware_set.add(self.hardware)
+        self.assertEqual(self._search_document(), "name model manufacturer category")
+        self.category.hardware_set.clear()
+        self.assertEqual(self._search_document(), "name model manufacturer")
+
+    def test_category_renamed_and_deleted(self):
+        self.hardware.categories.add(self.category)
+        self.category.name = "renamed"
+        self.category.save()
+        self.assertEqual(self._search_document(), "name model manufacturer renamed")
+        self.category.delete()
+        self.assertEqual(self._search_document(), "name model manufacturer")
+
+    def test_rebuild_command(self):
+        Hardware.objects.update(search_document="")
+        call_command("rebuild_hardware_search", stdout=StringIO())
+        self.assertEqual(self._search_document(), "name model manufacturer")
+
+
+def make_image(mode="RGB", size=(600, 450), format="PNG"):
+    output = BytesIO()
+    Image.new(mode, size, "red").save(output, format)
+    return output.getvalue()
+
+
+class HardwareImagesTestCase(TestCase):
+    def setUp(self):
+        self.media_root = TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=self.media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.hardware = Hardware.objects.create(name="name", quantity_available=1)
+        self.hardware.picture.save("picture.png", ContentFile(make_image()))
+
+    def _build(self):
+        out = StringIO()
+        call_command("build_hardware_images", "--once", "--workers", "1", stdout=out)
+        return out.getvalue()
+
+    def _derivatives(self):
+        return HardwareSerializer(Hardware.objects.get(pk=self.hardware.pk)).data[
+            "picture_derivatives"
+        ]
+
+    def test_render_derivatives(self):
+        derivatives = render_derivatives(make_image(format="JPEG"))
+        self.assertEqual(
+            set(derivatives), {"thumbnail", "thumbnail_webp", "medium", "medium_webp"}
+        )
+        extension, content = derivatives["thumbnail"]
+        self.assertEqual(extension, "jpg")
+        self.assertEqual(Image.open(BytesIO(content)).size, (200, 150))
+        extension, content = derivatives["medium_webp"]
+        self.assertEqual(extension, "webp")
+        self.assertEqual(Image.open(BytesIO(content)).size, (400, 300))
+
+        derivatives = render_derivatives(make_image(mode="RGBA"))
+        self.assertEqual(derivatives["thumbnail"][0], "png")
+        self.assertEqual(derivatives["thumbnail_webp"][0], "webp")
+
+    def test_command(self):
+        self.assertIsNone(self._derivatives())
+        version = CatalogVersion.objects.current()
+
+        self.assertIn("Rendered pictures of 1 hardware, 0 failed", self._build())
+        derivatives = self._derivatives()
+        self.assertTrue(derivatives["thumbnail_webp"].startswith("/media/uploads/"))
+        self.assertTrue(derivatives["thumbnail_webp"].endswith("_thumbnail_webp.webp"))
+        self.assertTrue(derivatives["medium"].endswith("_medium.jpg"))
+        self.assertGreater(Hardware.objects.get(pk=self.hardware.pk).version, version)
+
+        # Up to date pictures aren't rendered again
+        self.assertEqual(self._build(), "")
+
+        self.hardware.picture.save(
+            "other.png", ContentFile(make_image(size=(100, 100)))
+        )
+        self.assertIsNone(self._derivatives())
+        self._build()
+        self.assertNotEqual(self._derivatives(), derivatives)
+
+    def test_command_invalid_picture(self):
+        self.hardware.picture.save("broken.png", ContentFile(b"not an image"))
+        with self.assertLogs("hardware.management.commands.build_hardware_images"):
+            self.assertIn("0 hardware, 1 failed", self._build())
+        self.assertIsNone(self._derivatives())
+        self.assertEqual(self._build(), "")
+
+
+class ImageServer(ThreadingHTTPServer):
+    """
+    Stands in for a vendor's CDN, serving each path in images with a fixed ETag
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ImageRequestHandler)
+        self.images = {}
+        self.requests = []
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server_port}{path}"
+
+
+class ImageRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        if self.path not in self.server.images:
+            self.send_error(404)
+            return
+
+        content_type, content, etag = self.server.images[self.path]
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class HardwareImageMirrorTestCase(TestCase):
+    def setUp(self):
+        self.media_root = TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=self.media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.server = ImageServer()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.image = make_image()
+        self.server.images["/image.png"] = ("image/png", self.image, '"v1"')
+        self.server.images["/page"] = ("text/html", b"<html></html>", '"v1"')
+
+        self.url = self.server.url("/image.png")
+        self.hardware = Hardware.objects.create(
+            name="name", quantity_available=1, image_url=self.url
+        )
+        self.other_hardware = Hardware.objects.create(
+            name="other", quantity_available=1, image_url=self.url
+        )
+
+    def _mirror(self):
+        out = StringIO()
+        call_command("mirror_hardware_images", "--once", stdout=out)
+        return out.getvalue()
+
+    def _image_url(self, hardware):
+        return HardwareSerializer(Hardware.objects.get(pk=hardware.pk)).data[
+            "image_url"
+        ]
+
+    def test_mirrors_image(self):
+        self.assertEqual(self._image_url(self.hardware), self.url)
+        version = CatalogVersion.objects.current()
+
+        self.assertIn("Checked 1 image(s), 0 failed", self._mirror())
+        self.assertEqual(len(self.server.requests), 1)
+
+        image_url = self._image_url(self.hardware)
+        self.assertTrue(image_url.startswith("/media/uploads/hardware/mirror/"))
+        self.assertTrue(image_url.endswith(".png"))
+        self.assertEqual(self._image_url(self.other_hardware), image_url)
+        with open(os.path.join(self.media_root.name, image_url[7:]), "rb") as f:
+            self.assertEqual(f.read(), self.image)
+        self.assertGreater(Hardware.objects.get(pk=self.hardware.pk).version, version)
+
+        # New hardware with a mirrored URL gets the copy without another fetch
+        new = Hardware.objects.create(
+            name="new", quantity_available=1, image_url=self.url
+        )
+        self.assertEqual(self._mirror(), "")
+        self.assertEqual(self._image_url(new), image_url)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_revalidates(self):
+        self._mirror()
+        image_url = self._image_url(self.hardware)
+        MirroredImage.objects.update(next_check_at=timezone.now())
+
+        self._mirror()
+        self.assertEqual(self.server.requests[-1][1]["If-None-Match"], '"v1"')
+        self.assertEqual(self._image_url(self.hardware), image_url)
+
+        other_image = make_image(size=(10, 10))
+        self.server.images["/image.png"] = ("image/png", other_image, '"v2"')
+        MirroredImage.objects.update(next_check_at=timezone.now())
+        self._mirror()
+        new_image_url = self._image_url(self.hardware)
+        self.assertNotEqual(new_image_url, image_url)
+        self.assertEqual(MirroredImage.objects.get().etag, '"v2"')
+
+    def test_failures(self):
+        self.hardware.image_url = self.server.url("/missing.png")
+        self.hardware.save()
+        self.other_hardware.image_url = self.server.url("/page")
+        self.other_hardware.save()
+
+        with self.assertLogs("hardware.management.commands.mirror_hardware_images"):
+            self.assertIn("Checked 0 image(s), 2 failed", self._mirror())
+        self.assertEqual(self._image_url(self.hardware), self.hardware.image_url)
+        mirror = MirroredImage.objects.get(url=self.other_hardware.image_url)
+        self.assertEqual(mirror.failures, 1)
+        self.assertIn("text/html", mirror.last_error)
+        self.assertGreater(mirror.next_check_at, timezone.now())
+
+    def test_image_url_changed(self):
+        self._mirror()
+        self.hardware.image_url = "https://example.com/other.png"
+        self.hardware.save()
+        self.assertEqual(self._image_url(self.hardware), self.hardware.image_url)
+
+
+class HardwareImportTestCase(TestCase):
+    headers = [
+        "name",
+        "model_number",
+        "manufacturer",
+        "quantity_available",
+        "max_per_team",
+        "categories",
+    ]
+
+    def setUp(self):
+        self.category = Category.objects.create(name="category", max_per_team=4)
+        self.other_category = Category.objects.create(name="other", max_per_team=4)
+        self.hardware = Hardware.objects.create(
+            name="existing",
+            model_number=None,
+            manufacturer="manufacturer",
+            quantity_available=3,
+            max_per_team=1,
+        )
+        self.hardware.categories.add(self.category)
+
+    def _dataset(self, *rows, headers=None):
+        return Dataset(*rows, headers=headers or self.headers)
+
+    def _import(self, *rows, **kwargs):
+        return HardwareResource().import_data(self._dataset(*rows), **kwargs)
+
+    def test_creates_and_updates(self):
+        version = CatalogVersion.objects.current()
+        result = self._import(
+            ("new", "model", "manufacturer", "5", "", "category,other"),
+            ("existing", "", "manufacturer", "4", "1", "other"),
+            ("unchanged", "", "", "1", "", ""),
+        )
+        self.assertEqual(result.totals["new"], 2)
+        self.assertEqual(result.totals["update"], 1)
+
+        new = Hardware.objects.get(name="new")
+        self.assertEqual(new.quantity_remaining, 5)
+        self.assertIsNone(new.max_per_team)
+        self.assertCountEqual(
+            new.categories.values_list("name", flat=True), ["category", "other"]
+        )
+        self.assertEqual(new.search_document, "new model manufacturer category other")
+        self.assertGreater(new.version, version)
+
+        self.hardware.refresh_from_db()
+        self.assertEqual(self.hardware.quantity_available, 4)
+        self.assertEqual(list(self.hardware.categories.all()), [self.other_category])
+        self.assertEqual(self.hardware.search_document, "existing manufacturer other")
+        self.assertEqual(self.hardware.version, new.version)
+        self.assertEqual(result.rows[1].object_id, self.hardware.id)
+
+        result = self._import(("unchanged", "", "", "1", "", ""))
+        self.assertEqual(result.totals["skip"], 1)
+
+    def test_missing_columns_unchanged(self):
+        result = HardwareResource().import_data(
+            self._dataset(
+                ("existing", "", "manufacturer", "2"), headers=self.headers[:4]
+            )
+        )
+        self.assertEqual(result.totals["update"], 1)
+        self.hardware.refresh_from_db()
+        self.assertEqual(self.hardware.quantity_available, 2)
+        self.assertEqual(self.hardware.max_per_team, 1)
+        self.assertEqual(list(self.hardware.categories.all()), [self.category])
+
+    def test_invalid_rows(self):
+        result = self._import(
+            ("new", "", "", "1", "", "missing"),
+            ("other", "", "", "lots", "", ""),
+            ("other", "", "", "1", "", ""),
+            ("other", "", "", "1", "", ""),
+            ("", "", "", "1", "", ""),
+        )
+        self.assertEqual(
+            [row.number for row in result.invalid_rows], [1, 2, 4, 5],
+        )
+        self.assertIn("categories", result.invalid_rows[0].error_dict)
+        self.assertIn("name", result.invalid_rows[3].error_dict)
+        self.assertEqual(Hardware.objects.count(), 1)
+
+        with self.assertRaises(ValidationError):
+            self._import(("new", "", "", "1", "", "missing"), raise_errors=True)
+
+    def test_missing_key_column(self):
+        result = HardwareResource().import_data(
+            self._dataset(("name",), headers=["name"])
+        )
+        self.assertTrue(result.has_errors())
+        self.assertIn("model_number", str(result.base_errors[0].error))
+
+    def test_dry_run(self):
+        result = self._import(
+            ("new", "", "", "1", "", "category"),
+            ("existing", "", "manufacturer", "9", "1", ""),
+            dry_run=True,
+        )
+        self.assertEqual(result.totals["new"], 1)
+        self.assertEqual(result.totals["update"], 1)
+        self.assertEqual(Hardware.objects.count(), 1)
+        self.hardware.refresh_from_db()
+        self.assertEqual(self.hardware.quantity_available, 3)
+        self.assertEqual(list(self.hardware.categories.all()), [self.category])
+
+    def test_queries_independent_of_rows(self):
+        def count_queries(prefix, count):
+            rows = [
+                (f"{prefix}{i}", "", "", "1", "", "category,other")
+                for i in range(count)
+            ]
+            rows.append(("existing", "", "manufacturer", str(count), "1", prefix))
+            with CaptureQueriesContext(connection) as queries:
+                result = self._import(*rows)
+            self.assertFalse(result.has_validation_errors())
+            return len(queries)
+
+        Category.objects.create(name="a", max_per_team=1)
+        Category.objects.create(name="b", max_per_team=1)
+        self.assertEqual(count_queries("a", 2), count_queries("b", 20))
+
+    @patch("hardware.push.publish")
+    def test_publishes_restocked_hardware(self, mock_publish):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._import(
+                ("existing", "", "manufacturer", "7", "1", "category"),
+                ("new", "", "", "1", "", ""),
+            )
+        mock_publish.assert_called_once()
+        self.assertEqual(
+            mock_publish.call_args[0][2]["hardware"],
+            [{"id": self.hardware.id, "quantity_remaining": 7}],
+        )
+
+    def test_command(self):
+        with TemporaryDirectory() as directory:
+            categories_path = os.path.join(directory, "categories.csv")
+            with open(categories_path, "w") as f:
+                f.write("name,max_per_team\nnew category,2\n")
+            hardware_path = os.path.join(directory, "hardware.csv")
+            with open(hardware_path, "w") as f:
+                f.write(",".join(self.headers) + "\n")
+                f.write("new,,,1,,new category\n")
+
+            out = StringIO()
+            call_command(
+                "import_hardware",
+                hardware_path,
+                "--categories",
+                categories_path,
+                "--dry-run",
+                stdout=out,
+            )
+            self.assertIn("Categories: 1 new", out.getvalue())
+            self.assertIn("Hardware: 1 new", out.getvalue())
+            self.assertFalse(Hardware.objects.filter(name="new").exists())
+
+            call_command(
+                "import_hardware",
+                hardware_path,
+                "--categories",
+                categories_path,
+                stdout=StringIO(),
+            )
+            new = Hardware.objects.get(name="new")
+            self.assertEqual(new.categories.get().max_per_team, 2)
+
+            with open(hardware_path, "a") as f:
+                f.write("other,,,1,,missing\n")
+            err = StringIO()
+            with self.assertRaises(CommandError):
+                call_command(
+                    "import_hardware", hardware_path, stdout=StringIO(), stderr=err
+                )
+            self.assertIn("Row 2: categories: Unknown", err.getvalue())
+            # An invalid hardware file also rolls back the categories
+            with open(categories_path, "w") as f:
+                f.write("name,max_per_team\nanother category,2\n")
+            with self.assertRaises(CommandError):
+                call_command(
+                    "import_hardware",
+                    hardware_path,
+                    "--categories",
+                    categories_path,
+                    stdout=StringIO(),
+                    stderr=StringIO(),
+                )
+            self.assertFalse(Category.objects.filter(name="another category").exists())
+
+    def test_admin_import(self):
+        user = User.objects.create_superuser(
+            username="admin@bar.com", email="admin@bar.com", password="foobar123"
+        )
+        self.client.force_login(user)
+        import_file = SimpleUploadedFile(
+            "hardware.csv",
+            self._dataset(("new", "", "", "1", "", "category")).export("csv").encode(),
+        )
+        response = self.client.post(
+            reverse("admin:hardware_hardware_import"),
+            {"import_file": import_file, "input_format": 0},
+        )
+        self.assertEqual(response.status_code, 200)
+        confirm_form = response.context["confirm_form"]
+        self.assertFalse(Hardware.objects.filter(name="new").exists())
+
+        response = self.client.post(
+            reverse("admin:hardware_hardware_process_import"), confirm_form.initial,
+        )
+        self.assertEqual(response.status_code, 302)
+        new = Hardware.objects.get(name="new")
+        self.assertEqual(
+            LogEntry.objects.get(action_flag=ADDITION).object_id, str(new.id)
+        )
+
+
+class OrderCreateSerializerQuotaTestCase(TestCase):
+    def setUp(self):
+        self.team = Team.objects.create()
+        self.category = Category.objects.create(name="category", max_per_team=6)
+        self.hardware = []
+        for i in range(10):
+            hardware = Hardware.objects.create(
+                name=f"hardware{i}", quantity_available=4, max_per_team=2
+            )
+            hardware.categories.add(self.category)
+            self.hardware.append(hardware)
+
+        order = Order.objects.create(
+            status="Picked Up",
+            team=self.team,
+            request={"hardware": [{"id": self.hardware[0].id, "quantity": 2}]},
+        )
+        OrderItem.objects.create(order=order, hardware=self.hardware[0])
+        OrderItem.objects.create(
+            order=order, hardware=self.hardware[1], part_returned_health="Broken"
+        )
+
+    def _check_quotas(self, requested_quantities):
+        hardware = Hardware.objects.in_bulk(requested_quantities.keys())
+        requested_hardware = Counter(
+            {hardware[id]: quantity for id, quantity in requested_quantities.items()}
+        )
+        return OrderCreateSerializer.check_team_quotas(
+            team=self.team, requested_hardware=requested_hardware
+        )
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        # One query to fetch the hardware, and two to check the quotas
+        with self.assertNumQueries(3):
+            self._check_quotas({self.hardware[0].id: 1})
+        with self.assertNumQueries(3):
+            self._check_quotas({hardware.id: 1 for hardware in self.hardware})
+
+    def test_limits(self):
+        errors = self._check_quotas(
+            {self.hardware[0].id: 2, self.hardware[1].id: 2, self.hardware[2].id: 3}
+        )
+        self.assertEqual(
+            errors,
+            [
+                "Maximum number of items for Hardware hardware0 is reached (limit of 2 per team)",
+                "Maximum number of items for Hardware hardware2 is reached (limit of 2 per team)",
+                "Maximum number of items for the Category category is reached (limit of 6 items per team)",
+            ],
+        )
+
+    def test_within_limits(self):
+        errors = self._check_quotas({self.hardware[0].id: 1, self.hardware[1].id: 2})
+        self.assertEqual(errors, [])
+
+
+class OrderItemReturnSerializerTestCase(TestCase):
+    def setUp(self):
+        self.team = Team.objects.create()
+        self.hardware = [
+            Hardware.objects.create(
+                name=f"hardware{i}", quantity_available=10, max_per_team=10
+            )
+            for i in range(5)
+        ]
+        self.orders = [
+            Order.objects.create(
+                status="Picked Up", team=self.team, request={"hardware": []}
+            )
+            for _ in range(2)
+        ]
+        for order in self.orders:
+            for hardware in self.hardware:
+                OrderItem.objects.create(order=order, hardware=hardware, quantity=2)
+
+    def _get_serializer(self, hardware, **orders):
+        serializer = OrderItemReturnSerializer(data={"hardware": hardware, **orders})
+        serializer.is_valid(raise_exception=True)
+        return serializer
+
+    def _quantity_checked_out(self, hardware):
+        return Hardware.objects.get(pk=hardware.pk).quantity_checked_out
+
+    def test_query_count_does_not_depend_on_items_returned(self):
+        serializer = self._get_serializer(
+            [
+                {"id": hardware.id, "quantity": 2, "part_returned_health": "Broken"}
+                for hardware in self.hardware
+            ],
+            order=self.orders[0].id,
+        )
+        # One query to fetch the outstanding items, one for the team and one
+        # update for the single health state
+        with self.assertNumQueries(3):
+            serializer.save()
+        self.assertEqual(
+            self.orders[0].items.filter(part_returned_health="Broken").count(), 5
+        )
+
+    def test_one_update_per_health_state(self):
+        serializer = self._get_serializer(
+            [
+                {
+                    "id": self.hardware[0].id,
+                    "quantity": 1,
+                    "part_returned_health": "Healthy",
+                },
+                {
+                    "id": self.hardware[0].id,
+                    "quantity": 1,
+                    "part_returned_health": "Lost",
+                },
+                {
+                    "id": self.hardware[1].id,
+                    "quantity": 2,
+                    "part_returned_health": "Healthy",
+                },
+            ],
+            order=self.orders[0].id,
+        )
+        response = serializer.save()
+
+        self.assertEqual(response["errors"], [])
+        self.assertEqual(
+            Counter(
+                self.orders[0]
+                .items.exclude(part_returned_health__isnull=True)
+                .values_list("hardware_id", "part_returned_health", "quantity")
+            ),
+            Counter(
+                [
+                    (self.hardware[0].id, "Healthy", 1),
+                    (self.hardware[0].id, "Lost", 1),
+                    (self.hardware[1].id, "Healthy", 2),
+                ]
+            ),
+        )
+        self.assertEqual(self._quantity_checked_out(self.hardware[0]), 3)
+        self.assertEqual(self._quantity_checked_out(self.hardware[1]), 2)
+
+    def test_return_across_orders(self):
+        serializer = self._get_serializer(
+            [
+                {
+                    "id": self.hardware[0].id,
+                    "quantity": 3,
+                    "part_returned_health": "Healthy",
+                }
+            ],
+            orders=[order.id for order in reversed(self.orders)],
+        )
+        response = serializer.save()
+
+        self.assertEqual(response["order_id"], self.orders[0].id)
+        self.assertEqual(response["order_ids"], [order.id for order in self.orders])
+        self.assertEqual(
+            response["returned_items"],
+            [{"hardware_id": self.hardware[0].id, "quantity": 3}],
+        )
+        # The oldest order is returned in full before the next one is touched
+        self.assertFalse(
+            self.orders[0]
+            .items.filter(hardware=self.hardware[0], part_returned_health__isnull=True)
+            .exists()
+        )
+        self.assertEqual(
+            self.orders[1]
+            .items.get(hardware=self.hardware[0], part_returned_health__isnull=True)
+            .quantity,
+            1,
+        )
+        self.assertEqual(self._quantity_checked_out(self.hardware[0]), 1)
+
+    def test_return_more_than_checked_out_across_orders(self):
+        serializer = self._get_serializer(
+            [
+                {
+                    "id": self.hardware[0].id,
+                    "quantity": 5,
+                    "part_returned_health": "Broken",
+                }
+            ],
+            orders=[order.id for order in self.orders],
+        )
+        response = serializer.save()
+        self.assertEqual(
+            response["returned_items"],
+            [{"hardware_id": self.hardware[0].id, "quantity": 4}],
+        )
+        self.assertEqual(len(response["errors"]), 1)
+
+    def test_orders_of_different_teams(self):
+        other_order = Order.objects.create(
+            status="Picked Up", team=Team.objects.create(), request={"hardware": []}
+        )
+        serializer = OrderItemReturnSerializer(
+            data={
+                "hardware": [
+                    {
+                        "id": self.hardware[0].id,
+                        "quantity": 1,
+                        "part_returned_health": "Healthy",
+                    }
+                ],
+                "orders": [self.orders[0].id, other_order.id],
+            }
+        )
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("orders", serializer.errors)
+
+    def test_no_order(self):
+        serializer = OrderItemReturnSerializer(
+            data={
+                "hardware": [
+                    {
+                        "id": self.hardware[0].id,
+                        "quantity": 1,
+                        "part_returned_health": "Healthy",
+                    }
+                ]
+            }
+        )
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("order", serializer.errors)
+
+
 class CategorySerializerTestCase(TestCase):
     def setUp(self):
         self.category = Category.objects.create(name="category", max_per_team=4)
@@ -200,6 +1066,8 @@ class CategorySerializerTestCase(TestCase):
             "name": "category",
             "max_per_team": 4,
             "unique_hardware_count": 0,
+            "total_quantity_available": 0,
+            "total_quantity_remaining": 0,
         }
         self.assertEqual(expected_response, data)
 
@@ -221,6 +1089,8 @@ class CategorySerializerTestCase(TestCase):
             "name": "category",
             "max_per_team": 4,
             "unique_hardware_count": 1,
+            "total_quantity_available": 4,
+            "total_quantity_remaining": 4,
         }
         self.assertEqual(expected_response, data)
 
@@ -381,3 +1251,529 @@ class OrderListSerializerTestCase(TestCase):
             },
         }
         self.assertEqual(order_serializer, expected_response)
+
+    def test_items_listed_per_unit(self):
+        order = Order.objects.create(
+            status="Submitted",
+            team=self.team,
+            request={"hardware": [{"id": 1, "quantity": 2}]},
+        )
+        item = OrderItem.objects.create(order=order, hardware=self.hardware, quantity=2)
+        order_serializer = OrderListSerializer(order).data
+        expected_items = [
+            {
+                "id": item.id,
+                "part_returned_health": None,
+                "hardware_id": self.hardware.id,
+            }
+        ] * 2
+        self.assertEqual(order_serializer["items"], expected_items)
+
+
+class SendQueuedEmailsTestCase(TestCase):
+    def setUp(self):
+        self.emails = QueuedEmail.objects.bulk_create(
+            [
+                QueuedEmail(
+                    subject=f"Subject {i}",
+                    message="Message",
+                    html_message="<p>Message</p>",
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    recipient_list=[f"user{i}@example.com"],
+                )
+                for i in range(3)
+            ]
+        )
+
+    def test_send_emails(self):
+        call_command("send_queued_emails", "--once", stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].subject, "Subject 0")
+        self.assertEqual(mail.outbox[0].to, ["user0@example.com"])
+        self.assertEqual(mail.outbox[0].alternatives, [("<p>Message</p>", "text/html")])
+        self.assertFalse(QueuedEmail.objects.filter(sent_at__isnull=True).exists())
+
+        # Sent emails are not sent again
+        call_command("send_queued_emails", "--once", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_send_in_batches(self):
+        out = StringIO()
+        call_command("send_queued_emails", "--once", "--batch-size", "2", stdout=out)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(
+            out.getvalue(), "Sent 2 email(s), 0 failed\nSent 1 email(s), 0 failed\n"
+        )
+
+    def test_failed_email_retried_with_backoff(self):
+        original_send = EmailMultiAlternatives.send
+
+        def send(message, *args, **kwargs):
+            if message.subject == "Subject 1":
+                raise SMTPException("Mailbox unavailable")
+            return original_send(message, *args, **kwargs)
+
+        with patch.object(EmailMultiAlternatives, "send", send), self.assertLogs(
+            "hardware.management.commands.send_queued_emails", level="ERROR"
+        ):
+            call_command(
+                "send_queued_emails", "--once", "--backoff", "60", stdout=StringIO()
+            )
+
+        self.assertEqual(len(mail.outbox), 2)
+        failed_email = QueuedEmail.objects.get(sent_at__isnull=True)
+        self.assertEqual(failed_email.subject, "Subject 1")
+        self.assertEqual(failed_email.attempts, 1)
+        self.assertEqual(failed_email.last_error, "Mailbox unavailable")
+        self.assertGreater(
+            failed_email.next_attempt_at, timezone.now() + timedelta(seconds=50)
+        )
+
+        # Not retried until the backoff has passed
+        call_command("send_queued_emails", "--once", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 2)
+
+        QueuedEmail.objects.filter(pk=failed_email.pk).update(
+            next_attempt_at=timezone.now()
+        )
+        call_command("send_queued_emails", "--once", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(QueuedEmail.objects.filter(sent_at__isnull=True).exists())
+
+    def test_give_up_after_max_attempts(self):
+        QueuedEmail.objects.update(attempts=5)
+        call_command("send_queued_emails", "--once", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class OrderNotificationTestCase(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f"user{i}@example.com",
+                email=f"user{i}@example.com",
+                first_name=first_name,
+            )
+            for i, first_name in enumerate(["Ann", "Bob & Co", "<b>Cy</b>"])
+        ]
+        self.notification = OrderNotification(
+            subject_template="hardware/emails/order_status_change/order_status_change_email_subject.txt",
+            admin_template="hardware/emails/order_status_change/order_status_change_email_admin_body.html",
+            participant_template="hardware/emails/order_status_change/order_status_change_email_body.html",
+            context={
+                "order": {"id": 7, "team_code": "ABCDE", "status": "Picked Up"},
+                "order_status_message": "has been Picked Up!",
+                "order_status_closing_message": "Happy Hacking!",
+            },
+        )
+
+    def test_templates_rendered_once(self):
+        with patch(
+            "hardware.notifications.render_to_string",
+            wraps=notifications.render_to_string,
+        ) as render_to_string:
+            emails = self.notification.build_emails(self.users)
+        self.assertEqual(render_to_string.call_count, 3)
+        self.assertEqual(len(emails), 4)
+
+    def test_recipient_fields_spliced_in(self):
+        admin_email, *participant_emails = self.notification.build_emails(self.users)
+
+        self.assertEqual(admin_email.recipient_list, [settings.HSS_ADMIN_EMAIL])
+        self.assertIn("Hello Hardware Inventory Admins,", admin_email.html_message)
+        self.assertEqual(
+            [email.recipient_list for email in participant_emails],
+            [[user.email] for user in self.users],
+        )
+        for email in participant_emails:
+            self.assertEqual(email.subject, admin_email.subject)
+            self.assertIn("Order #7 has been Picked Up!", email.html_message)
+        self.assertIn("Hello Ann,", participant_emails[0].html_message)
+        self.assertIn("Hello Bob &amp; Co,", participant_emails[1].html_message)
+        self.assertIn("Hello Bob & Co,", participant_emails[1].message)
+        self.assertIn("Hello Cy,", participant_emails[2].html_message)
+
+    def test_transformed_recipient_fields_rendered_per_recipient(self):
+        render_to_string = notifications.render_to_string
+
+        def render_uppercase_name(template_name, context):
+            if template_name != self.notification.participant_template:
+                return render_to_string(template_name, context)
+            return f"<p>Hello {str(context['recipient'].first_name).upper()},</p>"
+
+        with patch(
+            "hardware.notifications.render_to_string",
+            side_effect=render_uppercase_name,
+        ) as mock_render_to_string:
+            _, *participant_emails = self.notification.build_emails(self.users[:2])
+        # The subject, the admin body, the shared participant body, then the body
+        # of each participant
+        self.assertEqual(mock_render_to_string.call_count, 5)
+        self.assertEqual(
+            [email.message for email in participant_emails],
+            ["Hello ANN,", "Hello BOB & CO,"],
+        )
+
+    def test_plaintext_alternative(self):
+        email = self.notification.build_emails(self.users[:1])[1]
+        self.assertNotIn("<", email.message)
+        self.assertTrue(email.message.startswith("Hello Ann,\n\nWe are notifying you"))
+        self.assertIn(f"here ({settings.HSS_URL}#order7)", email.message)
+
+    def test_html_to_text(self):
+        html = (
+            "<p>Hi &amp; welcome,</p>"
+            "<table><thead><tr><th>Item ID</th><th>Quantity</th></tr></thead>"
+            "<tbody><tr><td> 1 </td><td> 2 </td></tr></tbody></table>"
+            "<p>Best,<br>\n    The Team</p>"
+        )
+        self.assertEqual(
+            html_to_text(html),
+            "Hi & welcome,\n\nItem ID | Quantity\n1 | 2\n\nBest,\nThe Team",
+        )
+
+
+class PushChannelsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="foo@bar.com", password="foo")
+
+    def test_user_without_profile(self):
+        self.assertEqual(get_user_channels(self.user), ["stock"])
+
+    def test_participant(self):
+        team = Team.objects.create()
+        Profile.objects.create(user=self.user, team=team)
+        self.assertEqual(get_user_channels(self.user), ["stock", f"team.{team.id}"])
+
+    def test_hardware_admin(self):
+        self.user.user_permissions.add(
+            Permission.objects.get(
+                content_type__app_label="hardware", codename="view_order"
+            )
+        )
+        self.assertEqual(get_user_channels(self.user), ["stock", "orders"])
+
+
+class CatalogVersionTestCase(TestCase):
+    @skipUnless(connection.vendor == "postgresql", "Needs postgres' snapshots")
+    def test_versions_in_progress_are_held_back(self):
+        bumped, done = threading.Event(), threading.Event()
+        versions = []
+
+        def change_catalog():
+            try:
+                with transaction.atomic():
+                    versions.append(CatalogVersion.objects.bump())
+                    bumped.set()
+                    done.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=change_catalog)
+        thread.start()
+        try:
+            bumped.wait(10)
+            # Without waiting for the other transaction's lock
+            self.assertLess(CatalogVersion.objects.current(), versions[0])
+            self.assertGreater(CatalogVersion.objects.bump(), versions[0])
+        finally:
+            done.set()
+            thread.join()
+        self.assertGreaterEqual(CatalogVersion.objects.current(), versions[0])
+
+
+class StockHoldsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.holds = StockHolds()
+
+    def test_hold(self):
+        hold = self.holds.hold(1, {10: 2, 11: 3}, {10: 5, 11: 5})
+        self.assertEqual(hold["hardware"], {10: 2, 11: 3})
+        self.assertGreaterEqual(hold["expires_at"], time.time() + self.holds.timeout)
+        self.assertEqual(self.holds.get(1), hold)
+        self.assertEqual(self.holds.get_held([10, 11, 12]), {10: 2, 11: 3})
+
+    def test_hold_limited_by_other_teams(self):
+        self.holds.hold(1, {10: 4}, {10: 5})
+        hold = self.holds.hold(2, {10: 3, 11: 1}, {10: 5, 11: 0})
+        self.assertEqual(hold["hardware"], {10: 1})
+        self.assertEqual(self.holds.get_held([10, 11]), {10: 5, 11: 0})
+        self.assertEqual(self.holds.get_held([10], exclude_team_id=2), {10: 4})
+
+    def test_hold_replaces_previous_hold(self):
+        self.holds.hold(1, {10: 4}, {10: 5})
+        self.holds.hold(1, {10: 1, 11: 1}, {10: 5, 11: 5})
+        self.assertEqual(self.holds.get(1)["hardware"], {10: 1, 11: 1})
+        self.assertEqual(self.holds.get_held([10, 11]), {10: 1, 11: 1})
+
+    def test_release(self):
+        self.holds.hold(1, {10: 4}, {10: 5})
+        self.assertEqual(self.holds.release(1), {10: 4})
+        self.assertEqual(self.holds.get(1), {"hardware": {}, "expires_at": None})
+        self.assertEqual(self.holds.get_held([10]), {10: 0})
+
+    def test_locked_hold(self):
+        self.holds.hold(1, {10: 2}, {10: 5})
+        lock_key = f"{self.holds._team_key(1)}:lock"
+        cache.add(lock_key, "other request")
+
+        with patch.object(self.holds, "lock_timeout", 0):
+            with self.assertRaises(HoldLocked):
+                self.holds.hold(1, {10: 4}, {10: 5})
+            with self.assertRaises(HoldLocked):
+                self.holds.release(1)
+        # Nothing changed, and the other request still has its lock
+        self.assertEqual(self.holds.get(1)["hardware"], {10: 2})
+        self.assertEqual(self.holds.get_held([10]), {10: 2})
+        self.assertEqual(cache.get(lock_key), "other request")
+
+    def test_expired_lock_taken_by_another_request_is_kept(self):
+        lock_key = f"{self.holds._team_key(1)}:lock"
+        with self.holds._lock(self.holds._team_key(1)):
+            cache.set(lock_key, "other request")
+        self.assertEqual(cache.get(lock_key), "other request")
+
+    def test_get_held_only_fetches_held_hardware(self):
+        self.holds.hold(1, {10: 2}, {10: 5})
+        with patch("hardware.holds.cache.get_many", wraps=cache.get_many) as get_many:
+            self.assertEqual(self.holds.get_held(range(1000)), {10: 2})
+        self.assertEqual(get_many.call_count, 2)
+        self.assertTrue(
+            all(":held:10:" in key for key in get_many.call_args_list[1][0][0])
+        )
+
+    def test_apply_leaves_in_own_hold(self):
+        self.holds.hold(1, {10: 2}, {10: 5})
+        self.holds.hold(2, {10: 1}, {10: 5})
+        hardware = [{"id": 10, "quantity_remaining": 5}]
+        self.assertEqual(self.holds.apply(hardware)[0]["quantity_remaining"], 2)
+        self.assertEqual(
+            self.holds.apply(hardware, team_id=1)[0]["quantity_remaining"], 4
+        )
+
+    def test_expiry(self):
+        now = time.time()
+        with patch("hardware.holds.time.time", return_value=now):
+            self.holds.hold(1, {10: 4}, {10: 5})
+        later = now + self.holds.timeout + 2 * self.holds.bucket_seconds
+        with patch("hardware.holds.time.time", return_value=later):
+            self.assertEqual(self.holds.get(1)["hardware"], {})
+            self.assertEqual(self.holds.get_held([10]), {})
+            # Other teams can hold the stock again
+            self.assertEqual(self.holds.hold(2, {10: 5}, {10: 5})["hardware"], {10: 5})
+
+    def test_apply(self):
+        self.holds.hold(1, {10: 2}, {10: 5})
+        hardware = [
+            {"id": 10, "quantity_remaining": 5},
+            {"id": 11, "quantity_remaining": 5},
+        ]
+        self.assertEqual(
+            self.holds.apply(hardware),
+            [{"id": 10, "quantity_remaining": 3}, {"id": 11, "quantity_remaining": 5}],
+        )
+        # The hardware passed in are left alone
+        self.assertEqual(hardware[0]["quantity_remaining"], 5)
+
+
+class CatalogCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.catalog_cache = CatalogCache()
+        self.compute = Mock(return_value={"results": []})
+
+    def test_computes_once(self):
+        for _ in range(3):
+            self.assertEqual(
+                self.catalog_cache.get_or_compute("key", self.compute), {"results": []}
+            )
+        self.compute.assert_called_once()
+
+    def test_local_hits_skip_shared_cache(self):
+        self.catalog_cache.get_or_compute("key", self.compute)
+        with patch("hardware.cache.cache") as mock_cache:
+            self.catalog_cache.get_or_compute("key", self.compute)
+        mock_cache.get.assert_not_called()
+
+    def test_shared_between_workers(self):
+        self.catalog_cache.get_or_compute("key", self.compute)
+        CatalogCache().get_or_compute("key", self.compute)
+        self.compute.assert_called_once()
+
+    def test_invalidate(self):
+        self.catalog_cache.get_or_compute("key", self.compute)
+        self.catalog_cache.invalidate()
+        self.catalog_cache.get_or_compute("key", self.compute)
+        self.assertEqual(self.compute.call_count, 2)
+
+    def test_catalog_change_invalidates(self):
+        other_worker = CatalogCache()
+        other_worker.get_or_compute("key", self.compute)
+        with self.captureOnCommitCallbacks(execute=True):
+            Hardware.objects.create(name="name", quantity_available=1)
+        # Once the other worker next checks the generation
+        other_worker._generation_checked_at = 0
+        other_worker.get_or_compute("key", self.compute)
+        self.assertEqual(self.compute.call_count, 2)
+
+    def test_stock_change_does_not_invalidate(self):
+        hardware = Hardware.objects.create(name="name", quantity_available=1)
+        self.catalog_cache.get_or_compute("key", self.compute)
+        with self.captureOnCommitCallbacks(execute=True):
+            Hardware.objects.adjust_checked_out({hardware.id: 1})
+        self.catalog_cache._generation_checked_at = 0
+        self.catalog_cache.get_or_compute("key", self.compute)
+        self.compute.assert_called_once()
+
+    def test_stock_computed_for_missing_ids(self):
+        compute = Mock(side_effect=lambda ids: {id: id * 10 for id in ids})
+        self.assertEqual(
+            self.catalog_cache.get_stock("key", [1, 2], compute), {1: 10, 2: 20}
+        )
+        self.assertEqual(
+            CatalogCache().get_stock("key", [2, 3], compute), {2: 20, 3: 30}
+        )
+        self.assertEqual(compute.call_args_list, [call([1, 2]), call([3])])
+
+    def test_stock_change_invalidates_stock(self):
+        hardware = Hardware.objects.create(name="name", quantity_available=1)
+        compute = Mock(return_value={hardware.id: 1})
+        self.catalog_cache.get_stock("key", [hardware.id], compute)
+        with self.captureOnCommitCallbacks(execute=True):
+            Hardware.objects.adjust_checked_out({hardware.id: 1})
+        self.catalog_cache.get_stock("key", [hardware.id], compute)
+        self.assertEqual(compute.call_count, 2)
+
+    def test_computes_without_waiting_for_other_workers(self):
+        generation = self.catalog_cache.get_generation()
+        key = f"{CatalogCache.key_prefix}:{generation}:key"
+        cache.add(f"{key}:lock", True)
+
+        self.assertEqual(
+            self.catalog_cache.get_or_compute("key", self.compute), {"results": []}
+        )
+        # Left for the worker holding the lock to cache
+        self.assertIsNone(cache.get(key))
+
+    def test_one_recompute_per_worker_under_concurrency(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"results": []}
+
+        workers = [CatalogCache() for _ in range(2)]
+        threads = [
+            threading.Thread(target=worker.get_or_compute, args=("key", compute))
+            for worker in workers
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # At most once per worker, the other one reads the database rather than
+        # waiting on the first
+        self.assertLessEqual(len(calls), len(workers))
+
+
+class HardwareStockAdminTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            username="admin@bar.com", email="admin@bar.com", password="foobar123"
+        )
+        self.client.force_login(self.user)
+        self.order = Order.objects.create(
+            status="Submitted", team=Team.objects.create(), request={}
+        )
+        self.category = Category.objects.create(name="category", max_per_team=4)
+
+    def _add_items(self, count):
+        for _ in range(count):
+            hardware = Hardware.objects.create(name="name", quantity_available=5)
+            hardware.categories.add(self.category)
+            OrderItem.objects.create(order=self.order, hardware=hardware, quantity=2)
+
+    def _get_page(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def _assert_constant_queries(self, url):
+        self._add_items(1)
+        # Warm up the caches (e.g. content types) which the first request fills
+        self.client.get(url)
+        response, queries_for_one = self._get_page(url)
+        self.assertContains(
+            response, '<td class="field-quantity_remaining"><p>3</p></td>', html=True
+        )
+
+        self._add_items(4)
+        response, queries_for_five = self._get_page(url)
+        self.assertContains(
+            response,
+            '<td class="field-quantity_remaining"><p>3</p></td>',
+            count=5,
+            html=True,
+        )
+        self.assertEqual(queries_for_one, queries_for_five)
+
+    def test_order_change_page(self):
+        self._assert_constant_queries(
+            reverse("admin:hardware_order_change", args=[self.order.id])
+        )
+
+    def test_category_change_page(self):
+        self._assert_constant_queries(
+            reverse("admin:hardware_category_change", args=[self.category.id])
+        )
+
+
+class OrderStatusAdminActionTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            username="admin@bar.com", email="admin@bar.com", password="foobar123"
+        )
+        self.client.force_login(self.user)
+        team = Team.objects.create()
+        self.orders = [
+            Order.objects.create(status="Submitted", team=team, request={})
+            for _ in range(3)
+        ]
+
+    def _run_action(self, action, orders):
+        return self.client.post(
+            reverse("admin:hardware_order_changelist"),
+            {"action": action, "_selected_action": [order.id for order in orders],},
+            follow=True,
+        )
+
+    def test_mark_ready_for_pickup(self):
+        response = self._run_action("mark_ready_for_pickup", self.orders)
+        self.assertContains(
+            response, "Changed the status of 3 order(s) to Ready for Pickup."
+        )
+        self.assertEqual(
+            set(Order.objects.values_list("status", flat=True)), {"Ready for Pickup"}
+        )
+        # One notification for the team, which has no members besides the admins
+        self.assertEqual(QueuedEmail.objects.count(), 1)
+
+    def test_invalid_change(self):
+        self.orders[0].status = "Picked Up"
+        self.orders[0].save()
+        response = self._run_action("mark_ready_for_pickup", self.orders)
+        self.assertContains(
+            response,
+            f"Order {self.orders[0].id}: Cannot change the status of an order from "
+            "Picked Up to Ready for Pickup.",
+        )
+        self.assertContains(response, "No orders were changed.")
+        self.assertEqual(
+            list(Order.objects.order_by("id").values_list("status", flat=True)),
+            ["Picked Up", "Submitted", "Submitted"],
+        )
@@ -1,13 +1,10 @@
 import logging
 
 from django.conf import settings
-from django.core import mail
-from django.core.mail import send_mail
 from django_filters import rest_framework as filters
 from django.db import transaction
 from django.http import HttpResponseServerError
 from drf_yasg.utils import swagger_auto_schema
-from django.template.loader import render_to_string
 
 from rest_framework import generics, mixins, status, permissions
 from rest_framework.response import Response
@@ -15,15 +12,39 @@ from rest_framework.filters import SearchFilter, OrderingFilter
 
 from event.models import Profile
 from event.permissions import UserHasProfile, FullDjangoModelPermissions, UserIsAdmin
+from hackathon_site.streaming import StreamingListModelMixin
 from hardware.api_filters import (
     HardwareFilter,
+    HardwareSearchFilter,
     OrderFilter,
     IncidentFilter,
     OrderItemFilter,
 )
-from hardware.models import Hardware, Category, Order, Incident, OrderItem
+from hardware.cache import CatalogCacheMixin
+from hardware.holds import HoldLocked, stock_holds
+from hardware.models import (
+    CatalogTombstone,
+    CatalogVersion,
+    Hardware,
+    Category,
+    Order,
+    Incident,
+    OrderItem,
+    QueuedEmail,
+)
 
+from hardware.notifications import OrderNotification
+from hardware.pagination import OptionalCursorPagination, OrderItemUnitPagination
+from hardware.push import (
+    publish_order_status,
+    publish_order_status_change,
+    publish_stock,
+)
 from hardware.serializers import (
+    CatalogChangesQuerySerializer,
+    CatalogChangesSerializer,
+    CartHoldSerializer,
+    CartHoldResponseSerializer,
     CategorySerializer,
     HardwareSerializer,
     IncidentSerializer,
@@ -33,6 +54,7 @@ from hardware.serializers import (
     OrderCreateSerializer,
     OrderCreateResponseSerializer,
     OrderChangeSerializer,
+    OrderStatusBulkChangeSerializer,
     OrderItemListSerializer,
     OrderItemReturnSerializer,
     OrderItemReturnResponseSerializer,
@@ -55,17 +77,47 @@ ORDER_STATUS_CLOSING_MSG = {
 }
 
 
-class HardwareListView(mixins.ListModelMixin, generics.GenericAPIView):
+def _get_team_id(user):
+    profile = getattr(user, "profile", None)
+    return profile.team_id if profile is not None else None
+
+
+class HardwareListView(
+    CatalogCacheMixin, StreamingListModelMixin, generics.GenericAPIView
+):
     queryset = Hardware.objects.all()
     serializer_class = HardwareSerializer
 
-    filter_backends = (filters.DjangoFilterBackend, SearchFilter, OrderingFilter)
+    filter_backends = (
+        filters.DjangoFilterBackend,
+        HardwareSearchFilter,
+        OrderingFilter,
+    )
     filterset_class = HardwareFilter
-    search_fields = ("name",)
     ordering_fields = ("name", "quantity_remaining")
+    live_fields = ("quantity_remaining",)
+
+    def is_cacheable(self, request):
+        ordering = request.query_params.get(OrderingFilter.ordering_param, "")
+        return (
+            super().is_cacheable(request)
+            and "in_stock" not in request.query_params
+            and "quantity_remaining" not in ordering
+        )
 
     def get(self, request, *args, **kwargs):
-        return self.list(request, *args, **kwargs)
+        response = self.list(request, *args, **kwargs)
+        # Holds change far more often than the catalog, so they are subtracted
+        # from the cached page rather than invalidating it, except for the
+        # requesting team's own. Streamed exports show the stock in the database.
+        if not response.streaming:
+            response.data = {
+                **response.data,
+                "results": stock_holds.apply(
+                    response.data["results"], _get_team_id(request.user)
+                ),
+            }
+        return response
 
 
 class HardwareDetailView(mixins.RetrieveModelMixin, generics.GenericAPIView):
@@ -73,7 +125,50 @@ class HardwareDetailView(mixins.RetrieveModelMixin, generics.GenericAPIView):
     serializer_class = HardwareSerializer
 
     def get(self, request, *args, **kwargs):
-        return self.retrieve(request, *args, **kwargs)
+        response = self.retrieve(request, *args, **kwargs)
+        (response.data,) = stock_holds.apply(
+            [response.data], _get_team_id(request.user)
+        )
+        return response
+
+
+class HardwareChangesView(generics.GenericAPIView):
+    """
+    Everything in the hardware catalog which changed after the given version:
+    hardware (including changes to their stock) and categories as they are now,
+    and the ids of the ones deleted since. Clients start with ?since=0 for the
+    whole catalog, then pass back the version from each response to poll for
+    what changed after it.
+    """
+
+    queryset = Hardware.objects.all().prefetch_related("categories")
+    serializer_class = CatalogChangesSerializer
+
+    @swagger_auto_schema(query_serializer=CatalogChangesQuerySerializer)
+    def get(self, request, *args, **kwargs):
+        query_serializer = CatalogChangesQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        since = query_serializer.validated_data["since"]
+
+        # Read first, so that changes committed while the rows are fetched are
+        # left for the next poll rather than skipped
+        version = CatalogVersion.objects.current()
+        changed = {"version__gt": since, "version__lte": version}
+        tombstones = CatalogTombstone.objects.filter(**changed).order_by("version")
+        serializer = self.get_serializer(
+            {
+                "version": version,
+                "hardware": self.get_queryset().filter(**changed).order_by("id"),
+                "deleted_hardware": tombstones.filter(kind="hardware").values_list(
+                    "object_id", flat=True
+                ),
+                "categories": Category.objects.filter(**changed).order_by("id"),
+                "deleted_categories": tombstones.filter(kind="category").values_list(
+                    "object_id", flat=True
+                ),
+            }
+        )
+        return Response(serializer.data)
 
 
 class IncidentListView(
@@ -88,6 +183,7 @@ class IncidentListView(
 
     filter_backends = (filters.DjangoFilterBackend, SearchFilter)
     filterset_class = IncidentFilter
+    pagination_class = OptionalCursorPagination
     permission_classes = [FullDjangoModelPermissions]
     queryset = Incident.objects.all().select_related("order_item__order__team")
 
@@ -100,6 +196,7 @@ class IncidentListView(
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
+    @transaction.atomic
     def post(self, request, *args, **kwargs):
         return self.create(request, *args, **kwargs)
 
@@ -138,23 +235,37 @@ class OrderItemListView(mixins.ListModelMixin, generics.GenericAPIView):
     search_fields = ("order__team__team_code", "order__id")
     filter_backends = (filters.DjangoFilterBackend, SearchFilter)
     filterset_class = OrderItemFilter
+    pagination_class = OrderItemUnitPagination
+    # Order items have no timestamps of their own
+    cursor_ordering = ("order__created_at", "id")
     permission_classes = [FullDjangoModelPermissions]
     queryset = OrderItem.objects.all().select_related("order__team")
     serializer_class = OrderItemListSerializer
 
+    def get_serializer_context(self):
+        # Cursor pages hold a fixed number of items, so they aren't expanded
+        # into a varying number of units
+        return {
+            **super().get_serializer_context(),
+            "expand_units": not getattr(self.paginator, "use_cursor", False),
+        }
+
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
 
-class CategoryListView(mixins.ListModelMixin, generics.GenericAPIView):
-    queryset = Category.objects.all().prefetch_related("hardware_set")
+class CategoryListView(
+    CatalogCacheMixin, mixins.ListModelMixin, generics.GenericAPIView
+):
+    queryset = Category.objects.with_stock_summary().order_by("id")
     serializer_class = CategorySerializer
+    live_fields = ("total_quantity_remaining",)
 
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
 
-class OrderListView(generics.ListAPIView):
+class OrderListView(StreamingListModelMixin, generics.ListAPIView):
     queryset = Order.objects.all().select_related("team").prefetch_related("items",)
     serializer_method_classes = {
         "GET": OrderListSerializer,
@@ -164,6 +275,7 @@ class OrderListView(generics.ListAPIView):
     filter_backends = (filters.DjangoFilterBackend, OrderingFilter, SearchFilter)
     filterset_class = OrderFilter
     ordering_fields = ("created_at",)
+    pagination_class = OptionalCursorPagination
     search_fields = ("team__team_code", "id")
 
     create_order_email_subject_template = (
@@ -204,59 +316,64 @@ class OrderListView(generics.ListAPIView):
             return HttpResponseServerError()
         response_data = response_serializer.data
 
-        profiles = Profile.objects.filter(team__exact=request.user.profile.team)
-        connection = mail.get_connection(fail_silently=False)
-        connection.open()
+        profiles = Profile.objects.filter(
+            team__exact=request.user.profile.team
+        ).select_related("user")
+        notification = OrderNotification(
+            subject_template=self.create_order_email_subject_template,
+            admin_template=self.create_order_email_body_template_admin,
+            participant_template=self.create_order_email_body_template_participant,
+            context={"requester": request.user, "order": response_data},
+        )
+        QueuedEmail.objects.bulk_create(
+            notification.build_emails(profile.user for profile in profiles)
+        )
+        if response_data["order_id"] is not None:
+            publish_order_status(
+                response_data["order_id"], "Submitted", request.user.profile.team_id
+            )
+        publish_stock(item["hardware_id"] for item in response_data["hardware"])
+        return Response(response_data, status=status.HTTP_201_CREATED)
+
+
+class CartHoldView(generics.GenericAPIView):
+    """
+    Hold the hardware in the team's cart for a few minutes (see hardware.holds),
+    so it isn't taken by other teams before the order is submitted. Posting the
+    cart replaces the team's hold, and renews it.
+    """
+
+    serializer_class = CartHoldSerializer
+    permission_classes = [UserHasProfile]
+
+    @swagger_auto_schema(responses={200: CartHoldResponseSerializer})
+    def get(self, request, *args, **kwargs):
+        hold = stock_holds.get(request.user.profile.team_id)
+        return Response(CartHoldResponseSerializer(hold).data)
+
+    locked_message = "The cart is being changed by another request, try again."
+
+    @swagger_auto_schema(responses={200: CartHoldResponseSerializer})
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            hold = serializer.save()
+        except HoldLocked:
+            return Response(
+                {"detail": self.locked_message}, status=status.HTTP_409_CONFLICT
+            )
+        return Response(CartHoldResponseSerializer(hold).data)
 
+    def delete(self, request, *args, **kwargs):
         try:
-            render_to_string_context = {
-                "requester": request.user,
-                "recipient": "Hardware Inventory Admins",
-                "order": response_data,
-            }
-            send_mail(
-                subject=render_to_string(
-                    self.create_order_email_subject_template, render_to_string_context
-                ),
-                message=render_to_string(
-                    self.create_order_email_body_template_admin,
-                    render_to_string_context,
-                ),
-                html_message=render_to_string(
-                    self.create_order_email_body_template_admin,
-                    render_to_string_context,
-                ),
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                connection=connection,
-                recipient_list=[settings.HSS_ADMIN_EMAIL],
+            released = stock_holds.release(request.user.profile.team_id)
+        except HoldLocked:
+            return Response(
+                {"detail": self.locked_message}, status=status.HTTP_409_CONFLICT
             )
-            for profile in profiles:
-                render_to_string_context = {
-                    **render_to_string_context,
-                    "recipient": profile.user,
-                }
-                profile.user.email_user(
-                    subject=render_to_string(
-                        self.create_order_email_subject_template,
-                        render_to_string_context,
-                    ),
-                    message=render_to_string(
-                        self.create_order_email_body_template_participant,
-                        render_to_string_context,
-                    ),
-                    html_message=render_to_string(
-                        self.create_order_email_body_template_participant,
-                        render_to_string_context,
-                    ),
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    connection=connection,
-                )
-        except Exception as e:
-            logger.error(e)
-            raise e
-        finally:
-            connection.close()
-        return Response(response_data, status=status.HTTP_201_CREATED)
+        publish_stock(released)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class OrderDetailView(generics.GenericAPIView, mixins.UpdateModelMixin):
@@ -274,69 +391,106 @@ class OrderDetailView(generics.GenericAPIView, mixins.UpdateModelMixin):
         "hardware/emails/order_status_change/order_status_change_email_admin_body.html"
     )
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        if "status" in serializer.validated_data:
+            publish_order_status_change(serializer.instance)
+
+    @transaction.atomic
     def patch(self, request, *args, **kwargs):
         response = self.partial_update(request, *args, **kwargs)
 
         if "status" in request.data:
-            profiles = Profile.objects.filter(team__exact=response.data["team_id"])
-            connection = mail.get_connection(fail_silently=False)
-            connection.open()
-
-            try:
-                render_to_string_context = {
-                    "recipient": "Hardware Inventory Admins",
+            profiles = Profile.objects.filter(
+                team__exact=response.data["team_id"]
+            ).select_related("user")
+            notification = OrderNotification(
+                subject_template=self.update_order_email_subject_template,
+                admin_template=self.update_order_email_template_admin,
+                participant_template=self.update_order_email_template_participant,
+                context={
                     "order": response.data,
                     "order_status_message": ORDER_STATUS_MSG[response.data["status"]],
-                }
-                send_mail(
-                    subject=render_to_string(
-                        self.update_order_email_subject_template,
-                        render_to_string_context,
-                    ),
-                    message=render_to_string(
-                        self.update_order_email_template_admin,
-                        render_to_string_context,
-                    ),
-                    html_message=render_to_string(
-                        self.update_order_email_template_admin,
-                        render_to_string_context,
-                    ),
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    connection=connection,
-                    recipient_list=[settings.HSS_ADMIN_EMAIL],
-                )
-                for profile in profiles:
-                    render_to_string_context = {
-                        **render_to_string_context,
-                        "recipient": profile.user,
-                        "order_status_closing_message": ORDER_STATUS_CLOSING_MSG[
-                            response.data["status"]
-                        ],
-                    }
-                    profile.user.email_user(
-                        subject=render_to_string(
-                            self.update_order_email_subject_template,
-                            render_to_string_context,
-                        ),
-                        message=render_to_string(
-                            self.update_order_email_template_participant,
-                            render_to_string_context,
-                        ),
-                        html_message=render_to_string(
-                            self.update_order_email_template_participant,
-                            render_to_string_context,
-                        ),
-                        from_email=settings.DEFAULT_FROM_EMAIL,
-                        connection=connection,
-                    )
-            except Exception as e:
-                logger.error(e)
-                raise e
-            finally:
-                connection.close()
+                    "order_status_closing_message": ORDER_STATUS_CLOSING_MSG[
+                        response.data["status"]
+                    ],
+                },
+            )
+            QueuedEmail.objects.bulk_create(
+                notification.build_emails(profile.user for profile in profiles)
+            )
         return response
 
 
+class OrderStatusBulkChangeView(generics.GenericAPIView):
+    queryset = Order.objects.all()
+    serializer_class = OrderStatusBulkChangeSerializer
+    permission_classes = [FullDjangoModelPermissions]
+
+    update_orders_email_subject_template = (
+        "hardware/emails/order_status_change/orders_status_change_email_subject.txt"
+    )
+    update_orders_email_template_participant = (
+        "hardware/emails/order_status_change/orders_status_change_email_body.html"
+    )
+    update_orders_email_template_admin = (
+        "hardware/emails/order_status_change/orders_status_change_email_admin_body.html"
+    )
+
+    @classmethod
+    def queue_notifications(cls, orders):
+        """
+        Queue one notification per team for the orders whose status changed,
+        rather than one per order
+        """
+        orders_by_team = {}
+        for order in orders:
+            orders_by_team.setdefault(order.team_id, []).append(order)
+
+        users_by_team = {}
+        for profile in Profile.objects.filter(
+            team_id__in=[team_id for team_id in orders_by_team if team_id is not None]
+        ).select_related("user"):
+            users_by_team.setdefault(profile.team_id, []).append(profile.user)
+
+        emails = []
+        for team_id, team_orders in orders_by_team.items():
+            team_statuses = {order.status for order in team_orders}
+            closing_messages = [
+                ORDER_STATUS_CLOSING_MSG[status]
+                for status, _ in Order.STATUS_CHOICES
+                if status in team_statuses
+            ]
+            notification = OrderNotification(
+                subject_template=cls.update_orders_email_subject_template,
+                admin_template=cls.update_orders_email_template_admin,
+                participant_template=cls.update_orders_email_template_participant,
+                context={
+                    "team_code": team_orders[0].team.team_code if team_id else None,
+                    "orders": [
+                        {
+                            "id": order.id,
+                            "status": order.status,
+                            "order_status_message": ORDER_STATUS_MSG[order.status],
+                        }
+                        for order in team_orders
+                    ],
+                    "order_status_closing_messages": closing_messages,
+                },
+            )
+            emails += notification.build_emails(users_by_team.get(team_id, []))
+        QueuedEmail.objects.bulk_create(emails)
+
+    @transaction.atomic
+    @swagger_auto_schema(responses={200: OrderListSerializer(many=True)})
+    def patch(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        orders = serializer.save()
+        self.queue_notifications(orders)
+        return Response(OrderListSerializer(orders, many=True).data)
+
+
 class OrderItemReturnView(generics.GenericAPIView):
     queryset = Order.objects.all().prefetch_related("items",)
     serializer_class = OrderItemReturnSerializer
@@ -366,57 +520,17 @@ class OrderItemReturnView(generics.GenericAPIView):
         if len(create_response["returned_items"]) > 0:
             profiles = Profile.objects.filter(
                 team__team_code=create_response["team_code"]
+            ).select_related("user")
+            notification = OrderNotification(
+                subject_template=self.return_order_email_subject_template,
+                admin_template=self.return_order_email_body_template_admin,
+                participant_template=self.return_order_email_body_template_participant,
+                context={"requester": request.user, "order": create_response},
+            )
+            QueuedEmail.objects.bulk_create(
+                notification.build_emails(profile.user for profile in profiles)
+            )
+            publish_stock(
+                item["hardware_id"] for item in create_response["returned_items"]
             )
-            connection = mail.get_connection(fail_silently=False)
-            connection.open()
-
-            try:
-                render_to_string_context = {
-                    "requester": request.user,
-                    "recipient": "Hardware Inventory Admins",
-                    "order": create_response,
-                }
-                send_mail(
-                    subject=render_to_string(
-                        self.return_order_email_subject_template,
-                        render_to_string_context,
-                    ),
-                    message=render_to_string(
-                        self.return_order_email_body_template_admin,
-                        render_to_string_context,
-                    ),
-                    html_message=render_to_string(
-                        self.return_order_email_body_template_admin,
-                        render_to_string_context,
-                    ),
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    connection=connection,
-                    recipient_list=[settings.HSS_ADMIN_EMAIL],
-                )
-                for profile in profiles:
-                    render_to_string_context = {
-                        **render_to_string_context,
-                        "recipient": profile.user,
-                    }
-                    profile.user.email_user(
-                        subject=render_to_string(
-                            self.return_order_email_subject_template,
-                            render_to_string_context,
-                        ),
-                        message=render_to_string(
-                            self.return_order_email_body_template_participant,
-                            render_to_string_context,
-                        ),
-                        html_message=render_to_string(
-                            self.return_order_email_body_template_participant,
-                            render_to_string_context,
-                        ),
-                        from_email=settings.DEFAULT_FROM_EMAIL,
-                        connection=connection,
-                    )
-            except Exception as e:
-                logger.error(e)
-                raise e
-            finally:
-                connection.close()
         return Response(create_response, status=status.HTTP_201_CREATED)
@@ -8,10 +8,10 @@ from django.utils.translation import gettext_lazy as _
 from django_registration import validators
 from django.conf import settings
 
+from event.eligibility import get_attendee, get_sign_in_error
 from hackathon_site.utils import is_registration_open, is_hackathon_happening
 from registration.models import Application, Team, User
 from registration.widgets import MaterialFileInput
-from review.models import Review
 
 
 class SignUpForm(UserCreationForm):
@@ -282,32 +282,9 @@ class SignInForm(forms.Form):
 
     def clean_email(self):
         email = self.cleaned_data["email"]
-
-        try:
-            user = User.objects.get(email__exact=email)
-            application = Application.objects.get(user__exact=user)
-            try:
-                review = Review.objects.get(application__exact=application)
-            except Review.DoesNotExist:
-                raise forms.ValidationError(_(f"User {email} was not reviewed."))
-            if review.status == "Accepted":
-                if settings.RSVP and application.rsvp is None:
-                    raise forms.ValidationError(
-                        _(f"User {email} has not RSVP'd to the hackathon")
-                    )
-            else:
-                raise forms.ValidationError(
-                    _(
-                        f"User {email} has not been Accepted to attend {settings.HACKATHON_NAME}"
-                    )
-                )
-        except User.DoesNotExist:
-            raise forms.ValidationError(_(f"User {email} does not exist."))
-        except Application.DoesNotExist:
-            raise forms.ValidationError(
-                _(f"User {email} has not applied to {settings.HACKATHON_NAME}")
-            )
-        except Exception as e:
-            raise e
-
+        # From the attendee index where possible, see event.eligibility
+        self.attendee = get_attendee(email)
+        error = get_sign_in_error(self.attendee, email)
+        if error is not None:
+            raise forms.ValidationError(error)
         return email